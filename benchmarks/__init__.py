@@ -0,0 +1,5 @@
+"""
+Benchmarks of django-connections on synthetic power-law graphs.
+
+Run ``python -m benchmarks --help`` from the root of the repository.
+"""
@@ -0,0 +1,58 @@
+"""
+Synthetic graphs for benchmarks.
+
+Follow graphs are far from uniform: a few accounts are followed by, and
+follow, many more than most. ``powerlaw_graph()`` reproduces that with
+out-degrees and in-degrees that follow a power law of configurable skew, in
+constant memory per node, so graphs with tens of millions of edges can be
+streamed straight into the database.
+"""
+
+import random
+from bisect import bisect_right
+
+
+def powerlaw_graph(nodes, edges, skew=1.0, seed=0):
+    """
+    Yields about ``edges`` distinct ``(from_index, to_index)`` pairs of node
+    indices from ``0`` to ``nodes - 1``, without self-loops, grouped by
+    source node.
+    
+    The node ranked ``k`` by popularity gets a share of the out-degrees, and
+    independently of the in-degrees, proportional to ``1 / (k + 1) ** skew``.
+    ``skew=0`` gives a uniform random graph, and larger values give bigger
+    hubs. Fewer edges are generated when hubs would need more edges than
+    there are nodes to connect to. The same arguments always yield the same
+    edges.
+    """
+    rng = random.Random(seed)
+    out_ranks = list(range(nodes))
+    in_ranks = list(range(nodes))
+    rng.shuffle(out_ranks)
+    rng.shuffle(in_ranks)
+    
+    weights = [1.0 / (k + 1) ** skew for k in range(nodes)]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    
+    for k, source in enumerate(out_ranks):
+        expected = edges * weights[k] / total
+        degree = int(expected)
+        if rng.random() < expected - degree:
+            degree += 1
+        degree = min(degree, nodes - 1)
+        
+        targets = set()
+        # hubs may run out of new targets; give up rather than spin
+        attempts = degree * 4
+        while len(targets) < degree and attempts:
+            attempts -= 1
+            rank = min(bisect_right(cumulative, rng.random() * total), nodes - 1)
+            target = in_ranks[rank]
+            if target != source:
+                targets.add(target)
+        for target in sorted(targets):
+            yield source, target
@@ -0,0 +1,8 @@
+from django.db import models
+
+
+class Node(models.Model):
+    """
+    An object in a benchmark graph. Nodes have no fields of their own, so
+    that millions of them are cheap to create.
+    """
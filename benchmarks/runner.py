@@ -0,0 +1,179 @@
+"""
+Command line entry point of the benchmarks.
+
+The graph is built once per ``--nodes``, ``--edges``, ``--skew`` and
+``--seed``, and kept in the benchmark database, so later runs on the same
+graph only time operations. Results are written as JSON, which later runs
+can be compared against with ``--compare``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from array import array
+from datetime import datetime
+
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    # Python 2.6
+    OrderedDict = dict
+
+
+# Number of connections sampled for operations on pairs of connected objects.
+EDGE_SAMPLES = 1000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmarks django-connections on a power-law graph.')
+    parser.add_argument('--nodes', type=int, default=10000,
+                        help='number of objects in the graph (default: %(default)s)')
+    parser.add_argument('--edges', type=int, default=100000,
+                        help='approximate number of connections (default: %(default)s)')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='exponent of the power law of degrees, 0 for a '
+                             'uniform graph (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the graph and of samples (default: %(default)s)')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='number of timed calls per operation (default: %(default)s)')
+    parser.add_argument('--counters', action='store_true',
+                        help='keep degree counters for the relationship')
+    parser.add_argument('--cache', action='store_true',
+                        help='cache adjacency lists of the relationship')
+    parser.add_argument('--database', choices=('sqlite', 'postgresql'),
+                        default=os.environ.get('BENCHMARK_DATABASE', 'sqlite'),
+                        help='database to run against (default: %(default)s)')
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        help='only time the named operation; may be repeated')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write results as JSON to the given file')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare results with those in the given file, and '
+                             'exit with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='ratio of p50 or p99 times regarded as a regression '
+                             '(default: %(default)s)')
+    parser.add_argument('--reset', action='store_true',
+                        help='delete the graph and build it again')
+    return parser.parse_args(argv)
+
+
+def setup(database):
+    os.environ['BENCHMARK_DATABASE'] = database
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    from django.core.management import call_command
+    django.setup()
+    options = {'verbosity': 0}
+    if django.VERSION >= (1, 9):
+        # the benchmarks app has no migrations
+        options['run_syncdb'] = True
+    call_command('migrate', **options)
+
+
+def load_graph(options, progress=None):
+    """
+    Returns the relationship of the graph described by ``options``, the
+    primary keys of its objects and a sample of its connections as
+    ``(from_pk, to_pk)`` pairs, building the graph first if needed.
+    """
+    from connections.arrays import INT64
+    from connections.shortcuts import define_relationship
+    from connections.transfer import Row, import_connections
+    from connections.utils import chunked, iterate
+    
+    from .generator import powerlaw_graph
+    from .models import Node
+    
+    name = 'bench:%d:%d:%g:%d' % (options.nodes, options.edges, options.skew, options.seed)
+    relationship = define_relationship(name, Node, Node, counters=options.counters,
+                                       cache='default' if options.cache else None)
+    if options.reset:
+        relationship.connections.delete()
+    
+    missing = options.nodes - Node.objects.count()
+    for chunk in chunked(range(max(missing, 0)), 2000):
+        Node.objects.bulk_create([Node() for i in chunk])
+    pks = array(INT64, iterate(Node.objects.order_by('pk')
+                               .values_list('pk', flat=True)[:options.nodes], 2000))
+    
+    if not relationship.connections.exists():
+        if progress is not None:
+            progress('generating %d connections' % options.edges)
+        rows = (Row(None, name, pks[i], pks[j], None, None)
+                for i, j in powerlaw_graph(options.nodes, options.edges,
+                                           options.skew, options.seed))
+        import_connections(rows)
+    elif options.counters:
+        relationship.rebuild_counters()
+    
+    rng = random.Random(options.seed)
+    sources = [rng.choice(pks) for i in range(EDGE_SAMPLES)]
+    edges = []
+    for chunk in chunked(sources, 400):
+        edges.extend(relationship.connections.filter(from_pk__in=chunk)
+                     .order_by('?').values_list('from_pk', 'to_pk')[:len(chunk)])
+    return relationship, pks, edges
+
+
+def print_results(results, stream=sys.stderr):
+    stream.write('%-32s %10s %10s %10s %8s\n' % ('operation', 'p50 ms', 'p99 ms',
+                                                 'mean ms', 'queries'))
+    for name, summary in results.items():
+        stream.write('%-32s %10.3f %10.3f %10.3f %8.2f\n' % (
+            name, summary['p50_ms'], summary['p99_ms'], summary['mean_ms'],
+            summary['queries']))
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    setup(options.database)
+    
+    import django
+    from django.db import connection
+    
+    from .suite import compare, run_suite
+    
+    def progress(message):
+        sys.stderr.write('%s\n' % message)
+    
+    relationship, pks, edges = load_graph(options, progress)
+    results = run_suite(relationship, list(pks), edges, samples=options.samples,
+                        seed=options.seed, only=options.only, progress=progress)
+    print_results(results)
+    
+    report = OrderedDict([
+        ('meta', OrderedDict([
+            ('nodes', len(pks)),
+            ('edges', relationship.connections.count()),
+            ('skew', options.skew),
+            ('seed', options.seed),
+            ('samples', options.samples),
+            ('counters', options.counters),
+            ('cache', options.cache),
+            ('database', connection.vendor),
+            ('django', django.get_version()),
+            ('python', platform.python_version()),
+            ('date', datetime.utcnow().isoformat()),
+        ])),
+        ('results', results),
+    ])
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline['results'], results, options.threshold)
+        for name, metric, before, after in regressions:
+            sys.stderr.write('regression: %s %s %s -> %s\n' % (name, metric, before, after))
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,45 @@
+import os
+
+# Set BENCHMARK_DATABASE to "postgresql" to run against a local PostgreSQL
+# database, configured with the usual PG* environment variables.
+if os.environ.get('BENCHMARK_DATABASE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.environ.get('PGDATABASE', 'connections_benchmark'),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BENCHMARK_SQLITE', 'benchmark.sqlite3'),
+        },
+    }
+
+INSTALLED_APPS = (
+    'django.contrib.contenttypes',
+    'connections',
+    'benchmarks',
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
+USE_TZ = True
+
+SECRET_KEY = 'benchmarks'
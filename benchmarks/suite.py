@@ -0,0 +1,265 @@
+"""
+Timing of the public API of ``Relationship`` and of the template tags.
+
+Each operation is run once untimed, to warm up caches of content types and
+compiled templates, and then once per sample, each time on objects drawn
+at random from the graph. Results give the median (p50) and 99th percentile
+(p99) of the time taken, in milliseconds, and the mean number of queries
+per call.
+"""
+
+import math
+import random
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    # Python 2.6
+    OrderedDict = dict
+
+import django
+from django.db import connections as db_connections
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+
+from connections.models import BULK_BATCH_SIZE, _pairs_q
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# Kinds of samples operations are run on: a single object, a pair of
+# objects drawn at random, a pair of connected objects, a list of objects,
+# or nothing for operations on the whole relationship.
+NODE, PAIR, EDGE, NODES, GRAPH = 'node', 'pair', 'edge', 'nodes', 'graph'
+
+# Number of objects in ``NODES`` samples and of pairs per batch write.
+BATCH = 20
+
+# Number of times operations on the whole relationship are run.
+GRAPH_SAMPLES = 3
+
+
+def _tag(source):
+    template = Template('{% load connections %}' + source)
+    return lambda r, a, b=None: template.render(Context({'r': r, 'a': a, 'b': b}))
+
+
+def _async(name):
+    from asgiref.sync import async_to_sync
+    # ``async_to_sync`` runs the database queries of the asynchronous API
+    # in the calling thread, so that they're counted.
+    return lambda r, *args: async_to_sync(getattr(r, name))(*args)
+
+
+def _always(r):
+    return True
+
+
+# ``(name, kind, function, enabled)`` tuples; functions take the
+# relationship and the objects of a sample, and evaluate query sets.
+READS = [
+    ('get_connection', EDGE, lambda r, a, b: r.get_connection(a, b), _always),
+    ('connection_exists', EDGE, lambda r, a, b: r.connection_exists(a, b), _always),
+    ('connections_from_object', NODE, lambda r, a: list(r.connections_from_object(a)), _always),
+    ('connections_to_object', NODE, lambda r, a: list(r.connections_to_object(a)), _always),
+    ('page_connections_from', NODE, lambda r, a: r.page_connections_from(a), _always),
+    ('page_connections_to', NODE, lambda r, a: r.page_connections_to(a), _always),
+    ('connected_objects', NODE, lambda r, a: list(r.connected_objects(a)), _always),
+    ('connected_object_ids', NODE, lambda r, a: list(r.connected_object_ids(a)), _always),
+    ('connected_to_objects', NODE, lambda r, a: list(r.connected_to_objects(a)), _always),
+    ('connected_to_object_ids', NODE, lambda r, a: list(r.connected_to_object_ids(a)), _always),
+    ('mutual_connections', PAIR, lambda r, a, b: list(r.mutual_connections(a, b)), _always),
+    ('common_neighbors_count', NODES,
+     lambda r, objs: r.common_neighbors_count(objs[0], objs[1:]), _always),
+    ('suggest', NODE, lambda r, a: r.suggest(a), _always),
+    ('distance_between', PAIR, lambda r, a, b: r.distance_between(a, b, limit=3), _always),
+    ('shortest_path', PAIR, lambda r, a, b: r.shortest_path(a, b, max_hops=3), _always),
+    ('neighbourhood', NODE, lambda r, a: r.neighbourhood(a, depth=2), _always),
+    ('out_degree', NODE, lambda r, a: r.out_degree(a), _always),
+    ('in_degree', NODE, lambda r, a: r.in_degree(a), _always),
+    ('out_degrees', NODES, lambda r, objs: r.out_degrees(objs), _always),
+    ('in_degrees', NODES, lambda r, objs: r.in_degrees(objs), _always),
+    ('to_edge_arrays', GRAPH, lambda r: r.to_edge_arrays(), _always),
+    ('to_csr', GRAPH, lambda r: r.to_csr(), _always),
+    ('rebuild_counters', GRAPH, lambda r: r.rebuild_counters(), lambda r: r.counters),
+    ('tag:get_connection_distance', PAIR,
+     _tag('{% get_connection_distance r a b as d %}{{ d }}'), _always),
+    ('tag:connections_from_object', NODE,
+     _tag('{% connections_from_object r a as cs %}{% for c in cs %}{{ c.to_pk }}{% endfor %}'),
+     _always),
+    ('tag:connections_to_object', NODE,
+     _tag('{% connections_to_object r a as cs %}{% for c in cs %}{{ c.from_pk }}{% endfor %}'),
+     _always),
+    ('tag:connection_exists', EDGE, _tag('{% connection_exists r a b as e %}{{ e }}'), _always),
+]
+
+if django.VERSION >= (4, 1):
+    READS += [
+        ('aget_connection', EDGE, _async('aget_connection'), _always),
+        ('aconnection_exists', EDGE, _async('aconnection_exists'), _always),
+        ('aconnected_object_ids', NODE, _async('aconnected_object_ids'), _always),
+        ('aconnected_to_object_ids', NODE, _async('aconnected_to_object_ids'), _always),
+        ('aout_degree', NODE, _async('aout_degree'), _always),
+        ('ain_degree', NODE, _async('ain_degree'), _always),
+        ('adistance_between', PAIR, _async('adistance_between'), _always),
+    ]
+
+
+def percentile(values, p):
+    """
+    Returns the ``p``-th percentile of the given values, by nearest rank.
+    """
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def summarize(times, queries):
+    return OrderedDict([
+        ('samples', len(times)),
+        ('p50_ms', round(percentile(times, 50) * 1000, 3)),
+        ('p99_ms', round(percentile(times, 99) * 1000, 3)),
+        ('mean_ms', round(sum(times) * 1000 / len(times), 3)),
+        ('queries', round(float(sum(queries)) / len(queries), 2)),
+    ])
+
+
+def measure(relationship, func, samples):
+    """
+    Runs ``func`` with the relationship and each of the given tuples of
+    arguments, and returns a summary of the time taken and queries made.
+    """
+    connection = db_connections[relationship.connections.db]
+    times, queries = [], []
+    for args in samples:
+        with CaptureQueriesContext(connection) as captured:
+            start = timer()
+            func(relationship, *args)
+            times.append(timer() - start)
+        queries.append(len(captured.captured_queries))
+    return summarize(times, queries)
+
+
+class Sampler(object):
+    """
+    Draws samples of each kind from the primary keys of the objects in the
+    graph and a sample of its connections, as ``(from_pk, to_pk)`` pairs.
+    """
+    def __init__(self, relationship, pks, edges, seed=0):
+        self.model = relationship.from_model
+        self.pks = pks
+        self.edges = edges
+        self.rng = random.Random(seed)
+    
+    def obj(self, pk=None):
+        return self.model(pk=self.rng.choice(self.pks) if pk is None else pk)
+    
+    def sample(self, kind):
+        if kind == NODE:
+            return (self.obj(),)
+        if kind == PAIR:
+            return (self.obj(), self.obj())
+        if kind == EDGE:
+            from_pk, to_pk = self.rng.choice(self.edges)
+            return (self.obj(from_pk), self.obj(to_pk))
+        if kind == NODES:
+            return ([self.obj() for i in range(BATCH)],)
+        return ()
+    
+    def samples(self, kind, count):
+        if kind == GRAPH:
+            count = min(count, GRAPH_SAMPLES)
+        elif kind == EDGE and not self.edges:
+            return []
+        return [self.sample(kind) for i in range(count)]
+    
+    def new_pairs(self, relationship, count):
+        """
+        Returns up to ``count`` pairs of objects that aren't connected.
+        """
+        pairs = {}
+        # small graphs may not have as many pairs; give up rather than spin
+        attempts = count * 10
+        while len(pairs) < count and attempts:
+            while len(pairs) < count and attempts:
+                attempts -= 1
+                from_pk, to_pk = self.rng.choice(self.pks), self.rng.choice(self.pks)
+                if from_pk != to_pk:
+                    pairs[(from_pk, to_pk)] = (self.obj(from_pk), self.obj(to_pk))
+            for chunk in _chunks(list(pairs), BULK_BATCH_SIZE):
+                for key in (relationship.connections.filter(_pairs_q(chunk))
+                            .values_list('from_pk', 'to_pk')):
+                    del pairs[key]
+        return list(pairs.values())
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_suite(relationship, pks, edges, samples=100, seed=0, only=None, progress=None):
+    """
+    Times every operation on ``samples`` samples drawn from the objects with
+    the given primary keys and the given sample of connections, and returns
+    an ordered dictionary mapping operation names to their summaries.
+    
+    ``only``, if given, is a collection of the names of the operations to
+    run. ``progress``, if given, is called with the name of each operation
+    before it runs. Operations whose optional dependencies are missing are
+    left out.
+    """
+    sampler = Sampler(relationship, pks, edges, seed)
+    results = OrderedDict()
+    
+    def run(name, func, args):
+        if (only and name not in only) or len(args) < 2:
+            return
+        if progress is not None:
+            progress(name)
+        try:
+            func(relationship, *args[0])
+        except ImportError:
+            return
+        results[name] = measure(relationship, func, args[1:])
+    
+    # Writes leave the graph as they found it: connections are created
+    # between objects that weren't connected, and are then removed.
+    pairs = sampler.new_pairs(relationship, samples + 1)
+    run('create_connection', lambda r, a, b: r.create_connection(a, b), pairs)
+    relationship.remove_connections(pairs)
+    batches = _chunks(sampler.new_pairs(relationship, (samples + 1) * BATCH), BATCH)
+    run('create_connections', lambda r, batch: r.create_connections(batch),
+        [(batch,) for batch in batches])
+    relationship.create_connections(batches[0])
+    run('remove_connections', lambda r, batch: r.remove_connections(batch),
+        [(batch,) for batch in batches])
+    relationship.remove_connections(batches[0])
+    if django.VERSION >= (4, 1):
+        pairs = sampler.new_pairs(relationship, samples + 1)
+        run('acreate_connection', _async('acreate_connection'), pairs)
+        relationship.remove_connections(pairs)
+    
+    for name, kind, func, enabled in READS:
+        if enabled(relationship):
+            run(name, func, sampler.samples(kind, samples + 1))
+    return results
+
+
+def compare(baseline, results, threshold=1.25):
+    """
+    Compares two ``results`` dictionaries, as returned by ``run_suite()``,
+    and returns a list of ``(name, metric, before, after)`` tuples for each
+    operation whose p50 or p99 time grew by more than ``threshold`` times,
+    or that makes more queries than before.
+    """
+    regressions = []
+    for name, after in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if after[metric] > before[metric] * threshold:
+                regressions.append((name, metric, before[metric], after[metric]))
+        if after['queries'] > before['queries']:
+            regressions.append((name, 'queries', before['queries'], after['queries']))
+    return regressions
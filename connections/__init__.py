@@ -1,13 +1,24 @@
 from .shortcuts import (
     define_relationship,
     get_relationship,
+    get_relationships,
     get_connection,
     create_connection,
+    create_connections,
+    remove_connections,
     connection_exists,
     connections_from_object,
     connections_to_object,
+    page_connections_from,
+    page_connections_to,
     connected_objects,
     connected_to_objects,
+    aget_connection,
+    acreate_connection,
+    aconnection_exists,
+    aconnected_object_ids,
+    aconnected_to_object_ids,
+    adistance_between,
 )
 
 VERSION = (0, 2, 0, 'final', 1)
@@ -0,0 +1,247 @@
+"""
+Asynchronous counterparts of the ``Relationship`` methods most used while
+serving requests, for ASGI applications. They require Django 4.1 or later
+and are built directly on the asynchronous query set and cache APIs, so
+calling them costs no more thread switches than the queries they make.
+Snapshots of relationships are read once loaded, as long as they're fresh,
+but never loaded or refreshed, which would block.
+
+Counters, caches and closures have no asynchronous API, so
+``acreate_connection()`` of relationships that don't follow connections
+through ``post_save`` runs ``create_connection()`` in a worker thread, in a
+single thread switch. So does ``adistance_between()``, which takes the same
+path as ``distance_between()``: through the closure, memoized lookups, the
+cache or snapshot, which it may load or refresh, or a single recursive
+query. ``connection_created`` and ``connection_removed``
+receivers may be ``async`` functions only on Django 5.0 or later, whose
+signals support them; before that they must be synchronous.
+
+This module uses ``async def`` and is only imported on Python 3.5 or later.
+"""
+
+from functools import wraps
+
+from . import cache as _cache, instrumentation, memo
+from .cache import IN, OUT
+from .utils import chunked
+
+
+def _instrumented(func):
+    """
+    Measures an asynchronous method, without counting or tagging its
+    queries, which run in other threads.
+    """
+    operation = func.__name__
+    
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        backend = instrumentation.get_backend()
+        if backend is None:
+            return await func(self, *args, **kwargs)
+        start = instrumentation.timer()
+        result = await func(self, *args, **kwargs)
+        backend.record(instrumentation.Measurement(
+            self.name, operation, instrumentation.timer() - start, None,
+            instrumentation.count_rows(result)))
+        return result
+    return wrapper
+
+
+class AsyncRelationshipMixin(object):
+    """
+    Adds the asynchronous methods to ``Relationship``.
+    """
+    @_instrumented
+    async def aget_connection(self, from_obj, to_obj):
+        """
+        Asynchronous version of ``get_connection()``.
+        """
+        self._validate_ctypes(from_obj, to_obj)
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        identity_map = memo.get_identity_map()
+        key = (self.id, from_pk, to_pk)
+        if identity_map is not None:
+            if key in identity_map.connections:
+                return identity_map.connections[key]
+            if identity_map.connection_exists(self, from_pk, to_pk) is False:
+                return None
+        connection = await (self._connections((OUT, from_pk), (IN, to_pk))
+                            .filter(from_pk=from_pk, to_pk=to_pk).afirst())
+        if identity_map is not None:
+            identity_map.connections[key] = connection
+            identity_map.exists[key] = connection is not None
+        return connection
+    
+    @_instrumented
+    async def acreate_connection(self, from_obj, to_obj):
+        """
+        Asynchronous version of ``create_connection()``. For relationships
+        without row signals or with a TTL, ``create_connection()`` runs in a
+        worker thread.
+        """
+        from asgiref.sync import sync_to_async
+        self._validate_ctypes(from_obj, to_obj)
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        if not self.row_signals or self.ttl is not None:
+            # Counters, caches and closures have no asynchronous API, so the
+            # connection is created and they're updated in a single worker
+            # thread and transaction, as by ``create_connection()``.
+            return await sync_to_async(self._create_connection)(from_pk, to_pk)
+        # ``post_save`` takes care of counters, caches and signals.
+        connection, _ = await self.connections.aget_or_create(
+            relationship_id=self.id, from_pk=from_pk, to_pk=to_pk)
+        return connection
+    
+    @_instrumented
+    async def aconnection_exists(self, from_obj, to_obj):
+        """
+        Asynchronous version of ``connection_exists()``.
+        """
+        self._validate_ctypes(from_obj, to_obj)
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        identity_map = memo.get_identity_map()
+        if identity_map is None:
+            return await self._aconnection_exists(from_pk, to_pk)
+        exists = identity_map.connection_exists(self, from_pk, to_pk)
+        if exists is None:
+            exists = await self._aconnection_exists(from_pk, to_pk)
+            identity_map.exists[(self.id, from_pk, to_pk)] = exists
+        return exists
+    
+    async def _aconnection_exists(self, from_pk, to_pk):
+        if _fresh(self):
+            return self.snapshot.connection_exists(from_pk, to_pk)
+        if self.cache is not None:
+            ids = await _cache_get(self.cache, OUT, from_pk)
+            if ids is not None:
+                return to_pk in ids
+        return await (self._connections((OUT, from_pk), (IN, to_pk))
+                      .filter(from_pk=from_pk, to_pk=to_pk).aexists())
+    
+    @_instrumented
+    async def aconnected_object_ids(self, from_obj):
+        """
+        Asynchronous version of ``connected_object_ids()``, returning a
+        list, or a set if the relationship is cached or has a snapshot, or
+        its lookups of IDs are memoized.
+        """
+        self._validate_ctypes(from_obj, None)
+        identity_map = memo.get_identity_map() if self.memoize_ids else None
+        if identity_map is not None:
+            return await _memoized_ids(self, identity_map, OUT, from_obj.pk)
+        if _fresh(self):
+            return self.snapshot.get(OUT, from_obj.pk)
+        if self.cache is not None:
+            return (await _cache_get_many(self.cache, OUT, [from_obj.pk]))[from_obj.pk]
+        return [pk async for pk in self._adjacency(OUT, [from_obj.pk], flat=True)]
+    
+    @_instrumented
+    async def aconnected_to_object_ids(self, to_obj):
+        """
+        Asynchronous version of ``connected_to_object_ids()``, returning a
+        list, or a set if the relationship is cached or has a snapshot, or
+        its lookups of IDs are memoized.
+        """
+        self._validate_ctypes(None, to_obj)
+        identity_map = memo.get_identity_map() if self.memoize_ids else None
+        if identity_map is not None:
+            return await _memoized_ids(self, identity_map, IN, to_obj.pk)
+        if _fresh(self):
+            return self.snapshot.get(IN, to_obj.pk)
+        if self.cache is not None:
+            return (await _cache_get_many(self.cache, IN, [to_obj.pk]))[to_obj.pk]
+        return [pk async for pk in self._adjacency(IN, [to_obj.pk], flat=True)]
+    
+    @_instrumented
+    async def aout_degree(self, from_obj):
+        """
+        Asynchronous version of ``out_degree()``.
+        """
+        self._validate_ctypes(from_obj, None)
+        return await self._adegree(OUT, from_obj.pk)
+    
+    @_instrumented
+    async def ain_degree(self, to_obj):
+        """
+        Asynchronous version of ``in_degree()``.
+        """
+        self._validate_ctypes(None, to_obj)
+        return await self._adegree(IN, to_obj.pk)
+    
+    async def _adegree(self, side, pk):
+        from .models import _counters
+        if self.counters:
+            # Counter sides and adjacency cache sides share their values.
+            count = await (_counters(self, (side, pk)).filter(side=side, object_pk=pk)
+                           .values_list('count', flat=True).afirst())
+            return count or 0
+        count = 0
+        for field in self._fields(side):
+            count += await self._connections((side, pk)).filter(**{field: pk}).acount()
+        return count
+    
+    @_instrumented
+    async def adistance_between(self, from_obj, to_obj, limit=2):
+        """
+        Asynchronous version of ``distance_between()``, which runs in a
+        worker thread.
+        """
+        from asgiref.sync import sync_to_async
+        self._validate_ctypes(from_obj, to_obj)
+        if from_obj == to_obj:
+            return 0
+        return await sync_to_async(self._distance)(from_obj.pk, to_obj.pk, limit)
+
+
+def _fresh(relationship):
+    return relationship.snapshot is not None and relationship.snapshot.fresh
+
+
+async def _memoized_ids(relationship, identity_map, side, pk):
+    key = (relationship.id, side, pk)
+    ids = identity_map.adjacency.get(key)
+    if ids is None:
+        if _fresh(relationship):
+            ids = relationship.snapshot.get(side, pk)
+        elif relationship.cache is not None:
+            ids = (await _cache_get_many(relationship.cache, side, [pk]))[pk]
+        else:
+            ids = [other_pk async for other_pk in relationship._adjacency(side, [pk], flat=True)]
+        ids = identity_map.adjacency[key] = frozenset(ids)
+    return ids
+
+
+async def _cache_version(cache):
+    backend = cache.backend
+    version = await backend.aget(cache._version_key)
+    if version is None:
+        await backend.aadd(cache._version_key, _cache._new_version(), None)
+        version = await backend.aget(cache._version_key)
+    return version
+
+
+async def _cache_get(cache, side, pk):
+    return await cache.backend.aget(cache._key(await _cache_version(cache), side, pk))
+
+
+async def _cache_get_many(cache, side, pks):
+    version = await _cache_version(cache)
+    keys = dict((cache._key(version, side, pk), pk) for pk in pks)
+    cached = await cache.backend.aget_many(list(keys))
+    result = dict((keys[key], ids) for key, ids in cached.items())
+    missing = [pk for pk in keys.values() if pk not in result]
+    if missing:
+        fetched = await _cache_fetch(cache, side, missing)
+        await cache.backend.aset_many(
+            dict((cache._key(version, side, pk), ids) for pk, ids in fetched.items()),
+            cache.timeout)
+        result.update(fetched)
+    return result
+
+
+async def _cache_fetch(cache, side, pks):
+    result = dict((pk, set()) for pk in pks)
+    for chunk in chunked(pks, _cache.BATCH_SIZE):
+        async for pk, other_pk in cache.relationship._adjacency(side, chunk):
+            result[pk].add(other_pk)
+    return dict((pk, frozenset(ids)) for pk, ids in result.items())
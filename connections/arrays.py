@@ -0,0 +1,95 @@
+"""
+Export of relationships to compact arrays, for analytics.
+
+Connections are read with ``QuerySet.iterator()`` and appended to typed
+``array.array`` columns as they arrive, so that exporting a relationship
+costs about 24 bytes per connection -- two 64-bit primary keys and a 64-bit
+weight -- instead of a Python tuple per row. NumPy and SciPy are optional:
+columns are only wrapped in NumPy arrays, without copying, when asked to,
+and only ``to_csr()`` needs SciPy.
+
+Connections of symmetric relationships, stored once, are exported both
+ways by default, so that the arrays list the connections of each node
+whichever end it's stored at, and ``to_csr()`` gives a symmetric matrix.
+"""
+
+from array import array
+
+from .utils import iterate
+
+
+try:
+    array('q')
+except ValueError:  # pragma: no cover
+    # Python 2 has no 'q' type code; longs are 64-bit on LP64 platforms.
+    INT64 = 'l'
+else:
+    INT64 = 'q'
+FLOAT64 = 'd'
+
+# Number of rows fetched from the database at a time, where supported.
+CHUNK_SIZE = 2000
+
+
+def edge_arrays(relationship, numpy=False, chunk_size=CHUNK_SIZE, mirror=None):
+    """
+    Returns a ``(from_pks, to_pks, weights)`` tuple of arrays holding the
+    ``from_pk``, ``to_pk`` and ``weight`` columns of all connections of the
+    given relationship, in no particular order. If ``mirror`` is ``True``,
+    or ``None`` and the relationship is symmetric, each connection between
+    two different objects is also included the other way.
+    
+    Columns are ``array.array`` instances, or NumPy ``int64`` and ``float64``
+    arrays sharing their memory if ``numpy`` is ``True``.
+    """
+    if numpy:
+        import numpy as np
+    if mirror is None:
+        mirror = relationship.symmetric
+    from_pks, to_pks, weights = array(INT64), array(INT64), array(FLOAT64)
+    qs = relationship.connections.order_by().values_list('from_pk', 'to_pk', 'weight')
+    for from_pk, to_pk, weight in iterate(qs, chunk_size):
+        from_pks.append(from_pk)
+        to_pks.append(to_pk)
+        weights.append(weight)
+        if mirror and from_pk != to_pk:
+            from_pks.append(to_pk)
+            to_pks.append(from_pk)
+            weights.append(weight)
+    if numpy:
+        return (np.frombuffer(from_pks, dtype=np.int64),
+                np.frombuffer(to_pks, dtype=np.int64),
+                np.frombuffer(weights, dtype=np.float64))
+    return from_pks, to_pks, weights
+
+
+def to_csr(relationship, chunk_size=CHUNK_SIZE, mirror=None):
+    """
+    Returns a ``(matrix, row_pks, col_pks)`` tuple, where ``matrix`` is a
+    SciPy CSR matrix of the weights of the connections of the given
+    relationship, and ``row_pks`` and ``col_pks`` are sorted NumPy arrays
+    mapping row and column indices to the primary keys of the objects
+    connected from and to, respectively.
+    
+    Relationships between objects of the same model are exported as square
+    matrices, with ``row_pks`` and ``col_pks`` being the same array, so that
+    the matrix is the adjacency matrix of the graph. ``mirror`` is passed
+    to ``edge_arrays()``.
+    """
+    import numpy as np
+    from scipy import sparse
+    
+    from_pks, to_pks, weights = edge_arrays(relationship, numpy=True,
+                                            chunk_size=chunk_size, mirror=mirror)
+    if (relationship.from_model._meta.concrete_model is
+            relationship.to_model._meta.concrete_model):
+        row_pks, indices = np.unique(np.concatenate((from_pks, to_pks)),
+                                     return_inverse=True)
+        rows, cols = indices[:len(from_pks)], indices[len(from_pks):]
+        col_pks = row_pks
+    else:
+        row_pks, rows = np.unique(from_pks, return_inverse=True)
+        col_pks, cols = np.unique(to_pks, return_inverse=True)
+    matrix = sparse.csr_matrix((weights, (rows, cols)),
+                               shape=(len(row_pks), len(col_pks)))
+    return matrix, row_pks, col_pks
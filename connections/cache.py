@@ -0,0 +1,149 @@
+"""
+Caching of adjacency sets, i.e. the sets of IDs of the objects connected
+from and to each node of a relationship.
+
+Relationships defined with ``cache='<alias>'`` keep their adjacency sets in
+the given Django cache. Cached sets are invalidated as connections are
+created or removed through ``connections``. All keys of a relationship
+include a version number, so that the whole relationship may be invalidated
+at once by bumping it, e.g. after connections have been deleted with
+``QuerySet.delete()`` or raw SQL.
+"""
+
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+try:
+    from django.core.cache import caches
+except ImportError:  # pragma: no cover
+    # Django < 1.7
+    from django.core.cache import get_cache
+else:
+    def get_cache(alias):
+        return caches[alias]
+
+from .utils import chunked
+
+
+OUT = 'out'
+IN = 'in'
+
+# Maximum number of nodes whose adjacency sets are fetched from the database
+# with a single query when filling the cache.
+BATCH_SIZE = 400
+
+
+def _new_version():
+    # Versions start from the current time, rather than from 1, so that
+    # entries written before the version key got evicted from the cache are
+    # never read again.
+    return int(time.time() * 1000)
+
+
+class AdjacencyCache(object):
+    """
+    Caches the adjacency sets of the nodes of a relationship in the Django
+    cache with the given ``alias``.
+    """
+    def __init__(self, relationship, alias='default', timeout=DEFAULT_TIMEOUT):
+        self.relationship = relationship
+        self.alias = alias
+        self.timeout = timeout
+    
+    @property
+    def backend(self):
+        return get_cache(self.alias)
+    
+    @property
+    def _version_key(self):
+        return 'connections:%s:version' % self.relationship.name
+    
+    def _version(self):
+        backend = self.backend
+        version = backend.get(self._version_key)
+        if version is None:
+            backend.add(self._version_key, _new_version(), None)
+            version = backend.get(self._version_key)
+        return version
+    
+    def _key(self, version, side, pk):
+        return 'connections:%s:%s:%s:%s' % (self.relationship.name, version,
+                                            side, pk)
+    
+    def get(self, side, pk):
+        """
+        Returns the cached set of IDs of the objects connected to the node
+        with the given ``pk`` on the given ``side`` (``'out'`` for
+        ``Connection.to_pk`` values, ``'in'`` for ``Connection.from_pk``
+        values), or ``None`` if the set is not cached.
+        """
+        return self.backend.get(self._key(self._version(), side, pk))
+    
+    def get_many(self, side, pks):
+        """
+        Returns a dictionary mapping each of the given ``pks`` to its
+        adjacency set on the given ``side``. Sets missing from the cache are
+        fetched from the database with one query per ``BATCH_SIZE`` nodes,
+        and are then cached.
+        """
+        version = self._version()
+        keys = dict((self._key(version, side, pk), pk) for pk in pks)
+        cached = self.backend.get_many(list(keys))
+        result = dict((keys[key], ids) for key, ids in cached.items())
+        missing = [pk for pk in keys.values() if pk not in result]
+        if missing:
+            fetched = self._fetch(side, missing)
+            self.backend.set_many(
+                dict((self._key(version, side, pk), ids)
+                     for pk, ids in fetched.items()),
+                self.timeout)
+            result.update(fetched)
+        return result
+    
+    def _fetch(self, side, pks):
+        result = dict((pk, set()) for pk in pks)
+        for chunk in chunked(pks, BATCH_SIZE):
+            for pk, other_pk in self.relationship._adjacency(side, chunk):
+                result[pk].add(other_pk)
+        return dict((pk, frozenset(ids)) for pk, ids in result.items())
+    
+    def discard(self, pairs):
+        """
+        Invalidates the cached adjacency sets affected by connections between
+        the given ``(from_pk, to_pk)`` pairs being created or removed.
+        """
+        version = self._version()
+        keys = set()
+        for from_pk, to_pk in pairs:
+            keys.add(self._key(version, OUT, from_pk))
+            keys.add(self._key(version, IN, to_pk))
+        self.backend.delete_many(list(keys))
+    
+    def invalidate(self):
+        """
+        Invalidates all cached adjacency sets of the relationship.
+        """
+        backend = self.backend
+        try:
+            backend.incr(self._version_key)
+        except ValueError:
+            backend.set(self._version_key, _new_version(), None)
+
+
+def discard_now_and_on_commit(relationship, pairs, using):
+    """
+    Invalidates the cached adjacency sets affected by connections between
+    the given pairs being created or removed, if the relationship is cached.
+    """
+    cache = relationship.cache
+    if cache is None:
+        return
+    # Invalidate right away and again once the transaction commits, so that
+    # a concurrent reader caching the old state of the database before the
+    # commit does not leave stale entries behind.
+    pairs = list(pairs)
+    cache.discard(pairs)
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: cache.discard(pairs), using=using)
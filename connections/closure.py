@@ -0,0 +1,240 @@
+"""
+Transitive closure of hierarchical relationships.
+
+Relationships defined with ``closure=True`` keep a ``ConnectionClosure``
+row for every pair of objects connected by a path of connections, from
+the ancestor to the descendant, holding the length of the shortest such
+path. Reachability, distances and the lists of ancestors and descendants
+of an object are then single indexed lookups, however deep the hierarchy.
+
+Rows are updated in the same transaction as the connections themselves.
+Creating a connection from ``a`` to ``b`` connects each ancestor of ``a``
+with each descendant of ``b``, costing a few queries. Removing one
+recomputes the rows between the same objects, from the connections of the
+ancestors of ``a``, in reverse topological order. Either way, the cost
+grows with the number of pairs of objects on both sides, which stays small
+in hierarchies such as groups nested in groups.
+
+The closure of a graph with cycles can't be updated incrementally, so
+connections that would close a cycle are refused with ``ValueError``.
+Connections saved directly, rather than through the relationship, must be
+saved in a transaction for a refused connection to be rolled back.
+"""
+
+from django.db import router, transaction
+
+from .cache import OUT
+from .utils import chunked
+
+
+# Maximum number of primary keys sent in a single ``IN (...)`` clause.
+BATCH_SIZE = 400
+
+
+def closure_rows(relationship, *nodes):
+    """
+    Returns a query set matching all closure rows of the given relationship,
+    routed like its connections.
+    """
+    from .models import ConnectionClosure
+    hints = {'relationship': relationship, 'nodes': nodes}
+    return (ConnectionClosure.objects.db_manager(hints=hints)
+            .filter(relationship_id=relationship.id))
+
+
+def _using(relationship):
+    from .models import ConnectionClosure
+    return router.db_for_write(ConnectionClosure, relationship=relationship)
+
+
+def _depths(qs, field, pks, other, other_pks):
+    """
+    Returns a dictionary mapping ``(ancestor_pk, descendant_pk)`` pairs to
+    the ``(pk, depth)`` of the rows between the given objects.
+    """
+    rows = {}
+    for chunk in chunked(list(pks), BATCH_SIZE):
+        for other_chunk in chunked(list(other_pks), BATCH_SIZE):
+            for pk, ancestor, descendant, depth in (
+                    qs.filter(**{'%s__in' % field: chunk, '%s__in' % other: other_chunk})
+                    .values_list('pk', 'ancestor_pk', 'descendant_pk', 'depth')):
+                rows[(ancestor, descendant)] = (pk, depth)
+    return rows
+
+
+def _write(relationship, qs, using, existing, depths):
+    """
+    Makes the closure rows of the given pairs hold ``depths``, given the
+    ``existing`` rows of those pairs. Pairs missing from ``depths`` are
+    deleted.
+    """
+    from .models import ConnectionClosure
+    stale = [pk for key, (pk, depth) in existing.items() if key not in depths]
+    for chunk in chunked(stale, BATCH_SIZE):
+        qs.filter(pk__in=chunk).delete()
+    changed = {}
+    for key, depth in depths.items():
+        if key in existing and existing[key][1] != depth:
+            changed.setdefault(depth, []).append(existing[key][0])
+    for depth, pks in changed.items():
+        for chunk in chunked(pks, BATCH_SIZE):
+            qs.filter(pk__in=chunk).update(depth=depth)
+    ConnectionClosure.objects.db_manager(using).bulk_create([
+        ConnectionClosure(relationship_id=relationship.id, ancestor_pk=ancestor,
+                          descendant_pk=descendant, depth=depth)
+        for (ancestor, descendant), depth in depths.items()
+        if (ancestor, descendant) not in existing], batch_size=BATCH_SIZE)
+
+
+def connected(relationship, keys):
+    """
+    Updates the closure of the relationship after connections between the
+    given ``(from_pk, to_pk)`` pairs were created. Raises ``ValueError`` if
+    any of them closes a cycle.
+    """
+    using = _using(relationship)
+    qs = closure_rows(relationship).using(using)
+    for from_pk, to_pk in keys:
+        descendants = dict(qs.filter(ancestor_pk=to_pk)
+                           .values_list('descendant_pk', 'depth'))
+        if from_pk == to_pk or from_pk in descendants:
+            raise ValueError('Connection from %s to %s would close a cycle in '
+                             'relationship "%s"' % (from_pk, to_pk, relationship.name))
+        descendants[to_pk] = 0
+        ancestors = dict(qs.filter(descendant_pk=from_pk)
+                         .values_list('ancestor_pk', 'depth'))
+        ancestors[from_pk] = 0
+        existing = _depths(qs, 'ancestor_pk', ancestors, 'descendant_pk', descendants)
+        depths = {}
+        for ancestor, up in ancestors.items():
+            for descendant, down in descendants.items():
+                key = (ancestor, descendant)
+                depth = up + 1 + down
+                if key in existing and existing[key][1] < depth:
+                    depth = existing[key][1]
+                depths[key] = depth
+        _write(relationship, qs, using, existing, depths)
+
+
+def disconnected(relationship, keys):
+    """
+    Updates the closure of the relationship after connections between the
+    given ``(from_pk, to_pk)`` pairs were removed.
+    """
+    using = _using(relationship)
+    qs = closure_rows(relationship).using(using)
+    connections = relationship.connections.using(using)
+    for from_pk, to_pk in keys:
+        # Only paths from the ancestors of ``from_pk`` to the descendants of
+        # ``to_pk`` may have gone through the connection.
+        ancestors = set(qs.filter(descendant_pk=from_pk)
+                        .values_list('ancestor_pk', flat=True))
+        ancestors.add(from_pk)
+        descendants = set(qs.filter(ancestor_pk=to_pk)
+                          .values_list('descendant_pk', flat=True))
+        descendants.add(to_pk)
+        
+        children = dict((pk, []) for pk in ancestors)
+        for chunk in chunked(list(ancestors), BATCH_SIZE):
+            for parent, child in (connections.filter(from_pk__in=chunk)
+                                  .values_list('from_pk', 'to_pk')):
+                children[parent].append(child)
+        
+        # Descendants reached from each object, limited to ``descendants``;
+        # those of objects other than the ancestors haven't changed.
+        reached = {}
+        outside = set(child for pks in children.values() for child in pks) - ancestors
+        for (ancestor, descendant), (pk, depth) in _depths(
+                qs, 'ancestor_pk', outside, 'descendant_pk', descendants).items():
+            reached.setdefault(ancestor, {})[descendant] = depth
+        
+        # Ancestors are visited after all of their children among them.
+        pending = dict((pk, sum(1 for child in pks if child in ancestors))
+                       for pk, pks in children.items())
+        parents = {}
+        for pk, pks in children.items():
+            for child in pks:
+                if child in ancestors:
+                    parents.setdefault(child, []).append(pk)
+        ready = [pk for pk, count in pending.items() if count == 0]
+        depths = {}
+        while ready:
+            pk = ready.pop()
+            own = {}
+            for child in children[pk]:
+                if child in descendants:
+                    own[child] = 1
+                for descendant, depth in reached.get(child, {}).items():
+                    if own.get(descendant, depth + 2) > depth + 1:
+                        own[descendant] = depth + 1
+            reached[pk] = own
+            for descendant, depth in own.items():
+                depths[(pk, descendant)] = depth
+            for parent in parents.get(pk, ()):
+                pending[parent] -= 1
+                if pending[parent] == 0:
+                    ready.append(parent)
+        
+        existing = _depths(qs, 'ancestor_pk', ancestors, 'descendant_pk', descendants)
+        _write(relationship, qs, using, existing, depths)
+
+
+def rebuild(relationship, batch_size=BATCH_SIZE):
+    """
+    Recomputes the closure of the relationship from its connections,
+    replacing the stored rows. Ancestors are processed ``batch_size`` at a
+    time, each batch in its own transaction, with a breadth-first search
+    costing one query per level of depth.
+    """
+    from .models import ConnectionClosure
+    using = _using(relationship)
+    qs = closure_rows(relationship).using(using)
+    connections = relationship.connections.using(using)
+    last = None
+    while True:
+        sources = connections.order_by('from_pk')
+        if last is not None:
+            sources = sources.filter(from_pk__gt=last)
+        sources = list(sources.values_list('from_pk', flat=True).distinct()[:batch_size])
+        bound = sources[-1] if len(sources) == batch_size else None
+        
+        rows = []
+        children = {}
+        frontiers = dict((pk, set([pk])) for pk in sources)
+        seen = dict((pk, {}) for pk in sources)
+        depth = 0
+        while any(frontiers.values()):
+            depth += 1
+            missing = set(pk for frontier in frontiers.values()
+                          for pk in frontier if pk not in children)
+            for pk in missing:
+                children[pk] = []
+            for chunk in chunked(list(missing), BATCH_SIZE):
+                for parent, child in relationship._adjacency(OUT, chunk).using(using):
+                    children[parent].append(child)
+            for source, frontier in frontiers.items():
+                found = set()
+                for pk in frontier:
+                    for child in children[pk]:
+                        if child != source and child not in seen[source]:
+                            seen[source][child] = depth
+                            found.add(child)
+                frontiers[source] = found
+        for source in sources:
+            rows.extend(ConnectionClosure(relationship_id=relationship.id,
+                                          ancestor_pk=source, descendant_pk=pk,
+                                          depth=depth)
+                        for pk, depth in sorted(seen[source].items()))
+        
+        stale = qs
+        if last is not None:
+            stale = stale.filter(ancestor_pk__gt=last)
+        if bound is not None:
+            stale = stale.filter(ancestor_pk__lte=bound)
+        with transaction.atomic(using=using):
+            stale.delete()
+            ConnectionClosure.objects.db_manager(using).bulk_create(
+                rows, batch_size=BATCH_SIZE)
+        if bound is None:
+            break
+        last = bound
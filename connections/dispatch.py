@@ -0,0 +1,119 @@
+"""
+Dispatching of the ``connections_created_batch`` and
+``connections_removed_batch`` signals.
+
+Pairs of connections created or removed inside a transaction are collected
+in a batch kept per thread and database, and sent once it commits, one
+signal per relationship and kind of change, with the pairs in the order
+they were changed. The batch is flushed by a hook registered with
+``transaction.on_commit()`` when its first change is made, so that it's
+dropped along with everything else if the whole transaction is rolled
+back.
+
+Changes made in a savepoint the flusher wasn't registered in may have been
+rolled back without the flusher being dropped. Such pairs are checked
+against the database when the batch is flushed, costing a query per
+relationship and ``BULK_BATCH_SIZE`` pairs, and dropped unless their
+current state still matches the change: connected if they were created,
+disconnected if they were removed. If the savepoint the flusher was
+registered in has ended by the time of a change, another flusher is
+registered along with it, and the batch is flushed by whichever runs first.
+
+Outside transactions, and on Django versions without ``on_commit()``
+(before 1.9), signals are sent right away.
+"""
+
+import threading
+import weakref
+
+from django.db import connections as db_connections, transaction
+
+
+_local = threading.local()
+
+
+def send_on_commit(signal, relationship, pairs, created, using):
+    """
+    Sends ``signal`` for the given ``(from_pk, to_pk)`` pairs of connections
+    of ``relationship``, just ``created`` or removed, batched with any other
+    pairs changed in the current transaction on database ``using``, once it
+    commits.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    connection = db_connections[using]
+    if not hasattr(transaction, 'on_commit') or not connection.in_atomic_block:
+        signal.send(sender=relationship, pairs=pairs)
+        return
+    
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = {}
+    # The batch is only referenced by its flushers, so that it goes away
+    # along with them when the transaction is rolled back.
+    batch = batches[using]() if using in batches else None
+    if batch is None or batch.flushed:
+        batch = _Batch()
+        batches[using] = weakref.ref(batch)
+    savepoint_ids = frozenset(connection.savepoint_ids)
+    if not any(sids <= savepoint_ids for sids in batch.savepoint_ids):
+        batch.savepoint_ids.append(savepoint_ids)
+        transaction.on_commit(_Flusher(batch, savepoint_ids), using=using)
+    batch.add(signal, relationship, pairs, created, savepoint_ids, using)
+
+
+class _Batch(object):
+    def __init__(self):
+        self.changes = []
+        # of the savepoints each flusher was registered in
+        self.savepoint_ids = []
+        self.flushed = False
+    
+    def add(self, signal, relationship, pairs, created, savepoint_ids, using):
+        last = self.changes[-1] if self.changes else None
+        if last is not None and last[:5] == (signal, relationship, created,
+                                             savepoint_ids, using):
+            last[5].extend(pairs)
+        else:
+            self.changes.append((signal, relationship, created, savepoint_ids,
+                                 using, pairs))
+    
+    def flush(self, savepoint_ids):
+        if self.flushed:
+            return
+        self.flushed = True
+        # pairs changed in savepoints that may have been rolled back
+        unsure = {}
+        for signal, relationship, created, sids, using, changed in self.changes:
+            if not sids <= savepoint_ids:
+                unsure.setdefault((relationship, using), set()).update(changed)
+        existing = dict((key, key[0]._existing_pairs(pairs, key[1]))
+                        for key, pairs in unsure.items())
+        
+        batches = []
+        pairs = {}
+        for signal, relationship, created, sids, using, changed in self.changes:
+            key = (signal, relationship)
+            if key not in pairs:
+                batches.append(key)
+                pairs[key] = []
+            if sids <= savepoint_ids:
+                pairs[key].extend(changed)
+            else:
+                found = existing[(relationship, using)]
+                pairs[key].extend(pair for pair in changed
+                                  if (pair in found) == created)
+        for key in batches:
+            if pairs[key]:
+                signal, relationship = key
+                signal.send(sender=relationship, pairs=pairs[key])
+
+
+class _Flusher(object):
+    def __init__(self, batch, savepoint_ids):
+        self.batch = batch
+        self.savepoint_ids = savepoint_ids
+    
+    def __call__(self):
+        self.batch.flush(self.savepoint_ids)
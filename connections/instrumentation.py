@@ -0,0 +1,231 @@
+"""
+Instrumentation of relationship operations.
+
+Every public method of ``Relationship``, and every template tag, reports a
+``Measurement`` of each call to the backend set by
+``CONNECTIONS_INSTRUMENTATION``, the dotted path of a ``Backend`` subclass::
+
+    CONNECTIONS_INSTRUMENTATION = 'connections.instrumentation.LoggingBackend'
+
+While an operation runs, the SQL it sends is tagged with a comment naming
+the relationship and the operation, so that slow query logs can be traced
+back to them::
+
+    SELECT ... /*relationship='user_follow',operation='connected_object_ids'*/
+
+Operations called by other operations are accounted to the outermost one.
+Query sets of connections returned by an operation are tagged and measured
+when they're evaluated instead. Counting and tagging queries requires
+Django 2.0 or later; asynchronous methods are measured without either.
+
+Without a backend, which is the default, operations cost a single extra
+check per call.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections as db_connections
+from django.db.models import Model
+from django.db.models.query import QuerySet
+
+try:
+    from django.core.signals import setting_changed
+except ImportError:  # pragma: no cover
+    # Django < 1.8
+    from django.test.signals import setting_changed
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:  # pragma: no cover
+    # Django < 1.7
+    from django.utils.module_loading import import_by_path as import_string
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+logger = logging.getLogger('connections.instrumentation')
+
+# A call of an operation. ``elapsed`` is in seconds. ``queries`` is ``None``
+# where queries can't be counted, and ``rows`` where the result isn't a
+# collection, e.g. for ``out_degree``.
+Measurement = namedtuple('Measurement',
+                         ('relationship', 'operation', 'elapsed', 'queries', 'rows'))
+
+_UNSAFE_RE = re.compile(r'[^A-Za-z0-9_.:-]')
+
+_backend = None
+_local = threading.local()
+
+
+class Backend(object):
+    """
+    Receives measurements of operations. Subclasses override ``record()``
+    to send them to a metrics system. Set ``tag_sql`` to ``False`` to leave
+    SQL untouched.
+    """
+    tag_sql = True
+    
+    def record(self, measurement):
+        pass
+
+
+class LoggingBackend(Backend):
+    """
+    Logs measurements to the ``connections.instrumentation`` logger, at
+    ``DEBUG`` level.
+    """
+    def record(self, measurement):
+        logger.debug('%s %s: %.3f ms, %s queries, %s rows',
+                     measurement.relationship, measurement.operation,
+                     measurement.elapsed * 1000, measurement.queries,
+                     measurement.rows)
+
+
+def get_backend():
+    """
+    Returns the instrumentation backend in use, or ``None``.
+    """
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Sets the instrumentation backend to the given ``Backend`` instance, or
+    disables instrumentation if ``None``. Overrides
+    ``CONNECTIONS_INSTRUMENTATION`` until the setting changes.
+    """
+    global _backend
+    _backend = backend
+
+
+def load_backend():
+    """
+    Sets the instrumentation backend from ``CONNECTIONS_INSTRUMENTATION``.
+    """
+    path = getattr(settings, 'CONNECTIONS_INSTRUMENTATION', None)
+    set_backend(import_string(path)() if path else None)
+
+
+def _setting_changed_handler(setting, **kwargs):
+    if setting == 'CONNECTIONS_INSTRUMENTATION':
+        load_backend()
+setting_changed.connect(_setting_changed_handler)
+load_backend()
+
+
+def count_rows(result):
+    """
+    Returns the number of rows in the result of an operation: the length of
+    collections other than query sets, 1 for model instances, 0 for
+    ``None`` and else ``None``.
+    """
+    if result is None:
+        return 0
+    if isinstance(result, Model):
+        return 1
+    if isinstance(result, QuerySet) or not hasattr(result, '__len__'):
+        return None
+    return len(result)
+
+
+def first_rows(result):
+    """
+    Counts the rows of the first item of results that are tuples, such as
+    pages of connections and paths.
+    """
+    return None if result is None else count_rows(result[0])
+
+
+class _QueryCounter(object):
+    """
+    A database execute wrapper that counts queries and tags their SQL.
+    """
+    def __init__(self, comment):
+        self.comment = comment
+        self.count = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if self.comment:
+            sql = '%s %s' % (sql, self.comment)
+        return execute(sql, params, many, context)
+
+
+def _comment(relationship, operation):
+    return "/*relationship='%s',operation='%s'*/" % (
+        _UNSAFE_RE.sub('_', relationship), operation)
+
+
+def measure(relationship, operation, func, args=(), kwargs=None, rows=count_rows):
+    """
+    Calls ``func`` with the given arguments as the given operation of the
+    relationship with the given name, and returns its result.
+    
+    Returned query sets with an ``_operation`` attribute, i.e. of
+    connections, are tagged with the operation for ``_fetch_all()`` to be
+    measured instead.
+    """
+    backend = _backend
+    if backend is None or getattr(_local, 'active', False):
+        return func(*args, **(kwargs or {}))
+    
+    counter = _QueryCounter(_comment(relationship, operation) if backend.tag_sql else None)
+    wrapped = [conn for conn in db_connections.all()
+               if hasattr(conn, 'execute_wrappers')]
+    for conn in wrapped:
+        conn.execute_wrappers.append(counter)
+    _local.active = True
+    start = timer()
+    try:
+        result = func(*args, **(kwargs or {}))
+    finally:
+        elapsed = timer() - start
+        _local.active = False
+        for conn in wrapped:
+            conn.execute_wrappers.remove(counter)
+    
+    if hasattr(result, '_operation') and not counter.count:
+        result._operation = (relationship, operation)
+        return result
+    backend.record(Measurement(relationship, operation, elapsed,
+                               counter.count if wrapped else None, rows(result)))
+    return result
+
+
+def instrumented(func=None, rows=count_rows):
+    """
+    Decorates a method of ``Relationship`` as an operation named after it.
+    ``rows`` counts the rows in its result.
+    """
+    if func is None:
+        return lambda func: instrumented(func, rows=rows)
+    operation = func.__name__
+    
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if _backend is None:
+            return func(self, *args, **kwargs)
+        return measure(self.name, operation, func, (self,) + args, kwargs, rows)
+    return wrapper
+
+
+def instrumented_tag(func):
+    """
+    Decorates a template tag taking a relationship, or its name, as its
+    first argument, as an operation named ``tag:<name of the tag>``.
+    """
+    operation = 'tag:%s' % func.__name__
+    
+    @wraps(func)
+    def wrapper(relationship, *args, **kwargs):
+        if _backend is None:
+            return func(relationship, *args, **kwargs)
+        return measure(getattr(relationship, 'name', relationship), operation,
+                       func, (relationship,) + args, kwargs)
+    return wrapper
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import (BULK_BATCH_SIZE, Relationship, get_relationship,
+    _relationship_registry)
+
+
+class Command(BaseCommand):
+    help = ('Stores the connections of symmetric relationships canonically, '
+            'removing connections duplicated in both directions.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('relationships', nargs='*', metavar='relationship',
+            help='Names of the relationships to collapse connections of. '
+                 'Defaults to all symmetric relationships.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Number of connections to process per transaction.')
+    
+    def handle(self, *args, **options):
+        names = options['relationships']
+        if names:
+            try:
+                relationships = [get_relationship(name) for name in names]
+            except Relationship.DoesNotExist as e:
+                raise CommandError('Unknown relationship: %s' % e)
+        else:
+            relationships = [relationship
+                             for relationship in _relationship_registry.values()
+                             if relationship.symmetric]
+        
+        for relationship in relationships:
+            if not relationship.symmetric:
+                raise CommandError('Relationship "%s" is not symmetric' %
+                                   relationship.name)
+            removed, reversed_ = relationship.collapse_connections(
+                batch_size=options['batch_size'])
+            if options['verbosity'] > 0:
+                self.stdout.write('Collapsed connections of "%s": %d removed, '
+                                  '%d reversed' % (relationship.name, removed, reversed_))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Relationship, get_relationship, _relationship_registry
+from ...transfer import CHUNK_SIZE, FORMATS, export_connections
+
+
+class Command(BaseCommand):
+    help = ('Writes the connections of relationships as JSON lines or CSV '
+            'rows, streaming them from the database.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('relationships', nargs='*', metavar='relationship',
+            help='Names of the relationships to export. '
+                 'Defaults to all relationships.')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl',
+            help='Format of the output. Defaults to "jsonl".')
+        parser.add_argument('-o', '--output', default='-',
+            help='File to write to. Defaults to standard output.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Number of connections to fetch from the database at a time.')
+    
+    def handle(self, *args, **options):
+        names = options['relationships']
+        if names:
+            try:
+                relationships = [get_relationship(name) for name in names]
+            except Relationship.DoesNotExist as e:
+                raise CommandError('Unknown relationship: %s' % e)
+        else:
+            relationships = list(_relationship_registry.values())
+        
+        if options['output'] == '-':
+            count = export_connections(relationships, self.stdout,
+                                       options['format'], options['chunk_size'])
+        else:
+            with open(options['output'], 'w') as stream:
+                count = export_connections(relationships, stream,
+                                           options['format'], options['chunk_size'])
+        if options['verbosity'] > 0:
+            self.stderr.write('Exported %d connections' % count)
@@ -0,0 +1,122 @@
+import multiprocessing
+import sys
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections as db_connections, router
+
+from ...models import (BULK_BATCH_SIZE, Connection, Relationship,
+    get_relationship)
+from ...transfer import (FORMATS, import_connections, import_file,
+    read_connections, refresh_relationships, scan_connections, split_range,
+    validate_connections)
+
+
+def _import_range(args):
+    return import_file(*args)
+
+
+class Command(BaseCommand):
+    help = ('Creates connections from JSON lines or CSV rows, as written by '
+            'connections_export, skipping those that already exist.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+            help='File to read from, or "-" for standard input.')
+        parser.add_argument('--format', choices=FORMATS,
+            help='Format of the input. Defaults to "csv" for files ending '
+                 'in ".csv" and "jsonl" otherwise.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Number of connections to insert per query, on databases '
+                 'other than PostgreSQL.')
+        parser.add_argument('--workers', type=int, default=1,
+            help='Number of processes to import with, each importing the '
+                 'connections from a range of source objects.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+            help='Check that relationships and connected objects exist, '
+                 'without importing anything.')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        self.verbosity = options['verbosity']
+        try:
+            if options['dry_run']:
+                self.validate(path, format, options['batch_size'])
+            elif options['workers'] > 1:
+                self.import_parallel(path, format, options['batch_size'],
+                                     options['workers'])
+            else:
+                self.import_serial(path, format, options['batch_size'])
+        except (IOError, ValueError) as e:
+            raise CommandError(e)
+    
+    @contextmanager
+    def open(self, path):
+        if path == '-':
+            yield sys.stdin
+        else:
+            with open(path) as stream:
+                yield stream
+    
+    def validate(self, path, format, batch_size):
+        with self.open(path) as stream:
+            count, errors = validate_connections(read_connections(stream, format),
+                                                 batch_size=batch_size)
+        for error in errors:
+            self.stderr.write(error)
+        if errors:
+            raise CommandError('%d of %d connections are invalid' %
+                               (len(errors), count))
+        if self.verbosity > 0:
+            self.stdout.write('%d connections are valid' % count)
+    
+    def import_serial(self, path, format, batch_size):
+        progress = None
+        if self.verbosity > 1:
+            progress = lambda count: self.stderr.write('Read %d connections' % count)
+        with self.open(path) as stream:
+            created = import_connections(read_connections(stream, format),
+                                         batch_size=batch_size, progress=progress)
+        if self.verbosity > 0:
+            self.stdout.write('Imported %d connections' % created)
+    
+    def import_parallel(self, path, format, batch_size, workers):
+        if path == '-':
+            raise CommandError('Importing with workers needs a file, '
+                               'not standard input')
+        if db_connections[router.db_for_write(Connection)].vendor == 'sqlite':
+            raise CommandError('SQLite does not support concurrent writers, '
+                               'import with a single worker instead')
+        with open(path) as stream:
+            names, min_pk, max_pk = scan_connections(read_connections(stream, format))
+        if min_pk is None:
+            return
+        try:
+            relationships = [get_relationship(name) for name in names]
+        except Relationship.DoesNotExist as e:
+            raise CommandError('Unknown relationship: %s' % e)
+        
+        # Forked workers must not share the database connections of the
+        # parent, and must inherit its configured Django.
+        for connection in db_connections.all():
+            connection.close()
+        if hasattr(multiprocessing, 'get_context'):
+            pool = multiprocessing.get_context('fork').Pool(workers)
+        else:  # pragma: no cover
+            pool = multiprocessing.Pool(workers)
+        tasks = [(path, format, start, stop, batch_size)
+                 for start, stop in split_range(min_pk, max_pk, workers)]
+        created = 0
+        try:
+            for count in pool.imap_unordered(_import_range, tasks):
+                created += count
+                if self.verbosity > 1:
+                    self.stderr.write('Imported %d connections' % created)
+        finally:
+            pool.close()
+            pool.join()
+        
+        refresh_relationships(relationships)
+        if self.verbosity > 0:
+            self.stdout.write('Imported %d connections' % created)
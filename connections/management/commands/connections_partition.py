@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...partitioning import partition_connections
+
+
+class Command(BaseCommand):
+    help = ('Partitions the connections table by relationship on PostgreSQL, '
+            'as given by the partition names of the relationships.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to partition the connections table of.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+            help='Print the SQL statements without running them.')
+    
+    def handle(self, *args, **options):
+        try:
+            statements = partition_connections(using=options['database'],
+                                               dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(e)
+        
+        if options['dry_run']:
+            for sql in statements:
+                self.stdout.write('%s;' % sql)
+        elif options['verbosity'] > 0:
+            if statements:
+                self.stdout.write('Partitioned the connections table')
+            else:
+                self.stdout.write('The connections table is already partitioned')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import (BULK_BATCH_SIZE, Relationship, get_relationship,
+    _relationship_registry)
+
+
+class Command(BaseCommand):
+    help = ('Deletes the expired connections of relationships with a TTL, '
+            'in batches.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('relationships', nargs='*', metavar='relationship',
+            help='Names of the relationships to purge. Defaults to all '
+                 'relationships with a TTL.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Number of connections to delete per statement.')
+        parser.add_argument('--sleep', type=float, default=0,
+            help='Seconds to sleep between batches.')
+    
+    def handle(self, *args, **options):
+        names = options['relationships']
+        if names:
+            try:
+                relationships = [get_relationship(name) for name in names]
+            except Relationship.DoesNotExist as e:
+                raise CommandError('Unknown relationship: %s' % e)
+        else:
+            relationships = [relationship
+                             for relationship in _relationship_registry.values()
+                             if relationship.ttl is not None]
+        
+        for relationship in relationships:
+            deleted = relationship.purge_expired(batch_size=options['batch_size'],
+                                                 pause=options['sleep'])
+            if options['verbosity'] > 0:
+                self.stdout.write('Purged %d connections of "%s"'
+                                  % (deleted, relationship.name))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import (BULK_BATCH_SIZE, Relationship, get_relationship,
+    _relationship_registry)
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the closure of relationships that keep one, '
+            'replacing the stored closure.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('relationships', nargs='*', metavar='relationship',
+            help='Names of the relationships to rebuild the closure of. '
+                 'Defaults to all relationships that keep a closure.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Number of ancestors to process per transaction.')
+    
+    def handle(self, *args, **options):
+        names = options['relationships']
+        if names:
+            try:
+                relationships = [get_relationship(name) for name in names]
+            except Relationship.DoesNotExist as e:
+                raise CommandError('Unknown relationship: %s' % e)
+        else:
+            relationships = [relationship
+                             for relationship in _relationship_registry.values()
+                             if relationship.closure]
+        
+        for relationship in relationships:
+            if not relationship.closure:
+                raise CommandError('Relationship "%s" does not keep a '
+                                   'closure' % relationship.name)
+            relationship.rebuild_closure(batch_size=options['batch_size'])
+            if options['verbosity'] > 0:
+                self.stdout.write('Rebuilt closure of "%s"' % relationship.name)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import (BULK_BATCH_SIZE, Relationship, get_relationship,
+    _relationship_registry)
+
+
+class Command(BaseCommand):
+    help = ('Recounts the connections of relationships that maintain '
+            'counters, replacing the stored counters.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('relationships', nargs='*', metavar='relationship',
+            help='Names of the relationships to rebuild counters for. '
+                 'Defaults to all relationships that maintain counters.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Number of nodes to recount per transaction.')
+    
+    def handle(self, *args, **options):
+        names = options['relationships']
+        if names:
+            try:
+                relationships = [get_relationship(name) for name in names]
+            except Relationship.DoesNotExist as e:
+                raise CommandError('Unknown relationship: %s' % e)
+        else:
+            relationships = [relationship
+                             for relationship in _relationship_registry.values()
+                             if relationship.counters]
+        
+        for relationship in relationships:
+            if not relationship.counters:
+                raise CommandError('Relationship "%s" does not maintain '
+                                   'counters' % relationship.name)
+            relationship.rebuild_counters(batch_size=options['batch_size'])
+            if options['verbosity'] > 0:
+                self.stdout.write('Rebuilt counters for "%s"' % relationship.name)
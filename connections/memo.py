@@ -0,0 +1,153 @@
+"""
+Request-scoped memoization of connection lookups.
+
+Within ``memoize()``, or during requests handled by
+``connections.middleware.MemoizeConnectionsMiddleware``, the results of
+``connection_exists`` and ``get_connection``, and so of the template tags
+built on them, are kept in an ``IdentityMap``, so that looking up the same
+pair again costs no query. Connections created or removed through
+relationships in the meantime update the map.
+
+So are the results of ``connected_object_ids`` and
+``connected_to_object_ids`` of relationships defined with
+``memoize_ids=True``, which then return a ``frozenset`` instead of a query
+set, and can't be filtered further or used as a subquery. Other
+relationships aren't affected.
+
+The map is kept in a context variable, so that concurrent requests served
+by coroutines each get their own.
+"""
+
+from contextlib import contextmanager
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    # Python < 3.7
+    import threading
+    
+    class ContextVar(object):
+        def __init__(self, name, default=None):
+            self._local = threading.local()
+            self._default = default
+        
+        def get(self):
+            return getattr(self._local, 'value', self._default)
+        
+        def set(self, value):
+            self._local.value = value
+
+from .cache import IN, OUT
+
+
+_current = ContextVar('connections_identity_map', default=None)
+
+
+class IdentityMap(object):
+    """
+    Maps ``(relationship_id, from_pk, to_pk)`` keys, as stored, to whether
+    the objects are connected and to their ``Connection``, and
+    ``(relationship_id, side, pk)`` keys to the ``frozenset`` of IDs of the
+    objects connected to the node on ``side``.
+    """
+    def __init__(self):
+        self.exists = {}
+        self.connections = {}
+        self.adjacency = {}
+    
+    def connection_exists(self, relationship, from_pk, to_pk):
+        """
+        Returns whether the given objects are connected, or ``None`` if
+        that's not known.
+        """
+        key = (relationship.id, from_pk, to_pk)
+        if key in self.exists:
+            return self.exists[key]
+        ids = self.adjacency.get((relationship.id, OUT, from_pk))
+        if ids is None:
+            ids = self.adjacency.get((relationship.id, IN, to_pk))
+            return None if ids is None else from_pk in ids
+        return to_pk in ids
+    
+    def created(self, relationship, connections):
+        for connection in connections:
+            key = (relationship.id, connection.from_pk, connection.to_pk)
+            self.exists[key] = True
+            self.connections[key] = connection
+        self._update(relationship, connections, True)
+    
+    def removed(self, relationship, connections):
+        for connection in connections:
+            key = (relationship.id, connection.from_pk, connection.to_pk)
+            self.exists[key] = False
+            self.connections[key] = None
+        self._update(relationship, connections, False)
+    
+    def _update(self, relationship, connections, connected):
+        pairs = relationship._directed((connection.from_pk, connection.to_pk)
+                                       for connection in connections)
+        for from_pk, to_pk in pairs:
+            for side, pk, other_pk in ((OUT, from_pk, to_pk), (IN, to_pk, from_pk)):
+                key = (relationship.id, side, pk)
+                ids = self.adjacency.get(key)
+                if ids is not None:
+                    self.adjacency[key] = (ids | set([other_pk]) if connected
+                                           else ids - set([other_pk]))
+    
+    def clear(self):
+        """
+        Forgets everything, e.g. after connections were written with raw SQL.
+        """
+        self.exists.clear()
+        self.connections.clear()
+        self.adjacency.clear()
+
+
+def created(relationship, connections):
+    """
+    Updates the identity map of the current context, if any, after the
+    given connections were created.
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.created(relationship, connections)
+
+
+def removed(relationship, connections):
+    """
+    Updates the identity map of the current context, if any, after the
+    given connections were removed.
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.removed(relationship, connections)
+
+
+def get_identity_map():
+    """
+    Returns the identity map of the current context, or ``None`` if lookups
+    are not memoized.
+    """
+    return _current.get()
+
+
+def set_identity_map(identity_map):
+    """
+    Sets the identity map of the current context; ``None`` stops memoizing.
+    """
+    _current.set(identity_map)
+
+
+@contextmanager
+def memoize():
+    """
+    Memoizes lookups of connections within the block, outside of requests,
+    e.g. in tasks. Yields the ``IdentityMap``.
+    """
+    previous = get_identity_map()
+    identity_map = IdentityMap()
+    set_identity_map(identity_map)
+    try:
+        yield identity_map
+    finally:
+        set_identity_map(previous)
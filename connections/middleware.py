@@ -0,0 +1,42 @@
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # pragma: no cover
+    # Django < 1.10
+    MiddlewareMixin = object
+
+from . import memo, replicas
+
+
+class ReadYourWritesMiddleware(MiddlewareMixin):
+    """
+    Pins reads of connections to primary databases during requests of
+    clients that created or removed connections in the last
+    ``CONNECTIONS_PIN_SECONDS``, tracked with a cookie. See
+    ``connections.replicas``.
+    """
+    def process_request(self, request):
+        replicas.unpin()
+        if request.COOKIES.get(replicas.COOKIE_NAME):
+            replicas.pin()
+        request._connections_pinned_until = replicas.pinned_until()
+    
+    def process_response(self, request, response):
+        if replicas.pinned_until() > getattr(request, '_connections_pinned_until', 0):
+            # connections were written during this request
+            response.set_cookie(replicas.COOKIE_NAME, '1',
+                                max_age=replicas.pin_seconds(), httponly=True)
+        replicas.unpin()
+        return response
+
+
+class MemoizeConnectionsMiddleware(MiddlewareMixin):
+    """
+    Memoizes lookups of connections for the duration of each request. See
+    ``connections.memo``.
+    """
+    def process_request(self, request):
+        memo.set_identity_map(memo.IdentityMap())
+    
+    def process_response(self, request, response):
+        memo.set_identity_map(None)
+        return response
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Connection',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('relationship_name', models.CharField(max_length=50)),
+                ('from_pk', models.IntegerField()),
+                ('to_pk', models.IntegerField()),
+                ('weight', models.FloatField(blank=True, default=1.0)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConnectionCounter',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('relationship_name', models.CharField(max_length=50)),
+                ('side', models.CharField(max_length=3, choices=[('out', 'out'), ('in', 'in')])),
+                ('object_pk', models.IntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='connectioncounter',
+            unique_together=set([('relationship_name', 'side', 'object_pk')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='connection',
+            unique_together=set([('relationship_name', 'from_pk', 'to_pk')]),
+        ),
+    ]
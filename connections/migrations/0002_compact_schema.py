@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import zlib
+
+from django.db import migrations, models
+
+
+def _relationship_id(name):
+    # Frozen copy of ``connections.models.get_relationship_id``.
+    return zlib.crc32(name.encode('utf-8')) & 0x7fffffff
+
+
+def names_to_ids(apps, schema_editor):
+    for model_name in ('Connection', 'ConnectionCounter'):
+        model = apps.get_model('connections', model_name)
+        objects = model.objects.using(schema_editor.connection.alias)
+        names = objects.values_list('relationship_name', flat=True).distinct()
+        for name in list(names):
+            objects.filter(relationship_name=name).update(
+                relationship_id=_relationship_id(name))
+
+
+def ids_to_names(apps, schema_editor):
+    # IDs can't be turned back into names without the relationships, so this
+    # relies on them being registered, e.g. by ``relationships.py`` modules
+    # autodiscovered at start-up.
+    from connections.models import _relationship_registry
+    for model_name in ('Connection', 'ConnectionCounter'):
+        model = apps.get_model('connections', model_name)
+        objects = model.objects.using(schema_editor.connection.alias)
+        for name in _relationship_registry:
+            objects.filter(relationship_id=_relationship_id(name)).update(
+                relationship_name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='relationship_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='connectioncounter',
+            name='relationship_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='relationship_name',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='connectioncounter',
+            name='relationship_name',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.RunPython(names_to_ids, ids_to_names),
+        migrations.AlterUniqueTogether(
+            name='connection',
+            unique_together=set([]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='connectioncounter',
+            unique_together=set([]),
+        ),
+        migrations.RemoveField(
+            model_name='connection',
+            name='relationship_name',
+        ),
+        migrations.RemoveField(
+            model_name='connectioncounter',
+            name='relationship_name',
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='relationship_id',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='connectioncounter',
+            name='relationship_id',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='from_pk',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='to_pk',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='connectioncounter',
+            name='object_pk',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='connection',
+            unique_together=set([('relationship_id', 'from_pk', 'to_pk')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='connectioncounter',
+            unique_together=set([('relationship_id', 'side', 'object_pk')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='connection',
+            index_together=set([('relationship_id', 'to_pk', 'from_pk')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0002_compact_schema'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='connection',
+            index_together=set([
+                ('relationship_id', 'to_pk', 'from_pk'),
+                ('relationship_id', 'from_pk', 'date', 'id'),
+                ('relationship_id', 'to_pk', 'date', 'id'),
+            ]),
+        ),
+    ]
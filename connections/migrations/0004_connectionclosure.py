@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0003_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionClosure',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('relationship_id', models.IntegerField()),
+                ('ancestor_pk', models.BigIntegerField()),
+                ('descendant_pk', models.BigIntegerField()),
+                ('depth', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='connectionclosure',
+            unique_together=set([('relationship_id', 'ancestor_pk', 'descendant_pk')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='connectionclosure',
+            index_together=set([('relationship_id', 'descendant_pk', 'ancestor_pk')]),
+        ),
+    ]
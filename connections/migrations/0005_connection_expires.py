@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0004_connectionclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='expires',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='connection',
+            index_together=set([
+                ('relationship_id', 'to_pk', 'from_pk'),
+                ('relationship_id', 'from_pk', 'date', 'id'),
+                ('relationship_id', 'to_pk', 'date', 'id'),
+                ('relationship_id', 'expires', 'id'),
+            ]),
+        ),
+    ]
@@ -1,8 +1,31 @@
+import itertools
+import re
+import time
+import zlib
+from datetime import timedelta
+
+import django
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db import connections as db_connections
+from django.db.models.query import QuerySet
 from django.db.models.signals import post_save, post_delete
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+try:
+    from django.core.signals import setting_changed
+except ImportError:  # pragma: no cover
+    # Django < 1.8
+    from django.test.signals import setting_changed
+
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    # Python 2.6
+    OrderedDict = dict
 
 try:
     from django.apps import apps as loading
@@ -10,11 +33,37 @@ except ImportError:  # pragma: no cover
     # Django < 1.7
     from django.db.models import loading
 
-from .signals import connection_created, connection_removed
+from . import (arrays, closure as _closure, dispatch, memo, pagination,
+    replicas, traversal)
+from .cache import (DEFAULT_TIMEOUT, IN, OUT, AdjacencyCache,
+    discard_now_and_on_commit)
+from .instrumentation import first_rows, instrumented, measure
+from .signals import (connection_created, connection_removed,
+    connections_created_batch, connections_removed_batch)
+from .snapshot import GraphSnapshot
+from .utils import chunked
+
+try:
+    from .aio import AsyncRelationshipMixin
+except SyntaxError:  # pragma: no cover
+    # Python < 3.5
+    class AsyncRelationshipMixin(object):
+        pass
 
 
 NAME_MAX_LENGTH = 50
 
+# Partition names become part of table names.
+PARTITION_RE = re.compile(r'^[a-z0-9_]+$')
+
+# Relationship IDs are derived from relationship names and must fit in
+# a signed 32-bit integer column.
+ID_MASK = 0x7fffffff
+
+# Number of connections written or deleted per query by the bulk methods of
+# ``Relationship``.
+BULK_BATCH_SIZE = 400
+
 
 def get_model(model):
     """
@@ -34,67 +83,235 @@ def get_model(model):
     raise ValueError(model)
 
 
+def get_relationship_id(name):
+    """
+    Returns the integer ID stored in the ``relationship_id`` column of the
+    connections of the relationship with the given name. IDs are a checksum
+    of the name, so they are stable across processes without having to be
+    stored anywhere.
+    """
+    return zlib.crc32(name.encode('utf-8')) & ID_MASK
+
+
 _relationship_registry = {}
 
 
-def define_relationship(name, from_model, to_model):
+def define_relationship(name, from_model, to_model, counters=False,
+                        cache=None, cache_timeout=DEFAULT_TIMEOUT,
+                        using=None, partition=None, symmetric=False, closure=False,
+                        ttl=None, snapshot=False, snapshot_refresh=None,
+                        row_signals=None, memoize_ids=False):
     if name in _relationship_registry:
         raise KeyError(name)
     
-    _from_ctype = from_model
-    _to_ctype = to_model
-    
-    if isinstance(_from_ctype, str):
-        _from_ctype = get_model(_from_ctype)
-    if isinstance(_to_ctype, str):
-        _to_ctype = get_model(_to_ctype)
-    
-    if not isinstance(_from_ctype, ContentType):
-        _from_ctype = ContentType.objects.get_for_model(_from_ctype)
-    if not isinstance(_to_ctype, ContentType):
-        _to_ctype = ContentType.objects.get_for_model(_to_ctype)
+    relationship_id = get_relationship_id(name)
+    for other in _relationship_registry.values():
+        if other.id == relationship_id:
+            raise ValueError('Relationship "%s" has the same ID as "%s"; '
+                             'please pick another name' % (name, other.name))
     
     relationship = Relationship(name=name,
-                                from_content_type=_from_ctype,
-                                to_content_type=_to_ctype)
+                                from_content_type=from_model,
+                                to_content_type=to_model,
+                                counters=counters,
+                                cache=cache,
+                                cache_timeout=cache_timeout,
+                                using=using,
+                                partition=partition,
+                                symmetric=symmetric,
+                                closure=closure,
+                                ttl=ttl,
+                                snapshot=snapshot,
+                                snapshot_refresh=snapshot_refresh,
+                                row_signals=row_signals,
+                                memoize_ids=memoize_ids)
     
     _relationship_registry[name] = relationship
+    if row_signals:
+        _connect_model_signals()
     return relationship
 
 
 def get_relationship(name):
+    """
+    Returns the registered relationship with the given name or ID.
+    """
     if isinstance(name, Relationship):
         return name
+    if isinstance(name, int):
+        for relationship in _relationship_registry.values():
+            if relationship.id == name:
+                return relationship
     if name not in _relationship_registry:
         raise Relationship.DoesNotExist(name)
     return _relationship_registry[name]
 
 
+def get_relationships(*names):
+    """
+    Returns a ``RelationshipSet`` of the registered relationships with the
+    given names or IDs.
+    """
+    return RelationshipSet(names)
+
+
+def _resolve_model(model):
+    if isinstance(model, ContentType):
+        return model.model_class()
+    return get_model(model)
+
+
+def _concrete_model(model):
+    return model._meta.concrete_model
+
+
+def _model_label(model):
+    """
+    Returns the ``app_label.modelname`` label of the given model class,
+    model name or content type, without touching the app registry.
+    """
+    if isinstance(model, ContentType):
+        return '%s.%s' % (model.app_label, model.model)
+    if isinstance(model, str):
+        return model.lower()
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
 class RelationshipDoesNotExist(ObjectDoesNotExist):
     """
     Exception thrown when a relationship is not found in the registry.
     """
 
 
-class Relationship(object):
+class Relationship(AsyncRelationshipMixin):
     """
     Represents a predefined type of connection between two nodes in a
     (directed) graph. You may imagine relationships as the *"flavour"*
     of an edge in the graph.
     """
     DoesNotExist = RelationshipDoesNotExist
+    SearchLimitExceeded = traversal.SearchLimitExceeded
     
-    def __init__(self, name, from_content_type, to_content_type):
+    def __init__(self, name, from_content_type, to_content_type,
+                 counters=False, cache=None, cache_timeout=DEFAULT_TIMEOUT,
+                 using=None, partition=None, symmetric=False, closure=False,
+                 ttl=None, snapshot=False, snapshot_refresh=None,
+                 row_signals=None, memoize_ids=False):
+        """
+        ``from_content_type`` and ``to_content_type`` may be ``ContentType``
+        instances, model classes or model names as ``app_label.ModelName``.
+        Models and content types are only resolved on first use, so that
+        relationships may be defined before the app registry is ready and
+        without touching the database.
+        
+        ``using`` is the alias of the database holding the connections and
+        counters of the relationship, as routed by
+        ``connections.routers.RelationshipRouter``. ``partition`` names the
+        PostgreSQL partition of the connections table holding them, see
+        ``connections.partitioning``.
+        
+        Connections of ``symmetric`` relationships go both ways, and are
+        stored once, from the object with the lower primary key to the
+        other. Both sides must be the same model.
+        
+        Relationships defined with ``closure`` keep the transitive closure
+        of their connections, see ``connections.closure``. Both sides must
+        be the same model, and connections must not form cycles.
+        
+        Connections of relationships defined with a ``ttl``, a ``timedelta``
+        or a number of seconds, expire that long after they're created and
+        are ignored from then on, until purged. Such relationships can't
+        maintain counters, a closure or a cache, which would go on counting
+        expired connections.
+        
+        Relationships defined with ``snapshot`` answer the most common
+        lookups from a copy of their connections kept in memory, refreshed
+        every ``snapshot_refresh`` seconds if given, see
+        ``connections.snapshot``. They can't have a TTL.
+        
+        ``row_signals`` turns the ``connection_created`` and
+        ``connection_removed`` signals, and following connections saved or
+        deleted through ``Connection`` instances and query sets, on or off
+        for the relationship. It defaults to ``CONNECTIONS_ROW_SIGNALS``.
+        
+        Relationships defined with ``memoize_ids`` memoize
+        ``connected_object_ids()`` and ``connected_to_object_ids()`` along
+        with other lookups, see ``connections.memo``.
+        """
         assert len(name) <= NAME_MAX_LENGTH
-        assert isinstance(from_content_type, ContentType)
-        assert isinstance(to_content_type, ContentType)
+        if partition is not None and not PARTITION_RE.match(partition):
+            raise ValueError('Invalid partition name "%s"' % partition)
+        if symmetric and _model_label(from_content_type) != _model_label(to_content_type):
+            raise ValueError('Symmetric relationship "%s" must connect a model '
+                             'with itself' % name)
+        if closure and (symmetric or
+                        _model_label(from_content_type) != _model_label(to_content_type)):
+            raise ValueError('Relationship "%s" with a closure must connect a model '
+                             'with itself, one way' % name)
+        if ttl is not None and (counters or closure or cache):
+            raise ValueError('Relationship "%s" with a TTL can\'t maintain counters, '
+                             'a closure or a cache' % name)
+        if ttl is not None and snapshot:
+            raise ValueError('Relationship "%s" with a TTL can\'t keep a '
+                             'snapshot' % name)
+        if ttl is not None and not isinstance(ttl, timedelta):
+            ttl = timedelta(seconds=ttl)
         self.name = name
-        self.from_content_type = from_content_type
-        self.to_content_type = to_content_type
+        self.id = get_relationship_id(name)
+        self._from = from_content_type
+        self._to = to_content_type
+        self.counters = counters
+        self.cache = AdjacencyCache(self, cache, cache_timeout) if cache else None
+        self.using = using
+        self.partition = partition
+        self.symmetric = symmetric
+        self.closure = closure
+        self.ttl = ttl
+        self.snapshot = (GraphSnapshot(self, snapshot_refresh)
+                         if snapshot else None)
+        self._row_signals = row_signals
+        self.memoize_ids = memoize_ids
     
     def __str__(self):
-        return '%s (%s -> %s)' % (self.name, self.from_content_type,
-                                  self.to_content_type)
+        return '%s (%s -> %s)' % (self.name, self.from_model._meta.verbose_name,
+                                  self.to_model._meta.verbose_name)
+    
+    @property
+    def row_signals(self):
+        """
+        Whether ``connection_created`` and ``connection_removed`` are sent for
+        each connection of the relationship, and saving or deleting
+        ``Connection`` instances updates its counters and caches.
+        """
+        if self._row_signals is None:
+            return row_signals()
+        return self._row_signals
+    
+    @cached_property
+    def from_model(self):
+        """
+        The model class of the objects acting as source.
+        """
+        return _resolve_model(self._from)
+    
+    @cached_property
+    def to_model(self):
+        """
+        The model class of the objects acting as destination.
+        """
+        return _resolve_model(self._to)
+    
+    @cached_property
+    def from_content_type(self):
+        if isinstance(self._from, ContentType):
+            return self._from
+        return ContentType.objects.get_for_model(self.from_model)
+    
+    @cached_property
+    def to_content_type(self):
+        if isinstance(self._to, ContentType):
+            return self._to
+        return ContentType.objects.get_for_model(self.to_model)
     
     def _validate_ctypes(self, from_obj, to_obj):
         """
@@ -102,95 +319,563 @@ class Relationship(object):
         relationship. If validation fails, ``AssertionError`` will be raised.
         """
         if from_obj:
-            from_ctype = ContentType.objects.get_for_model(from_obj)
-            assert from_ctype.natural_key() == self.from_content_type.natural_key(), (
+            assert _concrete_model(from_obj) is _concrete_model(self.from_model), (
                 'Relationship "%s" does not support connections '
-                'from "%s" types' % (self.name, from_ctype))
+                'from "%s" types' % (self.name, from_obj._meta.model_name))
         if to_obj:
-            to_ctype = ContentType.objects.get_for_model(to_obj)
-            assert to_ctype.natural_key() == self.to_content_type.natural_key(), (
+            assert _concrete_model(to_obj) is _concrete_model(self.to_model), (
                 'Relationship "%s" does not support connections '
-                'to "%s" types' % (self.name, to_ctype))
+                'to "%s" types' % (self.name, to_obj._meta.model_name))
+    
+    def _validate_pairs(self, pairs):
+        """
+        Validates the content types of a sequence of ``(from_obj, to_obj)``
+        pairs, checking each distinct combination of model classes only once.
+        """
+        seen = set()
+        for from_obj, to_obj in pairs:
+            key = (type(from_obj), type(to_obj))
+            if key not in seen:
+                self._validate_ctypes(from_obj, to_obj)
+                seen.add(key)
     
     @property
     def connections(self):
         """
         Returns a query set matching all connections of this relationship.
+        The relationship is passed to database routers as the
+        ``relationship`` hint of the query set and any derived from it.
+        """
+        return self._connections()
+    
+    def _connections(self, *nodes):
+        """
+        Returns ``connections``, passing the given ``(side, pk)`` pairs of
+        the nodes the query is about to database routers as the ``nodes``
+        hint. Expired connections are left out.
         """
-        return Connection.objects.filter(relationship_name=self.name)
+        qs = self._all_connections(*nodes)
+        if self.ttl is not None:
+            qs = qs.filter(_live_q())
+        return qs
     
+    def _all_connections(self, *nodes):
+        """
+        Returns ``_connections()``, including expired connections.
+        """
+        return (Connection.objects.db_manager(hints={'relationship': self, 'nodes': nodes})
+                .filter(relationship_id=self.id))
+    
+    def _expires(self):
+        """
+        Returns when connections created now expire, or ``None``.
+        """
+        return timezone.now() + self.ttl if self.ttl is not None else None
+    
+    @property
+    def db_for_write(self):
+        """
+        The alias of the database connections of this relationship are
+        written to.
+        """
+        return router.db_for_write(Connection, relationship=self)
+    
+    def canonical_pair(self, from_pk, to_pk):
+        """
+        Returns the ``(from_pk, to_pk)`` pair a connection between the
+        objects with the given primary keys is stored as, which for
+        symmetric relationships starts from the lower key.
+        """
+        if self.symmetric and to_pk < from_pk:
+            return to_pk, from_pk
+        return from_pk, to_pk
+    
+    def _directed(self, pairs):
+        """
+        Returns the given stored ``(from_pk, to_pk)`` pairs, along with their
+        reverse for symmetric relationships.
+        """
+        pairs = list(pairs)
+        if self.symmetric:
+            pairs += [(to_pk, from_pk) for from_pk, to_pk in pairs]
+        return pairs
+    
+    def _adjacency(self, side, pks, weight=False, flat=False):
+        """
+        Returns an iterable of ``(pk, other_pk)`` rows, or
+        ``(pk, other_pk, weight)`` rows if ``weight``, for each connection of
+        each of the nodes with the given ``pks`` on ``side``, or of the
+        ``other_pk`` values alone if ``flat``. For symmetric relationships,
+        connections stored either way are matched with a single ``UNION``
+        of two indexed queries.
+        """
+        field, other = ('from_pk', 'to_pk') if side == OUT else ('to_pk', 'from_pk')
+        qs = self._connections(*[(side, pk) for pk in pks])
+        
+        def rows(field, other):
+            rows = qs.filter(**{'%s__in' % field: pks})
+            if flat:
+                return rows.values_list(other, flat=True)
+            return rows.values_list(field, other, *(('weight',) if weight else ()))
+        
+        if not self.symmetric:
+            return rows(field, other)
+        return _union(rows(field, other).order_by(), rows(other, field).order_by(),
+                      all=not flat)
+    
+    @instrumented
     def create_connection(self, from_obj, to_obj):
         """
         Creates and returns a connection between the given objects. If a
-        connection already exists, that connection will be returned instead.
+        connection already exists, that connection will be returned instead,
+        and for relationships with a TTL, renewed.
         """
         self._validate_ctypes(from_obj, to_obj)
-        return Connection.objects.get_or_create(relationship_name=self.name,
-                                                from_pk=from_obj.pk, to_pk=to_obj.pk)[0]
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        if self.row_signals and self.ttl is None:
+            # ``post_save`` takes care of counters, caches and signals.
+            return self.connections.get_or_create(relationship_id=self.id,
+                                                  from_pk=from_pk, to_pk=to_pk)[0]
+        return self._create_connection(from_pk, to_pk)
+    
+    def _create_connection(self, from_pk, to_pk):
+        """
+        Creates or renews the connection between the given stored pair in a
+        transaction, updating counters, caches and the closure without the
+        help of ``post_save``.
+        """
+        using = self.db_for_write
+        with transaction.atomic(using=using):
+            connection, created = self._all_connections().using(using).get_or_create(
+                relationship_id=self.id, from_pk=from_pk, to_pk=to_pk,
+                defaults={'expires': self._expires()})
+            if created and not self.row_signals:
+                _connection_created(self, connection, using)
+            elif not created and self.ttl is not None:
+                _renew(self, [connection], using)
+        return connection
+    
+    @instrumented
+    def create_connections(self, pairs):
+        """
+        Creates connections between each of the given ``(from_obj, to_obj)``
+        pairs, skipping those that are already connected. Connections are
+        inserted ``BULK_BATCH_SIZE`` at a time, costing a few queries per
+        batch instead of a few queries per connection.
+        
+        Returns a list of the newly created ``Connection`` instances. The
+        ``connection_created`` signal is sent for each of them, unless
+        disabled by ``row_signals``, but ``post_save`` is not.
+        
+        For relationships with a TTL, existing connections are renewed, and
+        expired ones are returned as created.
+        """
+        pairs = _unique_pairs(pairs)
+        self._validate_pairs(pairs)
+        
+        using = self.db_for_write
+        qs = self._all_connections().using(using)
+        created = []
+        for chunk in chunked(pairs, BULK_BATCH_SIZE):
+            keys = self._keys(chunk)
+            with transaction.atomic(using=using):
+                if self.ttl is None:
+                    existing = set(qs.filter(_pairs_q(keys))
+                                   .values_list('from_pk', 'to_pk'))
+                else:
+                    found = list(qs.filter(_pairs_q(keys)))
+                    existing = set((c.from_pk, c.to_pk) for c in found)
+                    created.extend(_renew(self, found, using))
+                keys = [key for key in keys if key not in existing]
+                if not keys:
+                    continue
+                expires = self._expires()
+                _bulk_insert([Connection(relationship_id=self.id, from_pk=from_pk,
+                                         to_pk=to_pk, expires=expires)
+                              for from_pk, to_pk in keys], using=using)
+                _update_counters(self, self._directed(keys), 1)
+                _update_closure(self, keys, True)
+                connections = list(qs.filter(_pairs_q(keys)))
+            _notify_created(self, connections, using)
+            created.extend(connections)
+        return created
+    
+    @instrumented(rows=lambda removed: removed)
+    def remove_connections(self, pairs):
+        """
+        Removes any connections between each of the given
+        ``(from_obj, to_obj)`` pairs. Connections are deleted
+        ``BULK_BATCH_SIZE`` at a time, costing two queries per batch.
+        
+        Returns the number of connections removed. The ``connection_removed``
+        signal is sent for each of them, unless disabled by ``row_signals``,
+        but ``post_delete`` is not.
+        """
+        pairs = _unique_pairs(pairs)
+        self._validate_pairs(pairs)
+        
+        using = self.db_for_write
+        qs = self.connections.using(using)
+        removed = 0
+        for chunk in chunked(pairs, BULK_BATCH_SIZE):
+            keys = self._keys(chunk)
+            with transaction.atomic(using=using):
+                connections = list(qs.filter(_pairs_q(keys)))
+                if not connections:
+                    continue
+                pks = [connection.pk for connection in connections]
+                qs.filter(pk__in=pks)._raw_delete(using)
+                _update_counters(self, self._directed(
+                    (connection.from_pk, connection.to_pk)
+                    for connection in connections), -1)
+                _update_closure(self, [(connection.from_pk, connection.to_pk)
+                                       for connection in connections], False)
+            _notify_removed(self, connections, using)
+            removed += len(connections)
+        return removed
+    
+    @instrumented(rows=lambda removed: removed)
+    def remove_object_connections(self, obj):
+        """
+        Removes all connections from and to the given object, e.g. when it's
+        deleted. Connections are deleted ``BULK_BATCH_SIZE`` at a time,
+        costing two queries per batch, and counters, caches and signals are
+        updated as by ``remove_connections()``.
+        
+        Returns the number of connections removed.
+        """
+        model = _concrete_model(obj)
+        nodes = []
+        q = models.Q()
+        if model is _concrete_model(self.from_model):
+            nodes.append((OUT, obj.pk))
+            q |= models.Q(from_pk=obj.pk)
+        if model is _concrete_model(self.to_model):
+            nodes.append((IN, obj.pk))
+            q |= models.Q(to_pk=obj.pk)
+        assert nodes, ('Relationship "%s" does not support connections '
+                       'of "%s" types' % (self.name, obj._meta.model_name))
+        
+        using = self.db_for_write
+        qs = self._connections(*nodes).using(using).filter(q)
+        removed = 0
+        while True:
+            with transaction.atomic(using=using):
+                connections = list(qs[:BULK_BATCH_SIZE])
+                if not connections:
+                    break
+                pks = [connection.pk for connection in connections]
+                qs.filter(pk__in=pks)._raw_delete(using)
+                _update_counters(self, self._directed(
+                    (connection.from_pk, connection.to_pk)
+                    for connection in connections), -1)
+                _update_closure(self, [(connection.from_pk, connection.to_pk)
+                                       for connection in connections], False)
+            _notify_removed(self, connections, using)
+            removed += len(connections)
+        return removed
     
+    def _keys(self, pairs):
+        """
+        Returns the distinct stored ``(from_pk, to_pk)`` pairs of the given
+        ``(from_obj, to_obj)`` pairs.
+        """
+        keys = []
+        seen = set()
+        for from_obj, to_obj in pairs:
+            key = self.canonical_pair(from_obj.pk, to_obj.pk)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return keys
+    
+    def _existing_pairs(self, keys, using):
+        """
+        Returns the set of the given stored ``(from_pk, to_pk)`` pairs that
+        are connected on database ``using``.
+        """
+        qs = self._all_connections().using(using)
+        existing = set()
+        for chunk in chunked(list(keys), BULK_BATCH_SIZE):
+            existing.update(qs.filter(_pairs_q(chunk)).values_list('from_pk', 'to_pk'))
+        return existing
+    
+    @instrumented
     def get_connection(self, from_obj, to_obj):
         """
         Returns a ``Connection`` instance for the given objects or ``None`` if
         there's no connection.
         """
         self._validate_ctypes(from_obj, to_obj)
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        identity_map = memo.get_identity_map()
+        key = (self.id, from_pk, to_pk)
+        if identity_map is not None:
+            if key in identity_map.connections:
+                return identity_map.connections[key]
+            if identity_map.connection_exists(self, from_pk, to_pk) is False:
+                return None
         try:
-            return self.connections.get(from_pk=from_obj.pk, to_pk=to_obj.pk)
+            connection = (self._connections((OUT, from_pk), (IN, to_pk))
+                          .get(from_pk=from_pk, to_pk=to_pk))
         except Connection.DoesNotExist:
-            return None
+            connection = None
+        if identity_map is not None:
+            identity_map.connections[key] = connection
+            identity_map.exists[key] = connection is not None
+        return connection
     
+    @instrumented
     def connection_exists(self, from_obj, to_obj):
         """
         Returns ``True`` if a connection between the given objects exists,
         else ``False``.
         """
         self._validate_ctypes(from_obj, to_obj)
-        return self.connections.filter(from_pk=from_obj.pk, to_pk=to_obj.pk).exists()
+        from_pk, to_pk = self.canonical_pair(from_obj.pk, to_obj.pk)
+        identity_map = memo.get_identity_map()
+        if identity_map is None:
+            return self._connection_exists(from_pk, to_pk)
+        exists = identity_map.connection_exists(self, from_pk, to_pk)
+        if exists is None:
+            exists = self._connection_exists(from_pk, to_pk)
+            identity_map.exists[(self.id, from_pk, to_pk)] = exists
+        return exists
+    
+    def _connection_exists(self, from_pk, to_pk):
+        if self.snapshot is not None:
+            return self.snapshot.connection_exists(from_pk, to_pk)
+        if self.cache is not None:
+            ids = self.cache.get(OUT, from_pk)
+            if ids is not None:
+                return to_pk in ids
+        return (self._connections((OUT, from_pk), (IN, to_pk))
+                .filter(from_pk=from_pk, to_pk=to_pk).exists())
     
+    @instrumented
     def connections_from_object(self, from_obj):
         """
         Returns a ``Connection`` query set matching all connections with
-        the given object as a source.
+        the given object as a source, or, for symmetric relationships, with
+        the given object at either end.
         """
         self._validate_ctypes(from_obj, None)
-        return self.connections.filter(from_pk=from_obj.pk)
+        return self._connections((OUT, from_obj.pk)).filter(self._node_q(from_obj.pk, 'from_pk'))
     
+    @instrumented
     def connections_to_object(self, to_obj):
         """
         Returns a ``Connection`` query set matching all connections with
-        the given object as a destination.
+        the given object as a destination, or, for symmetric relationships,
+        with the given object at either end.
         """
         self._validate_ctypes(None, to_obj)
-        return self.connections.filter(to_pk=to_obj.pk)
+        return self._connections((IN, to_obj.pk)).filter(self._node_q(to_obj.pk, 'to_pk'))
+    
+    def _node_q(self, pk, field):
+        if self.symmetric:
+            return models.Q(from_pk=pk) | models.Q(to_pk=pk)
+        return models.Q(**{field: pk})
+    
+    @instrumented(rows=first_rows)
+    def page_connections_from(self, from_obj, after=None, limit=50, reverse=False):
+        """
+        Returns a ``(connections, cursor)`` tuple with a page of at most
+        ``limit`` connections with the given object as a source, ordered by
+        ``(date, id)`` (or newest first if ``reverse`` is ``True``), and a
+        cursor to pass as ``after`` to get the next page, or ``None`` if
+        this is the last page.
+        """
+        return pagination.page(self.connections_from_object(from_obj),
+                               after=after, limit=limit, reverse=reverse)
     
+    @instrumented(rows=first_rows)
+    def page_connections_to(self, to_obj, after=None, limit=50, reverse=False):
+        """
+        Returns a ``(connections, cursor)`` tuple with a page of at most
+        ``limit`` connections with the given object as a destination, ordered
+        by ``(date, id)`` (or newest first if ``reverse`` is ``True``), and a
+        cursor to pass as ``after`` to get the next page, or ``None`` if
+        this is the last page.
+        """
+        return pagination.page(self.connections_to_object(to_obj),
+                               after=after, limit=limit, reverse=reverse)
+    
+    @instrumented
     def connected_objects(self, from_obj):
         """
         Returns a query set matching all connected objects with the given
         object as a source.
         """
-        return self.to_content_type.get_all_objects_for_this_type(pk__in=self.connected_object_ids(from_obj))
+        return self._objects(self.to_model, self.connected_object_ids(from_obj))
     
+    @instrumented
     def connected_object_ids(self, from_obj):
         """
         Returns an iterable of the IDs of all objects connected with the given
-        object as a source (ie. the Connection.to_pk values).
+        object as a source (ie. the Connection.to_pk values): a
+        ``values_list`` query set, or a ``frozenset`` if the relationship is
+        cached or has a snapshot, or, within ``memo.memoize()``, was defined
+        with ``memoize_ids``.
         """
-        return self.connections_from_object(from_obj).values_list('to_pk', flat=True)
+        identity_map = memo.get_identity_map() if self.memoize_ids else None
+        if identity_map is not None:
+            self._validate_ctypes(from_obj, None)
+            return self._memoized_ids(identity_map, OUT, from_obj.pk)
+        if self.snapshot is not None:
+            self._validate_ctypes(from_obj, None)
+            return self.snapshot.get(OUT, from_obj.pk)
+        if self.cache is not None:
+            self._validate_ctypes(from_obj, None)
+            return self.cache.get_many(OUT, [from_obj.pk])[from_obj.pk]
+        self._validate_ctypes(from_obj, None)
+        return self._adjacency(OUT, [from_obj.pk], flat=True)
     
+    @instrumented
     def connected_to_objects(self, to_obj):
         """
         Returns a query set matching all connected objects with the given
         object as a destination.
         """
-        return self.from_content_type.get_all_objects_for_this_type(pk__in=self.connected_to_object_ids(to_obj))
+        return self._objects(self.from_model, self.connected_to_object_ids(to_obj))
     
+    @instrumented
     def connected_to_object_ids(self, to_obj):
         """
         Returns an iterable of the IDs of all objects connected with the given
-        object as a destination (ie. the Connection.from_pk values).
+        object as a destination (ie. the Connection.from_pk values): a
+        ``values_list`` query set, or a ``frozenset`` if the relationship is
+        cached or has a snapshot, or, within ``memo.memoize()``, was defined
+        with ``memoize_ids``.
         """
-        return self.connections_to_object(to_obj).values_list('from_pk', flat=True)
+        identity_map = memo.get_identity_map() if self.memoize_ids else None
+        if identity_map is not None:
+            self._validate_ctypes(None, to_obj)
+            return self._memoized_ids(identity_map, IN, to_obj.pk)
+        if self.snapshot is not None:
+            self._validate_ctypes(None, to_obj)
+            return self.snapshot.get(IN, to_obj.pk)
+        if self.cache is not None:
+            self._validate_ctypes(None, to_obj)
+            return self.cache.get_many(IN, [to_obj.pk])[to_obj.pk]
+        self._validate_ctypes(None, to_obj)
+        return self._adjacency(IN, [to_obj.pk], flat=True)
+    
+    def _memoized_ids(self, identity_map, side, pk):
+        """
+        Returns the ``frozenset`` of IDs of the objects connected to the node
+        with the given ``pk`` on ``side``, from the given
+        ``memo.IdentityMap`` if there.
+        """
+        key = (self.id, side, pk)
+        ids = identity_map.adjacency.get(key)
+        if ids is None:
+            if self.snapshot is not None:
+                ids = self.snapshot.get(side, pk)
+            elif self.cache is not None:
+                ids = self.cache.get_many(side, [pk])[pk]
+            else:
+                ids = self._adjacency(side, [pk], flat=True)
+            ids = identity_map.adjacency[key] = frozenset(ids)
+        return ids
     
+    @instrumented
+    def mutual_connections(self, obj1, obj2):
+        """
+        Returns a query set matching all objects that both given objects are
+        connected with as a source.
+        """
+        self._validate_ctypes(obj1, None)
+        self._validate_ctypes(obj2, None)
+        if self.symmetric:
+            return (self._objects(self.to_model, self._adjacency(OUT, [obj1.pk], flat=True))
+                    .filter(pk__in=self._ids_for(
+                        self.to_model, self._adjacency(OUT, [obj2.pk], flat=True))))
+        others = self.connections.filter(from_pk=obj2.pk).values('to_pk')
+        ids = self.connections.filter(from_pk=obj1.pk, to_pk__in=others).values_list(
+            'to_pk', flat=True)
+        return self._objects(self.to_model, ids)
+    
+    def _objects(self, model, ids):
+        """
+        Returns a query set matching the objects of ``model`` with the given
+        IDs, see ``_ids_for()``.
+        """
+        return model._base_manager.filter(pk__in=self._ids_for(model, ids))
+    
+    def _ids_for(self, model, ids):
+        """
+        Returns the given IDs, ready to filter objects of ``model`` by. A
+        query set of IDs is only used as a subquery if ``model`` is read from
+        the same database as the connections, as subqueries are compiled for
+        the database of the outer query. Otherwise its IDs are read first.
+        """
+        if isinstance(ids, QuerySet) and ids.db != router.db_for_read(model):
+            return list(ids)
+        return ids
+    
+    @instrumented
+    def common_neighbors_count(self, from_obj, candidates):
+        """
+        Returns a dictionary mapping the primary key of each of the given
+        candidate objects to the number of objects connected with
+        ``from_obj`` as a source that are also connected with the candidate
+        as a source, e.g. how many of the users followed by ``from_obj`` also
+        follow each candidate. Costs a single query.
+        """
+        self._validate_ctypes(from_obj, None)
+        candidates = list(candidates)
+        self._validate_pairs((None, candidate) for candidate in candidates)
+        counts = dict.fromkeys((candidate.pk for candidate in candidates), 0)
+        neighbors = self._adjacency(OUT, [from_obj.pk], flat=True)
+        for chunk in chunked(list(counts), BULK_BATCH_SIZE):
+            rows = _union(*[self.connections
+                            .filter(**{'%s__in' % field: neighbors, '%s__in' % other: chunk})
+                            .values_list(other)
+                            .annotate(models.Count('pk'))
+                            .order_by()
+                            for field, other in self._orientations()], all=True)
+            for pk, count in rows:
+                counts[pk] += count
+        return counts
+    
+    @instrumented
+    def suggest(self, obj, limit=10):
+        """
+        Returns up to ``limit`` objects that ``obj`` is not connected with,
+        but that the objects it is connected with are, e.g. users followed by
+        the users ``obj`` follows. Results are a list of
+        ``(object, count, weight)`` tuples, ranked by the number of objects
+        through which each suggestion is reached and then by the sum of the
+        ``weight`` of the connections that lead to it.
+        
+        Ranking costs one aggregated query, plus one to fetch the objects.
+        Suggestions of symmetric relationships are ranked in Python, out of
+        all objects two connections away.
+        """
+        self._validate_ctypes(obj, None)
+        neighbors = self._adjacency(OUT, [obj.pk], flat=True)
+        queries = [self.connections
+                   .filter(**{'%s__in' % field: neighbors})
+                   .exclude(**{'%s__in' % other: neighbors})
+                   .exclude(**{other: obj.pk})
+                   .values_list(other)
+                   .annotate(count=models.Count('pk'), score=models.Sum('weight'))
+                   for field, other in self._orientations()]
+        if not self.symmetric:
+            rows = list(queries[0].order_by('-count', '-score', 'to_pk')[:limit])
+        else:
+            totals = {}
+            for pk, count, score in _union(*[qs.order_by() for qs in queries], all=True):
+                total = totals.get(pk, (0, 0))
+                totals[pk] = (total[0] + count, total[1] + score)
+            rows = sorted(((pk, count, score) for pk, (count, score) in totals.items()),
+                          key=lambda row: (-row[1], -row[2], row[0]))[:limit]
+        objects = self.to_model._base_manager.in_bulk([row[0] for row in rows])
+        return [(objects[pk], count, score)
+                for pk, count, score in rows if pk in objects]
+    
+    @instrumented
     def distance_between(self, from_obj, to_obj, limit=2):
         """
         Calculates the distance between two objects. Distance 0 means
@@ -199,7 +884,12 @@ class Relationship(object):
         ``from_obj``'s connected objects are directly connected to ``to_obj``,
         etc.
         
-        ``limit`` limits the depth of connections traversal.
+        ``limit`` limits the depth of connections traversal. The search runs
+        from both objects at once and, on PostgreSQL and SQLite, costs a
+        single query regardless of ``limit``. Relationships with a cache or a
+        snapshot are searched through their cached adjacency sets or in
+        memory instead, and those with a closure answer with a single
+        indexed lookup.
         
         Returns ``None`` if the two objects are not connected within ``limit``
         distance.
@@ -208,20 +898,684 @@ class Relationship(object):
         
         if from_obj == to_obj:
             return 0
+        return self._distance(from_obj.pk, to_obj.pk, limit)
+    
+    def _distance(self, from_pk, to_pk, limit):
+        """
+        Returns ``distance_between()`` the objects with the given primary
+        keys, which must differ.
+        """
+        if self.closure:
+            depth = self._closure_depth(from_pk, to_pk)
+            return depth if depth is not None and depth <= limit else None
+        
+        identity_map = memo.get_identity_map()
+        if (identity_map is not None and limit >= 1 and
+                identity_map.connection_exists(self, *self.canonical_pair(from_pk, to_pk))):
+            return 1
+        
+        return traversal.distance(self, from_pk, to_pk, limit)
+    
+    def _closure_depth(self, from_pk, to_pk):
+        return (_closure.closure_rows(self, (OUT, from_pk), (IN, to_pk))
+                .filter(ancestor_pk=from_pk, descendant_pk=to_pk)
+                .values_list('depth', flat=True).first())
+    
+    @instrumented
+    def path_exists(self, from_obj, to_obj):
+        """
+        Returns whether a path of connections leads from ``from_obj`` to
+        ``to_obj``, with a single indexed lookup. Requires ``closure=True``.
+        """
+        assert self.closure, (
+            'Relationship "%s" does not keep a closure' % self.name)
+        self._validate_ctypes(from_obj, to_obj)
+        return (_closure.closure_rows(self, (OUT, from_obj.pk), (IN, to_obj.pk))
+                .filter(ancestor_pk=from_obj.pk, descendant_pk=to_obj.pk).exists())
+    
+    @instrumented
+    def descendant_ids(self, obj, max_depth=None):
+        """
+        Returns a query set of the IDs of all objects a path of connections
+        leads to from the given object, up to ``max_depth`` connections
+        away if given. Requires ``closure=True``.
+        """
+        assert self.closure, (
+            'Relationship "%s" does not keep a closure' % self.name)
+        self._validate_ctypes(obj, None)
+        qs = _closure.closure_rows(self, (OUT, obj.pk)).filter(ancestor_pk=obj.pk)
+        if max_depth is not None:
+            qs = qs.filter(depth__lte=max_depth)
+        return qs.values_list('descendant_pk', flat=True)
+    
+    @instrumented
+    def ancestor_ids(self, obj, max_depth=None):
+        """
+        Returns a query set of the IDs of all objects a path of connections
+        leads from to the given object, up to ``max_depth`` connections
+        away if given. Requires ``closure=True``.
+        """
+        assert self.closure, (
+            'Relationship "%s" does not keep a closure' % self.name)
+        self._validate_ctypes(None, obj)
+        qs = _closure.closure_rows(self, (IN, obj.pk)).filter(descendant_pk=obj.pk)
+        if max_depth is not None:
+            qs = qs.filter(depth__lte=max_depth)
+        return qs.values_list('ancestor_pk', flat=True)
+    
+    @instrumented
+    def neighbourhood(self, obj, depth=2, max_nodes=traversal.MAX_NEIGHBOURHOOD_NODES,
+                      max_fanout_per_node=traversal.MAX_FANOUT):
+        """
+        Returns a dictionary mapping the primary key of each object within
+        ``depth`` connections of the given object, including itself, to its
+        distance from it, e.g. for visibility checks.
+        
+        To keep objects with many connections from blowing up the search,
+        only the ``max_fanout_per_node`` most recent connections of each
+        object are followed, and at most ``max_nodes`` objects are returned,
+        nearest first and then by primary key. Either limit may be ``None``.
+        
+        On PostgreSQL and SQLite, the search costs a single query. Elsewhere,
+        and for symmetric relationships, it costs one query per hop.
+        Relationships with a cache are searched through their cached
+        adjacency sets when ``max_fanout_per_node`` is ``None``.
+        """
+        self._validate_ctypes(obj, None)
+        return traversal.neighbourhood(self, obj.pk, depth, max_nodes=max_nodes,
+                                       max_fanout=max_fanout_per_node)
+    
+    @instrumented(rows=first_rows)
+    def shortest_path(self, from_obj, to_obj, max_cost=None, max_hops=None,
+                      max_nodes=traversal.MAX_EXPANDED_NODES):
+        """
+        Finds the cheapest path between two objects, the cost of a path being
+        the sum of the ``weight`` of its connections. Paths costing more than
+        ``max_cost`` or longer than ``max_hops`` connections are ignored.
+        
+        The search expands nodes in batches, costing one query per batch, and
+        gives up once it has expanded ``max_nodes`` nodes, raising
+        ``Relationship.SearchLimitExceeded``, which holds the cheapest path
+        found until then, if any, as its ``path`` and ``cost``.
         
-        d = 1
-        pk = to_obj.pk
-        qs = self.connections
-        pks = qs.filter(from_pk=from_obj.pk).values_list('to_pk', flat=True)
-        while limit > 0:
-            if pk in pks:
-                return d
+        Returns a ``(path, cost)`` tuple, where ``path`` is the list of the
+        primary keys of the objects along the path, from ``from_obj`` to
+        ``to_obj``, or ``None`` if there's no such path.
+        """
+        self._validate_ctypes(from_obj, to_obj)
+        return traversal.shortest_path(self, from_obj.pk, to_obj.pk,
+                                       max_cost=max_cost, max_hops=max_hops,
+                                       max_nodes=max_nodes)
+    
+    @instrumented(rows=first_rows)
+    def to_edge_arrays(self, numpy=False, chunk_size=arrays.CHUNK_SIZE, mirror=None):
+        """
+        Returns a ``(from_pks, to_pks, weights)`` tuple of ``array.array``
+        columns, or NumPy arrays if ``numpy`` is ``True``, holding the
+        primary keys and weight of every connection of this relationship,
+        both ways if ``mirror`` is ``True`` or the relationship is symmetric.
+        """
+        return arrays.edge_arrays(self, numpy=numpy, chunk_size=chunk_size,
+                                  mirror=mirror)
+    
+    @instrumented(rows=lambda result: result[0].nnz)
+    def to_csr(self, chunk_size=arrays.CHUNK_SIZE, mirror=None):
+        """
+        Returns a ``(matrix, row_pks, col_pks)`` tuple, where ``matrix`` is
+        a SciPy CSR matrix of the weights of the connections of this
+        relationship and ``row_pks`` and ``col_pks`` map its row and column
+        indices to primary keys. Requires NumPy and SciPy.
+        """
+        return arrays.to_csr(self, chunk_size=chunk_size, mirror=mirror)
+    
+    @instrumented
+    def out_degree(self, from_obj):
+        """
+        Returns the number of connections with the given object as a source.
+        """
+        return self.out_degrees([from_obj])[from_obj.pk]
+    
+    @instrumented
+    def out_degrees(self, from_objs):
+        """
+        Returns a dictionary mapping the primary key of each of the given
+        objects to the number of connections with the object as a source.
+        """
+        from_objs = list(from_objs)
+        self._validate_pairs((from_obj, None) for from_obj in from_objs)
+        return self._degrees(ConnectionCounter.OUT, [obj.pk for obj in from_objs])
+    
+    @instrumented
+    def in_degree(self, to_obj):
+        """
+        Returns the number of connections with the given object as a
+        destination.
+        """
+        return self.in_degrees([to_obj])[to_obj.pk]
+    
+    @instrumented
+    def in_degrees(self, to_objs):
+        """
+        Returns a dictionary mapping the primary key of each of the given
+        objects to the number of connections with the object as a destination.
+        """
+        to_objs = list(to_objs)
+        self._validate_pairs((None, to_obj) for to_obj in to_objs)
+        return self._degrees(ConnectionCounter.IN, [obj.pk for obj in to_objs])
+    
+    def _degrees(self, side, pks):
+        """
+        Counts connections per node, reading the maintained counters if the
+        relationship keeps any, else counting connections.
+        """
+        degrees = dict.fromkeys(pks, 0)
+        for chunk in chunked(set(pks), BULK_BATCH_SIZE):
+            nodes = [(side, pk) for pk in chunk]
+            if self.counters:
+                rows = _counters(self, *nodes).filter(
+                    side=side, object_pk__in=chunk).values_list('object_pk', 'count')
             else:
-                pks = qs.filter(from_pk__in=pks).values_list('pk', flat=True)
-                d += 1
-                limit -= 1
+                qs = self._connections(*nodes)
+                rows = _union(*[qs.filter(**{'%s__in' % field: chunk})
+                                .values_list(field).annotate(models.Count('pk'))
+                                .order_by()
+                                for field in self._fields(side)], all=True)
+            for pk, count in rows:
+                degrees[pk] += count
+        return degrees
+    
+    def _orientations(self):
+        """
+        Returns the ``(field, other)`` pairs of columns connections are
+        followed along, from ``field`` to ``other``: both ways for symmetric
+        relationships.
+        """
+        if self.symmetric:
+            return (('from_pk', 'to_pk'), ('to_pk', 'from_pk'))
+        return (('from_pk', 'to_pk'),)
+    
+    def _fields(self, side):
+        """
+        Returns the names of the columns holding the nodes on ``side`` of
+        connections: both columns for symmetric relationships.
+        """
+        if self.symmetric:
+            return ('from_pk', 'to_pk')
+        return ('from_pk',) if side == OUT else ('to_pk',)
+    
+    @instrumented(rows=lambda result: None)
+    def rebuild_counters(self, batch_size=BULK_BATCH_SIZE):
+        """
+        Recounts the connections of this relationship from scratch, replacing
+        the maintained counters. Nodes are processed ``batch_size`` at a time,
+        each batch in its own transaction.
+        """
+        assert self.counters, (
+            'Relationship "%s" does not maintain counters' % self.name)
+        using = self.db_for_write
+        counters = _counters(self).using(using)
+        for side in (ConnectionCounter.OUT, ConnectionCounter.IN):
+            last = None
+            while True:
+                # Nodes up to ``bound`` are counted in full; with more than
+                # one column to count, that's the lowest of their bounds.
+                counts = {}
+                bound = None
+                for field in self._fields(side):
+                    qs = self.connections.using(using).order_by(field)
+                    if last is not None:
+                        qs = qs.filter(**{'%s__gt' % field: last})
+                    rows = list(qs.values_list(field)
+                                .annotate(models.Count('pk'))[:batch_size])
+                    if len(rows) == batch_size and (bound is None or rows[-1][0] < bound):
+                        bound = rows[-1][0]
+                    for pk, count in rows:
+                        counts[pk] = counts.get(pk, 0) + count
+                stale = counters.filter(side=side)
+                if last is not None:
+                    stale = stale.filter(object_pk__gt=last)
+                if bound is not None:
+                    stale = stale.filter(object_pk__lte=bound)
+                with transaction.atomic(using=using):
+                    stale.delete()
+                    ConnectionCounter.objects.db_manager(using).bulk_create([
+                        ConnectionCounter(relationship_id=self.id, side=side,
+                                          object_pk=pk, count=count)
+                        for pk, count in sorted(counts.items())
+                        if bound is None or pk <= bound])
+                if bound is None:
+                    break
+                last = bound
+    
+    def rebuild_closure(self, batch_size=BULK_BATCH_SIZE):
+        """
+        Recomputes the closure of the connections of this relationship from
+        scratch, replacing the stored one, e.g. after connections were
+        imported. Ancestors are processed ``batch_size`` at a time, each
+        batch in its own transaction.
+        """
+        assert self.closure, (
+            'Relationship "%s" does not keep a closure' % self.name)
+        _closure.rebuild(self, batch_size=batch_size)
+    
+    def collapse_connections(self, batch_size=BULK_BATCH_SIZE):
+        """
+        Stores the connections of a symmetric relationship canonically,
+        e.g. after it was made symmetric: connections stored from the higher
+        key are removed if the opposite connection exists, else reversed.
+        Connections are processed ``batch_size`` at a time, each batch in
+        its own transaction, and counters and the cache are refreshed
+        afterwards. No signals are sent.
+        
+        Returns a ``(removed, reversed)`` tuple with the number of
+        connections removed and reversed.
+        """
+        assert self.symmetric, (
+            'Relationship "%s" is not symmetric' % self.name)
+        using = self.db_for_write
+        # MySQL assigns columns left to right, so they can't be swapped in
+        # a single statement
+        swap = db_connections[using].vendor != 'mysql'
+        qs = self._all_connections().using(using)
+        removed = reversed_ = 0
+        last = None
+        while True:
+            stale = qs.filter(from_pk__gt=models.F('to_pk')).order_by('pk')
+            if last is not None:
+                stale = stale.filter(pk__gt=last)
+            rows = list(stale.values_list('pk', 'from_pk', 'to_pk')[:batch_size])
+            if not rows:
+                break
+            last = rows[-1][0]
+            with transaction.atomic(using=using):
+                existing = set(qs.filter(_pairs_q([(to_pk, from_pk)
+                                                   for pk, from_pk, to_pk in rows]))
+                               .values_list('to_pk', 'from_pk'))
+                duplicates = [pk for pk, from_pk, to_pk in rows
+                              if (from_pk, to_pk) in existing]
+                if duplicates:
+                    qs.filter(pk__in=duplicates)._raw_delete(using)
+                rows = [row for row in rows if row[1:] not in existing]
+                if swap and rows:
+                    qs.filter(pk__in=[row[0] for row in rows]).update(
+                        from_pk=models.F('to_pk'), to_pk=models.F('from_pk'))
+                elif rows:
+                    for pk, from_pk, to_pk in rows:
+                        qs.filter(pk=pk).update(from_pk=to_pk, to_pk=from_pk)
+            removed += len(duplicates)
+            reversed_ += len(rows)
         
-        return None
+        if self.counters:
+            self.rebuild_counters(batch_size=batch_size)
+        if self.cache is not None:
+            self.cache.invalidate()
+        if self.snapshot is not None:
+            self.snapshot.clear()
+        return removed, reversed_
+    
+    def purge_expired(self, batch_size=BULK_BATCH_SIZE, pause=0):
+        """
+        Deletes the connections of this relationship that have expired, in
+        order of expiry, ``batch_size`` at a time, each batch with its own
+        statement, sleeping ``pause`` seconds between batches so that no
+        long locks or bursts of writes hold up other queries. No signals
+        are sent. Returns the number of connections deleted.
+        """
+        using = self.db_for_write
+        qs = self._all_connections().using(using)
+        expired = qs.filter(expires__lte=timezone.now()).order_by('expires', 'id')
+        deleted = 0
+        while True:
+            pks = list(expired.values_list('pk', flat=True)[:batch_size])
+            if pks:
+                qs.filter(pk__in=pks)._raw_delete(using)
+                deleted += len(pks)
+            if len(pks) < batch_size:
+                return deleted
+            if pause:
+                time.sleep(pause)
+
+
+class RelationshipSet(object):
+    """
+    Several relationships from the same model, queried together, e.g. for a
+    feed merging the users a user follows with the repositories they
+    starred. Each query costs a single ``relationship_id IN (...)`` query
+    per database the relationships are read from, instead of one query per
+    relationship. Results are tagged with the relationship they come from.
+    """
+    def __init__(self, relationships):
+        self.relationships = [get_relationship(relationship)
+                              for relationship in relationships]
+        self.name = ','.join(relationship.name for relationship in self.relationships)
+    
+    def __iter__(self):
+        return iter(self.relationships)
+    
+    def __len__(self):
+        return len(self.relationships)
+    
+    def _databases(self, nodes):
+        """
+        Returns a dictionary mapping each database to read from to the
+        relationships whose connections are read from it. Relationships
+        written to the same database are read together: from a replica,
+        unless reads of any of them are pinned to the database written to.
+        """
+        groups = OrderedDict()
+        for relationship in self.relationships:
+            groups.setdefault(relationship.db_for_write, []).append(relationship)
+        databases = OrderedDict()
+        for primary, relationships in groups.items():
+            reads = [relationship._connections(*nodes).db
+                     for relationship in relationships]
+            db = primary if primary in reads else reads[0]
+            databases.setdefault(db, []).extend(relationships)
+        return databases
+    
+    def _from_object(self, from_obj, limit, fields):
+        """
+        Returns the values of ``fields`` of the connections of all
+        relationships with the given object as a source, or at either end
+        for symmetric relationships, most recent first.
+        """
+        for relationship in self.relationships:
+            relationship._validate_ctypes(from_obj, None)
+        ordering = ('-date', '-id')
+        results = []
+        for db, relationships in self._databases([(OUT, from_obj.pk)]).items():
+            directed = [r.id for r in relationships if not r.symmetric]
+            symmetric = [r.id for r in relationships if r.symmetric]
+            q = models.Q()
+            if directed:
+                q |= models.Q(relationship_id__in=directed, from_pk=from_obj.pk)
+            if symmetric:
+                q |= (models.Q(relationship_id__in=symmetric) &
+                      (models.Q(from_pk=from_obj.pk) | models.Q(to_pk=from_obj.pk)))
+            if any(r.ttl is not None for r in relationships):
+                q &= _live_q()
+            qs = Connection.objects.using(db).filter(q).order_by(*ordering)
+            if fields:
+                qs = qs.values_list('date', 'id', *fields)
+            results.append(qs[:limit] if limit is not None else qs)
+        if len(results) == 1:
+            return list(results[0])
+        if fields:
+            key = lambda row: (row[0], row[1])
+        else:
+            key = lambda connection: (connection.date, connection.id)
+        return sorted(itertools.chain(*results), key=key, reverse=True)[:limit]
+    
+    @instrumented
+    def connections_from_object(self, from_obj, limit=None):
+        """
+        Returns a list of the connections with the given object as a source,
+        most recent first, up to ``limit`` if given. The ``relationship`` of
+        each tells which relationship it belongs to.
+        """
+        return self._from_object(from_obj, limit, ())
+    
+    @instrumented
+    def connected_object_ids(self, from_obj, limit=None):
+        """
+        Returns a list of ``(relationship, pk)`` tuples for the objects
+        connected with the given object as a source, most recent first, up
+        to ``limit`` if given.
+        """
+        rows = self._from_object(from_obj, limit, ('relationship_id', 'from_pk', 'to_pk'))
+        return [(get_relationship(relationship_id),
+                 from_pk if to_pk == from_obj.pk and from_pk != to_pk else to_pk)
+                for date, pk, relationship_id, from_pk, to_pk in rows]
+    
+    @instrumented
+    def connected_objects(self, from_obj, limit=None):
+        """
+        Returns a list of ``(relationship, object)`` tuples for the objects
+        connected with the given object as a source, most recent first, up
+        to ``limit`` if given. Objects are fetched with one query per model.
+        """
+        ids = self.connected_object_ids(from_obj, limit=limit)
+        pks = OrderedDict()
+        for relationship, pk in ids:
+            pks.setdefault(_concrete_model(relationship.to_model), set()).add(pk)
+        objects = dict((model, model._base_manager.in_bulk(list(model_pks)))
+                       for model, model_pks in pks.items())
+        return [(relationship, objects[_concrete_model(relationship.to_model)][pk])
+                for relationship, pk in ids
+                if pk in objects[_concrete_model(relationship.to_model)]]
+
+
+def _unique_pairs(pairs):
+    """
+    Returns a list of the given ``(from_obj, to_obj)`` pairs, dropping any
+    pairs of objects already seen and keeping the original order.
+    """
+    seen = set()
+    result = []
+    for from_obj, to_obj in pairs:
+        key = (from_obj.pk, to_obj.pk)
+        if key not in seen:
+            seen.add(key)
+            result.append((from_obj, to_obj))
+    return result
+
+
+def _union(first, *rest, **kwargs):
+    """
+    Combines the given query sets of rows with ``UNION``, or ``UNION ALL``
+    if ``all`` is ``True``. Before Django 1.11, returns the concatenated
+    rows of the query sets instead, costing one query each.
+    """
+    if not rest:
+        return first
+    if hasattr(first, 'union'):
+        return first.union(*rest, **kwargs)
+    rows = list(itertools.chain(first, *rest))  # pragma: no cover
+    return rows if kwargs.get('all') else list(OrderedDict.fromkeys(rows))
+
+
+def _pairs_q(keys):
+    """
+    Returns a ``Q`` object matching connections between any of the given
+    ``(from_pk, to_pk)`` pairs.
+    """
+    q = models.Q()
+    for from_pk, to_pk in keys:
+        q |= models.Q(from_pk=from_pk, to_pk=to_pk)
+    return q
+
+
+def _bulk_insert(connections, using=None):
+    """
+    Inserts the given unsaved connections with a single query. Where
+    supported, rows that a concurrent writer managed to insert first are
+    silently skipped.
+    """
+    manager = Connection.objects.db_manager(using)
+    if django.VERSION >= (2, 2):
+        manager.bulk_create(connections, ignore_conflicts=True)
+    else:
+        manager.bulk_create(connections)
+
+
+def prefetch_connection_objects(connections, side='both'):
+    """
+    Fetches the objects at the given ``side`` (``'from'``, ``'to'`` or
+    ``'both'``) of each of the given connections in bulk, costing one query
+    per content type and side instead of one query per connection. Fetched
+    objects are cached on the connections, so that subsequent access to
+    ``Connection.from_object`` and ``Connection.to_object`` is free.
+    
+    Returns the list of connections.
+    """
+    if side not in _PREFETCH_SIDES:
+        raise ValueError(side)
+    connections = list(connections)
+    for side in _PREFETCH_SIDES[side]:
+        attr = '_cached_%s_obj' % side
+        pending = {}
+        for connection in connections:
+            if not isinstance(connection, Connection) or hasattr(connection, attr):
+                continue
+            model = getattr(connection.relationship, '%s_model' % side)
+            pk = getattr(connection, '%s_pk' % side)
+            pending.setdefault(model, {}).setdefault(pk, []).append(connection)
+        for model, by_pk in pending.items():
+            objects = {}
+            for pks in chunked(by_pk, BULK_BATCH_SIZE):
+                objects.update(model._base_manager.in_bulk(pks))
+            for pk, obj in objects.items():
+                for connection in by_pk.get(pk, ()):
+                    setattr(connection, attr, obj)
+    return connections
+
+
+_PREFETCH_SIDES = {
+    'from': ('from',),
+    'to': ('to',),
+    'both': ('from', 'to'),
+}
+
+
+def _update_counters(relationship, keys, delta):
+    """
+    Adds ``delta`` to the counters of both nodes of each of the given
+    ``(from_pk, to_pk)`` pairs, if the relationship maintains counters.
+    Counters are updated with one ``UPDATE`` per side and distinct
+    difference, so bulk operations cost a constant number of queries.
+    """
+    if not relationship.counters:
+        return
+    deltas = {}
+    for from_pk, to_pk in keys:
+        for key in ((ConnectionCounter.OUT, from_pk), (ConnectionCounter.IN, to_pk)):
+            deltas[key] = deltas.get(key, 0) + delta
+    groups = {}
+    for (side, pk), n in deltas.items():
+        groups.setdefault((side, n), []).append(pk)
+    for (side, n), pks in groups.items():
+        for chunk in chunked(pks, BULK_BATCH_SIZE):
+            _add_to_counters(relationship, side, chunk, n)
+
+
+def _live_q():
+    """
+    Returns a ``Q`` object matching connections that haven't expired.
+    """
+    return models.Q(expires__isnull=True) | models.Q(expires__gt=timezone.now())
+
+
+def _renew(relationship, connections, using):
+    """
+    Pushes back the expiry of the given existing connections of a
+    relationship with a TTL, as if they were created again. Connections
+    that had expired are created anew, and returned.
+    """
+    now = timezone.now()
+    expires = now + relationship.ttl
+    expired = [c for c in connections if c.expires is not None and c.expires <= now]
+    qs = relationship._all_connections().using(using)
+    qs.filter(pk__in=[c.pk for c in connections]).update(expires=expires)
+    if expired:
+        qs.filter(pk__in=[c.pk for c in expired]).update(date=now)
+    for connection in connections:
+        connection.expires = expires
+    for connection in expired:
+        connection.date = now
+    if expired:
+        _notify_created(relationship, expired, using)
+    return expired
+
+
+def _update_closure(relationship, keys, created):
+    """
+    Updates the closure of the relationship, if it keeps one, after
+    connections between the given ``(from_pk, to_pk)`` pairs were created,
+    or removed unless ``created``.
+    """
+    if not relationship.closure:
+        return
+    if created:
+        _closure.connected(relationship, keys)
+    else:
+        _closure.disconnected(relationship, keys)
+
+
+def _counters(relationship, *nodes):
+    """
+    Returns a query set matching all counters of the given relationship,
+    routed like its connections.
+    """
+    hints = {'relationship': relationship, 'nodes': nodes}
+    return (ConnectionCounter.objects.db_manager(hints=hints)
+            .filter(relationship_id=relationship.id))
+
+
+def _add_to_counters(relationship, side, pks, n):
+    using = router.db_for_write(ConnectionCounter, relationship=relationship)
+    counters = _counters(relationship).using(using).filter(side=side, object_pk__in=pks)
+    if counters.update(count=models.F('count') + n) == len(pks) or n < 0:
+        return
+    existing = set(counters.values_list('object_pk', flat=True))
+    missing = [ConnectionCounter(relationship_id=relationship.id,
+                                 side=side, object_pk=pk, count=n)
+               for pk in pks if pk not in existing]
+    try:
+        with transaction.atomic(using=using):
+            ConnectionCounter.objects.db_manager(using).bulk_create(missing)
+    except IntegrityError:
+        # a concurrent writer created some of the counters first; fall back
+        # to creating them one at a time.
+        for counter in missing:
+            try:
+                with transaction.atomic(using=using):
+                    counter.save(force_insert=True, using=using)
+            except IntegrityError:
+                counters.filter(object_pk=counter.object_pk).update(
+                    count=models.F('count') + n)
+
+
+class ConnectionQuerySet(QuerySet):
+    _prefetch_side = None
+    _operation = None
+    
+    def with_objects(self, side='both'):
+        """
+        Returns a new query set that, once evaluated, fetches the objects at
+        the given ``side`` of its connections in bulk.
+        See ``prefetch_connection_objects`` for more info.
+        """
+        if side not in _PREFETCH_SIDES:
+            raise ValueError(side)
+        clone = self._clone()
+        clone._prefetch_side = side
+        return clone
+    
+    def _clone(self, *args, **kwargs):
+        clone = super(ConnectionQuerySet, self)._clone(*args, **kwargs)
+        clone._prefetch_side = self._prefetch_side
+        clone._operation = self._operation
+        return clone
+    
+    def _fetch_all(self):
+        if self._operation is not None and self._result_cache is None:
+            # returned by an instrumented operation, see ``instrumentation``
+            relationship, operation = self._operation
+            measure(relationship, operation, self._fetch)
+        else:
+            self._fetch()
+    
+    def _fetch(self):
+        fetched = self._result_cache is None
+        super(ConnectionQuerySet, self)._fetch_all()
+        if fetched and self._prefetch_side:
+            prefetch_connection_objects(self._result_cache, self._prefetch_side)
+        return self._result_cache
+
+
+class ConnectionManager(models.Manager):
+    def get_queryset(self):
+        return ConnectionQuerySet(self.model, using=self._db, hints=self._hints)
 
 
 class Connection(models.Model):
@@ -232,46 +1586,180 @@ class Connection(models.Model):
     
     You may imagine connections as the *edges* in a graph.
     """
-    relationship_name = models.CharField(max_length=NAME_MAX_LENGTH)
-    from_pk = models.IntegerField()
-    to_pk = models.IntegerField()
+    relationship_id = models.IntegerField()
+    from_pk = models.BigIntegerField()
+    to_pk = models.BigIntegerField()
     weight = models.FloatField(default=1.0, blank=True)
     date = models.DateTimeField(default=timezone.now)
+    expires = models.DateTimeField(null=True, blank=True)
+    
+    objects = ConnectionManager()
     
     class Meta:
-        unique_together = ('relationship_name', 'from_pk', 'to_pk')
+        unique_together = ('relationship_id', 'from_pk', 'to_pk')
+        index_together = [
+            ('relationship_id', 'to_pk', 'from_pk'),
+            ('relationship_id', 'from_pk', 'date', 'id'),
+            ('relationship_id', 'to_pk', 'date', 'id'),
+            ('relationship_id', 'expires', 'id'),
+        ]
     
     def __str__(self):
         rel = self.relationship
         return '%s (%s:%s --> %s:%s)' % (rel.name,
-                                         rel.from_content_type, self.from_pk,
-                                         rel.to_content_type, self.to_pk)
+                                         rel.from_model._meta.verbose_name, self.from_pk,
+                                         rel.to_model._meta.verbose_name, self.to_pk)
     
     @property
     def relationship(self):
-        return get_relationship(self.relationship_name)
+        return get_relationship(self.relationship_id)
+    
+    @property
+    def relationship_name(self):
+        return self.relationship.name
     
     @property
     def from_object(self):
         if not hasattr(self, '_cached_from_obj'):
-            ct = self.relationship.from_content_type
-            self._cached_from_obj = ct.get_object_for_this_type(pk=self.from_pk)
+            model = self.relationship.from_model
+            self._cached_from_obj = model._base_manager.get(pk=self.from_pk)
         return self._cached_from_obj
     
     @property
     def to_object(self):
         if not hasattr(self, '_cached_to_obj'):
-            ct = self.relationship.to_content_type
-            self._cached_to_obj = ct.get_object_for_this_type(pk=self.to_pk)
+            model = self.relationship.to_model
+            self._cached_to_obj = model._base_manager.get(pk=self.to_pk)
         return self._cached_to_obj
 
 
-def _connection_created_handler(sender, instance, raw, created, **kwargs):
-    if not raw and created:
-        connection_created.send(sender=instance.relationship, connection=instance)
-post_save.connect(_connection_created_handler, sender=Connection)
+class ConnectionCounter(models.Model):
+    """
+    Holds the number of connections of a relationship from (``side='out'``)
+    or to (``side='in'``) a single node. Counters are only maintained for
+    relationships defined with ``counters=True``.
+    """
+    OUT = 'out'
+    IN = 'in'
+    SIDE_CHOICES = (
+        (OUT, 'out'),
+        (IN, 'in'),
+    )
+    
+    relationship_id = models.IntegerField()
+    side = models.CharField(max_length=3, choices=SIDE_CHOICES)
+    object_pk = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('relationship_id', 'side', 'object_pk')
+    
+    def __str__(self):
+        return '%s (%s:%s = %s)' % (self.relationship_id, self.side,
+                                    self.object_pk, self.count)
+
+
+class ConnectionClosure(models.Model):
+    """
+    Records that a path of connections of a relationship leads from one
+    node to another, and the length of the shortest such path. Only kept
+    for relationships defined with ``closure=True``.
+    """
+    relationship_id = models.IntegerField()
+    ancestor_pk = models.BigIntegerField()
+    descendant_pk = models.BigIntegerField()
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = ('relationship_id', 'ancestor_pk', 'descendant_pk')
+        index_together = [
+            ('relationship_id', 'descendant_pk', 'ancestor_pk'),
+        ]
+    
+    def __str__(self):
+        return '%s (%s --> %s = %s)' % (self.relationship_id, self.ancestor_pk,
+                                        self.descendant_pk, self.depth)
+
+
+def row_signals():
+    """
+    Returns whether ``connection_created`` and ``connection_removed`` are sent
+    for each connection and saving or deleting ``Connection`` instances
+    updates counters and caches, as set by ``CONNECTIONS_ROW_SIGNALS``.
+    """
+    return getattr(settings, 'CONNECTIONS_ROW_SIGNALS', True)
+
+
+def _notify_created(relationship, connections, using):
+    """
+    Invalidates cached adjacency sets and sends the signals for the given
+    connections, just created on database ``using``.
+    """
+    pairs = [(connection.from_pk, connection.to_pk) for connection in connections]
+    # both ends of connections of symmetric relationships have changed
+    directed = relationship._directed(pairs)
+    replicas.written(relationship, directed)
+    memo.created(relationship, connections)
+    discard_now_and_on_commit(relationship, directed, using)
+    if relationship.row_signals:
+        for connection in connections:
+            connection_created.send(sender=relationship, connection=connection)
+    dispatch.send_on_commit(connections_created_batch, relationship, pairs, True, using)
+
+
+def _notify_removed(relationship, connections, using):
+    """
+    Invalidates cached adjacency sets and sends the signals for the given
+    connections, just deleted from database ``using``.
+    """
+    pairs = [(connection.from_pk, connection.to_pk) for connection in connections]
+    # both ends of connections of symmetric relationships have changed
+    directed = relationship._directed(pairs)
+    replicas.written(relationship, directed)
+    memo.removed(relationship, connections)
+    discard_now_and_on_commit(relationship, directed, using)
+    if relationship.row_signals:
+        for connection in connections:
+            connection_removed.send(sender=relationship, connection=connection)
+    dispatch.send_on_commit(connections_removed_batch, relationship, pairs, False, using)
+
+
+def _connection_created(relationship, connection, using):
+    _update_counters(relationship, relationship._directed(
+        [(connection.from_pk, connection.to_pk)]), 1)
+    _update_closure(relationship, [(connection.from_pk, connection.to_pk)], True)
+    _notify_created(relationship, [connection], using)
+
+
+def _connection_created_handler(sender, instance, raw, created, using, **kwargs):
+    if not raw and created and instance.relationship.row_signals:
+        _connection_created(instance.relationship, instance, using)
+
+
+def _connection_removed_handler(sender, instance, using, **kwargs):
+    relationship = instance.relationship
+    if not relationship.row_signals:
+        return
+    _update_counters(relationship, relationship._directed(
+        [(instance.from_pk, instance.to_pk)]), -1)
+    _update_closure(relationship, [(instance.from_pk, instance.to_pk)], False)
+    _notify_removed(relationship, [instance], using)
+
+
+def _connect_model_signals():
+    # Without receivers, ``QuerySet.delete()`` deletes connections without
+    # fetching them first.
+    if row_signals() or any(relationship._row_signals
+                            for relationship in _relationship_registry.values()):
+        post_save.connect(_connection_created_handler, sender=Connection)
+        post_delete.connect(_connection_removed_handler, sender=Connection)
+    else:
+        post_save.disconnect(_connection_created_handler, sender=Connection)
+        post_delete.disconnect(_connection_removed_handler, sender=Connection)
+_connect_model_signals()
 
 
-def _connection_removed_handler(sender, instance, **kwargs):
-    connection_removed.send(sender=instance.relationship, connection=instance)
-post_delete.connect(_connection_removed_handler, sender=Connection)
+def _setting_changed_handler(setting, **kwargs):
+    if setting == 'CONNECTIONS_ROW_SIGNALS':
+        _connect_model_signals()
+setting_changed.connect(_setting_changed_handler)
@@ -0,0 +1,226 @@
+"""
+List partitioning of the connections table by relationship, on PostgreSQL
+11 or later.
+
+Relationships defined with a ``partition`` name keep their connections in
+a partition of that name, e.g. ``connections_connection_hot``, shared by
+all relationships with the same partition name. Connections of all other
+relationships are kept in the ``connections_connection_default``
+partition. Each partition has its own indexes and is vacuumed on its own,
+so that large, cold relationships don't get in the way of small, hot ones.
+
+``partition_connections()`` converts the connections table into a
+partitioned table the first time it runs, and creates partitions for new
+partition names, or moves new relationships into existing partitions,
+afterwards. Relationships are never moved out of a partition. The table is
+locked while this runs, and converting it rewrites every row.
+
+Partitioned tables can't have a primary key on ``id`` alone, so the primary
+key of the partitioned table is ``(id, relationship_id)``. IDs still come
+from the same sequence, so they stay unique.
+"""
+
+import re
+
+from django.db import connections as db_connections, router, transaction
+from django.db.backends.utils import truncate_name
+
+from .models import Connection, _relationship_registry
+
+
+DEFAULT_PARTITION = 'default'
+
+
+def partitions(relationships):
+    """
+    Returns a list of ``(name, ids)`` tuples with the name of each partition
+    of the given relationships and the sorted IDs of the relationships in
+    it, sorted by name.
+    """
+    result = {}
+    for relationship in relationships:
+        if relationship.partition is not None:
+            result.setdefault(relationship.partition, set()).add(relationship.id)
+    return [(name, sorted(ids)) for name, ids in sorted(result.items())]
+
+
+def partition_table(connection, name):
+    """
+    Returns the name of the table of the partition with the given name.
+    """
+    return truncate_name('%s_%s' % (Connection._meta.db_table, name),
+                         connection.ops.max_name_length())
+
+
+def partition_sql(connection, wanted, partitioned=False, bounds=None,
+                  sequence=None, identity=False):
+    """
+    Returns the list of SQL statements that partition the connections table
+    as described by ``wanted``, a list of ``(name, ids)`` tuples as returned
+    by ``partitions()``.
+    
+    The current state of the table is described by the other arguments: if
+    ``partitioned`` is ``True``, ``bounds`` maps the table name of each
+    existing partition to the set of relationship IDs in it, or ``None`` for
+    the default partition. Otherwise, ``sequence`` is the name of the
+    sequence of the ``id`` column and ``identity`` tells whether it's an
+    identity column.
+    """
+    qn = connection.ops.quote_name
+    table = Connection._meta.db_table
+    default = partition_table(connection, DEFAULT_PARTITION)
+    for name, ids in wanted:
+        if name == DEFAULT_PARTITION:
+            raise ValueError('Partition name "%s" is reserved' % name)
+    
+    if not partitioned:
+        return _convert_sql(connection, wanted, sequence, identity)
+    
+    statements = []
+    bounds = dict(bounds or {})
+    has_default = default in bounds
+    if has_default:
+        del bounds[default]
+        statements.append('ALTER TABLE %s DETACH PARTITION %s' % (qn(table), qn(default)))
+    bound = set()
+    for ids in bounds.values():
+        bound.update(ids or ())
+    for name, ids in wanted:
+        partition = partition_table(connection, name)
+        current = bounds.get(partition)
+        if current is None:
+            ids = [pk for pk in ids if pk not in bound]
+            if not ids:
+                continue
+            statements.append('CREATE TABLE %s PARTITION OF %s FOR VALUES IN (%s)' %
+                              (qn(partition), qn(table), _values(ids)))
+            if has_default:
+                statements.extend(_move_sql(connection, default, table, ids))
+        else:
+            added = [pk for pk in ids if pk not in bound]
+            if not added:
+                continue
+            statements.append('ALTER TABLE %s DETACH PARTITION %s' % (qn(table), qn(partition)))
+            if has_default:
+                statements.extend(_move_sql(connection, default, partition, added))
+            statements.append('ALTER TABLE %s ATTACH PARTITION %s FOR VALUES IN (%s)' %
+                              (qn(table), qn(partition), _values(sorted(current | set(added)))))
+        bound.update(ids)
+    if has_default:
+        if len(statements) == 1:
+            # nothing changed
+            return []
+        statements.append('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (qn(table), qn(default)))
+    else:
+        statements.append('CREATE TABLE %s PARTITION OF %s DEFAULT' % (qn(default), qn(table)))
+    return statements
+
+
+def _convert_sql(connection, wanted, sequence, identity):
+    qn = connection.ops.quote_name
+    table = Connection._meta.db_table
+    old = truncate_name('%s_unpartitioned' % table, connection.ops.max_name_length())
+    column = lambda name: qn(Connection._meta.get_field(name).column)
+    
+    statements = [
+        'ALTER TABLE %s RENAME TO %s' % (qn(table), qn(old)),
+        'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING IDENTITY) '
+        'PARTITION BY LIST (%s)' % (qn(table), qn(old), column('relationship_id')),
+    ]
+    for name, ids in wanted:
+        statements.append('CREATE TABLE %s PARTITION OF %s FOR VALUES IN (%s)' %
+                          (qn(partition_table(connection, name)), qn(table), _values(ids)))
+    statements.append('CREATE TABLE %s PARTITION OF %s DEFAULT' %
+                      (qn(partition_table(connection, DEFAULT_PARTITION)), qn(table)))
+    statements.append('INSERT INTO %s SELECT * FROM %s' % (qn(table), qn(old)))
+    if identity:
+        # the new table has an identity sequence of its own
+        statements.append("SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+                          "COALESCE(MAX(%s), 0) + 1, false) FROM %s" %
+                          (qn(table), column('id'), qn(table)))
+    elif sequence:
+        # keep the sequence when the old table is dropped
+        statements.append('ALTER SEQUENCE %s OWNED BY %s.%s' %
+                          (sequence, qn(table), column('id')))
+    statements.append('DROP TABLE %s' % qn(old))
+    
+    # Indexes are created on the partitioned table, and thereby on each
+    # partition, once all rows are in.
+    statements.append('ALTER TABLE %s ADD PRIMARY KEY (%s, %s)' %
+                      (qn(table), column('id'), column('relationship_id')))
+    for fields in Connection._meta.unique_together:
+        statements.append('ALTER TABLE %s ADD UNIQUE (%s)' %
+                          (qn(table), ', '.join(column(name) for name in fields)))
+    for fields in Connection._meta.index_together:
+        index = truncate_name('%s_%s_idx' % (table, '_'.join(fields)),
+                              connection.ops.max_name_length())
+        statements.append('CREATE INDEX %s ON %s (%s)' %
+                          (qn(index), qn(table), ', '.join(column(name) for name in fields)))
+    return statements
+
+
+def _move_sql(connection, source, target, ids):
+    qn = connection.ops.quote_name
+    where = '%s IN (%s)' % (qn(Connection._meta.get_field('relationship_id').column),
+                            _values(ids))
+    return [
+        'INSERT INTO %s SELECT * FROM %s WHERE %s' % (qn(target), qn(source), where),
+        'DELETE FROM %s WHERE %s' % (qn(source), where),
+    ]
+
+
+def _values(ids):
+    return ', '.join('%d' % pk for pk in ids)
+
+
+def _introspect(cursor, table):
+    """
+    Returns the keyword arguments describing the current state of the given
+    table for ``partition_sql()``.
+    """
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+    if cursor.fetchone()[0] == 'p':
+        cursor.execute('SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+                       'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                       'WHERE i.inhparent = to_regclass(%s)', [table])
+        bounds = {}
+        for name, bound in cursor.fetchall():
+            if bound == 'DEFAULT':
+                bounds[name] = None
+            else:
+                bounds[name] = set(int(pk) for pk in re.findall(r'-?\d+', bound))
+        return {'partitioned': True, 'bounds': bounds}
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute("SELECT attidentity FROM pg_attribute "
+                   "WHERE attrelid = to_regclass(%s) AND attname = 'id'", [table])
+    row = cursor.fetchone()
+    return {'partitioned': False, 'sequence': sequence,
+            'identity': bool(row and row[0])}
+
+
+def partition_connections(using=None, dry_run=False):
+    """
+    Partitions the connections table of PostgreSQL database ``using`` by
+    the partition names of the relationships routed to it, in a single
+    transaction. Returns the list of SQL statements executed, or that would
+    have been if ``dry_run`` is ``True``.
+    """
+    if using is None:
+        using = router.db_for_write(Connection)
+    connection = db_connections[using]
+    if connection.vendor != 'postgresql':
+        raise ValueError('Partitioning requires PostgreSQL')
+    wanted = partitions(relationship for relationship in _relationship_registry.values()
+                        if relationship.db_for_write == using)
+    with transaction.atomic(using=using):
+        cursor = connection.cursor()
+        try:
+            state = _introspect(cursor, Connection._meta.db_table)
+            statements = partition_sql(connection, wanted, **state)
+            if not dry_run:
+                for sql in statements:
+                    cursor.execute(sql)
+        finally:
+            cursor.close()
+    return statements
@@ -0,0 +1,116 @@
+"""
+Read-your-writes consistency for connections read from replicas.
+
+``connections.routers.ReplicaRouter`` spreads reads of connections and
+counters across the replicas of the database they're written to. Replicas
+lag behind, so for ``CONNECTIONS_PIN_SECONDS`` after connections are
+created or removed, reads are pinned to the primary database:
+
+* in the thread that wrote them, and in later requests of the same client,
+  through a cookie set by ``connections.middleware.ReadYourWritesMiddleware``;
+* for the nodes they connect, through markers kept in the
+  ``CONNECTIONS_PIN_CACHE`` cache, so that reads about those nodes by
+  anyone else see the change too.
+
+Replicas are configured by mapping the alias of each primary database to
+the aliases of its replicas::
+
+    CONNECTIONS_REPLICAS = {
+        'default': ['replica1', 'replica2'],
+    }
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import IN, OUT, get_cache
+
+
+# Number of seconds reads are pinned to the primary after a write, unless
+# set by ``CONNECTIONS_PIN_SECONDS``.
+PIN_SECONDS = 5
+
+COOKIE_NAME = 'connections_pin'
+
+_local = threading.local()
+
+
+def get_replicas(primary):
+    """
+    Returns the aliases of the replicas of the database with the given
+    alias, as set by ``CONNECTIONS_REPLICAS``.
+    """
+    return getattr(settings, 'CONNECTIONS_REPLICAS', {}).get(primary, ())
+
+
+def pin_seconds():
+    return getattr(settings, 'CONNECTIONS_PIN_SECONDS', PIN_SECONDS)
+
+
+def _backend():
+    return get_cache(getattr(settings, 'CONNECTIONS_PIN_CACHE', 'default'))
+
+
+def pin(seconds=None):
+    """
+    Pins reads of connections by the current thread to primary databases
+    for the given number of seconds, or ``CONNECTIONS_PIN_SECONDS``.
+    """
+    if seconds is None:
+        seconds = pin_seconds()
+    _local.until = max(pinned_until(), time.time() + seconds)
+
+
+def unpin():
+    """
+    Lets the current thread read connections from replicas again.
+    """
+    _local.until = 0
+
+
+def pinned_until():
+    """
+    Returns the time until which reads by the current thread are pinned.
+    """
+    return getattr(_local, 'until', 0)
+
+
+def is_pinned():
+    """
+    Returns whether reads by the current thread are pinned.
+    """
+    return pinned_until() > time.time()
+
+
+def _key(relationship, side, pk):
+    return 'connections:pin:%s:%s:%s' % (relationship.name, side, pk)
+
+
+def written(relationship, pairs):
+    """
+    Pins reads by the current thread, and reads about the nodes connected by
+    the given ``(from_pk, to_pk)`` pairs, after connections between them
+    were created or removed. Does nothing unless replicas are configured.
+    """
+    if not getattr(settings, 'CONNECTIONS_REPLICAS', None):
+        return
+    pin()
+    markers = {}
+    for from_pk, to_pk in pairs:
+        markers[_key(relationship, OUT, from_pk)] = True
+        markers[_key(relationship, IN, to_pk)] = True
+    if markers:
+        _backend().set_many(markers, pin_seconds())
+
+
+def nodes_pinned(relationship, nodes):
+    """
+    Returns whether reads about any of the given ``(side, pk)`` nodes of the
+    relationship are pinned, costing a single cache lookup.
+    """
+    if not nodes:
+        return False
+    return bool(_backend().get_many([_key(relationship, side, pk)
+                                     for side, pk in nodes]))
@@ -0,0 +1,75 @@
+"""
+Database routers for connections.
+
+Add ``'connections.routers.RelationshipRouter'`` to ``DATABASE_ROUTERS``
+to keep the connections, counters and closures of relationships defined
+with ``using`` on that database, and ``'connections.routers.ReplicaRouter'``,
+before any other router, to read them from replicas.
+"""
+
+import random
+
+from django.db import router
+
+from . import replicas
+from .models import (Connection, ConnectionClosure, ConnectionCounter,
+    Relationship, get_relationship)
+
+
+_MODELS = (Connection, ConnectionClosure, ConnectionCounter)
+
+
+def _relationship(model, hints):
+    """
+    Returns the relationship the query or instance described by the given
+    router hints is about, or ``None``.
+    """
+    if not issubclass(model, _MODELS):
+        return None
+    relationship = hints.get('relationship')
+    if relationship is None:
+        instance = hints.get('instance')
+        if isinstance(instance, _MODELS):
+            try:
+                relationship = get_relationship(instance.relationship_id)
+            except Relationship.DoesNotExist:
+                return None
+    return relationship
+
+
+class RelationshipRouter(object):
+    """
+    Routes reads and writes of connections, counters and closures to the
+    database of their relationship, given as ``using`` to
+    ``define_relationship()``.
+    Queries made through ``Relationship.connections`` and saved or deleted
+    instances are routed; other queries on the ``Connection`` model are left
+    to the next router.
+    """
+    def db_for_read(self, model, **hints):
+        relationship = _relationship(model, hints)
+        return relationship.using if relationship is not None else None
+    
+    def db_for_write(self, model, **hints):
+        relationship = _relationship(model, hints)
+        return relationship.using if relationship is not None else None
+
+
+class ReplicaRouter(object):
+    """
+    Spreads reads of connections, counters and closures across the
+    replicas of the database they're written to, as given by
+    ``CONNECTIONS_REPLICAS``, unless reads are pinned to that database
+    after a write; see ``connections.replicas``. Pinned reads, writes and
+    reads of other models are left to the next router.
+    """
+    def db_for_read(self, model, **hints):
+        if not issubclass(model, _MODELS) or replicas.is_pinned():
+            return None
+        choices = replicas.get_replicas(router.db_for_write(model, **hints))
+        if not choices:
+            return None
+        relationship = _relationship(model, hints)
+        if relationship is not None and replicas.nodes_pinned(relationship, hints.get('nodes')):
+            return None
+        return random.choice(choices)
@@ -1,7 +1,7 @@
 
-def define_relationship(name, from_model, to_model):
+def define_relationship(name, from_model, to_model, **kwargs):
     from .models import define_relationship as _define_relationship
-    return _define_relationship(name, from_model, to_model)
+    return _define_relationship(name, from_model, to_model, **kwargs)
 
 
 def get_relationship(name):
@@ -9,6 +9,11 @@ def get_relationship(name):
     return _get_relationship(name)
 
 
+def get_relationships(*names):
+    from .models import get_relationships as _get_relationships
+    return _get_relationships(*names)
+
+
 def get_connection(relationship, from_obj, to_obj):
     return get_relationship(relationship).get_connection(from_obj, to_obj)
 
@@ -17,6 +22,14 @@ def create_connection(relationship, from_obj, to_obj):
     return get_relationship(relationship).create_connection(from_obj, to_obj)
 
 
+def create_connections(relationship, pairs):
+    return get_relationship(relationship).create_connections(pairs)
+
+
+def remove_connections(relationship, pairs):
+    return get_relationship(relationship).remove_connections(pairs)
+
+
 def connection_exists(relationship, from_obj, to_obj):
     return get_relationship(relationship).connection_exists(from_obj, to_obj)
 
@@ -29,9 +42,46 @@ def connections_to_object(relationship, to_obj):
     return get_relationship(relationship).connections_to_object(to_obj)
 
 
+def page_connections_from(relationship, from_obj, after=None, limit=50, reverse=False):
+    return get_relationship(relationship).page_connections_from(
+        from_obj, after=after, limit=limit, reverse=reverse)
+
+
+def page_connections_to(relationship, to_obj, after=None, limit=50, reverse=False):
+    return get_relationship(relationship).page_connections_to(
+        to_obj, after=after, limit=limit, reverse=reverse)
+
+
 def connected_objects(relationship, from_obj):
     return get_relationship(relationship).connected_objects(from_obj)
 
 
 def connected_to_objects(relationship, to_obj):
     return get_relationship(relationship).connected_to_objects(to_obj)
+
+
+# Asynchronous versions of the shortcuts above, returning awaitables. They
+# need Python 3.5 and Django 4.1 or later.
+
+def aget_connection(relationship, from_obj, to_obj):
+    return get_relationship(relationship).aget_connection(from_obj, to_obj)
+
+
+def acreate_connection(relationship, from_obj, to_obj):
+    return get_relationship(relationship).acreate_connection(from_obj, to_obj)
+
+
+def aconnection_exists(relationship, from_obj, to_obj):
+    return get_relationship(relationship).aconnection_exists(from_obj, to_obj)
+
+
+def aconnected_object_ids(relationship, from_obj):
+    return get_relationship(relationship).aconnected_object_ids(from_obj)
+
+
+def aconnected_to_object_ids(relationship, to_obj):
+    return get_relationship(relationship).aconnected_to_object_ids(to_obj)
+
+
+def adistance_between(relationship, from_obj, to_obj, limit=2):
+    return get_relationship(relationship).adistance_between(from_obj, to_obj, limit)
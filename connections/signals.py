@@ -2,10 +2,22 @@ from django.dispatch import Signal
 
 
 # sent just after a new connection is created and saved to the database.
-# sender is the connection's relationship.
-connection_created = Signal(providing_args=['connection'])
+# sender is the connection's relationship, ``connection`` the connection.
+connection_created = Signal()
 
 
 # sent just after a connection is deleted.
-# sender is the connection's relationship.
-connection_removed = Signal(providing_args=['connection'])
+# sender is the connection's relationship, ``connection`` the connection.
+connection_removed = Signal()
+
+
+# sent once per transaction, after it commits, for each relationship that
+# had connections created in it. sender is the relationship, ``pairs`` the
+# list of the ``(from_pk, to_pk)`` pairs of the new connections.
+connections_created_batch = Signal()
+
+
+# sent once per transaction, after it commits, for each relationship that
+# had connections deleted in it. sender is the relationship, ``pairs`` the
+# list of the ``(from_pk, to_pk)`` pairs of the deleted connections.
+connections_removed_batch = Signal()
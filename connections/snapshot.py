@@ -0,0 +1,357 @@
+"""
+In-memory snapshots of relationships.
+
+Relationships defined with ``snapshot=True`` answer ``connection_exists``,
+``connected_object_ids``, ``connected_to_object_ids`` and
+``distance_between`` from a copy of their connections kept in the memory of
+the process, without querying the database. Connections are held in
+compressed sparse row (CSR) form, once per direction: a sorted array of the
+primary keys of the nodes with connections, and for each of them a range of
+an array of the primary keys they're connected with, sorted too. Lookups
+are binary searches in ``array.array`` columns of 64-bit integers, costing
+about 16 bytes per connection.
+
+Snapshots are loaded on first use, or with ``GraphSnapshot.load()``, with
+one query per direction reading connections in the order of the indexes on
+``(relationship_id, from_pk, to_pk)`` and ``(relationship_id, to_pk,
+from_pk)``, so that nothing needs sorting in Python.
+
+Connections created and removed through ``connections`` in this process
+are applied once their transaction commits, from the
+``connections_created_batch`` and ``connections_removed_batch`` signals, to
+an overlay of sets, which is merged into the arrays when it grows past
+``OVERLAY_SIZE`` connections. Connections created by other processes are
+picked up by ``refresh()``, which reads the connections dated since the
+snapshot was last loaded or refreshed, and is called by reads every
+``refresh_interval`` seconds if one is given. Connections removed by other
+processes, or written behind the back of ``connections``, are only dropped
+when the snapshot is reloaded.
+"""
+
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .arrays import CHUNK_SIZE, INT64
+from .cache import IN, OUT
+from .signals import connections_created_batch, connections_removed_batch
+from .utils import iterate
+
+
+# Number of connections applied to a snapshot since it was loaded after
+# which they're merged into its arrays.
+OVERLAY_SIZE = 10000
+
+# How long before a load or refresh started ``refresh()`` reads connections
+# from, so that connections committed after then, but dated before, aren't
+# missed.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+logger = logging.getLogger('connections.snapshot')
+
+# ``offsets[i]:offsets[i + 1]`` is the range of ``targets`` holding the
+# primary keys of the nodes connected with ``nodes[i]``.
+CSR = namedtuple('CSR', ('nodes', 'offsets', 'targets'))
+
+
+def build_csr(rows):
+    """
+    Returns a ``CSR`` of the given ``(pk, other_pk)`` rows, which must be
+    sorted.
+    """
+    nodes, offsets, targets = array(INT64), array(INT64), array(INT64)
+    last = None
+    for pk, other_pk in rows:
+        if pk != last:
+            nodes.append(pk)
+            offsets.append(len(targets))
+            last = pk
+        targets.append(other_pk)
+    offsets.append(len(targets))
+    return CSR(nodes, offsets, targets)
+
+
+def _span(csr, pk):
+    i = bisect_left(csr.nodes, pk)
+    if i < len(csr.nodes) and csr.nodes[i] == pk:
+        return csr.offsets[i], csr.offsets[i + 1]
+    return 0, 0
+
+
+def _discard(overlay, pk, other_pk):
+    ids = overlay.get(pk)
+    if ids is not None:
+        ids.discard(other_pk)
+        if not ids:
+            del overlay[pk]
+
+
+class GraphSnapshot(object):
+    """
+    Keeps the connections of a relationship in memory. Reads first call
+    ``refresh()`` if it was last called more than ``refresh_interval``
+    seconds ago, unless that is ``None``.
+    """
+    def __init__(self, relationship, refresh_interval=None):
+        self.relationship = relationship
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._csrs = None
+        self._pending = None
+        self._since = None
+        self._refreshed = None
+        self._reset_overlay()
+    
+    def _reset_overlay(self):
+        # Connections added to and removed from the arrays, by side and node.
+        self._added = {OUT: {}, IN: {}}
+        self._removed = {OUT: {}, IN: {}}
+        self._changes = 0
+    
+    @property
+    def loaded(self):
+        """
+        Whether the snapshot has been loaded.
+        """
+        return self._csrs is not None
+    
+    @property
+    def fresh(self):
+        """
+        Whether the snapshot has been loaded and reads won't refresh it.
+        """
+        return self._csrs is not None and not self._due()
+    
+    def _due(self):
+        return (self.refresh_interval is not None and
+                time.time() - self._refreshed >= self.refresh_interval)
+    
+    def load(self):
+        """
+        Reads all connections of the relationship into memory, replacing the
+        snapshot. Costs one query per direction.
+        """
+        started = timezone.now()
+        with self._lock:
+            self._pending = []
+        try:
+            qs = self.relationship.connections.order_by()
+            csrs = {}
+            for side, fields in ((OUT, ('from_pk', 'to_pk')), (IN, ('to_pk', 'from_pk'))):
+                rows = qs.order_by(*fields).values_list(*fields)
+                csrs[side] = build_csr(iterate(rows, CHUNK_SIZE))
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._csrs = csrs
+            self._reset_overlay()
+            # apply changes committed while loading, which may be missing
+            pending, self._pending = self._pending, None
+            for created, pairs in pending:
+                self._apply(created, pairs)
+            self._since = started - REFRESH_OVERLAP
+            self._refreshed = time.time()
+        logger.debug('Loaded %d connections of "%s" into %d bytes', len(self),
+                     self.relationship.name, self.memory_usage())
+    
+    def refresh(self):
+        """
+        Applies the connections dated since the snapshot was last loaded or
+        refreshed, e.g. created by other processes, costing one query.
+        Loads the snapshot if it isn't loaded. Returns the number of
+        connections read.
+        """
+        if self._csrs is None:
+            self._ensure_loaded()
+            return len(self)
+        started = timezone.now()
+        self._refreshed = time.time()
+        pairs = list(self.relationship.connections.filter(date__gte=self._since)
+                     .values_list('from_pk', 'to_pk'))
+        self.created(pairs)
+        with self._lock:
+            self._since = started - REFRESH_OVERLAP
+        return len(pairs)
+    
+    def clear(self):
+        """
+        Drops the snapshot, e.g. after connections were written behind the
+        back of ``connections``. It's loaded again on next use.
+        """
+        with self._lock:
+            self._csrs = None
+            self._reset_overlay()
+    
+    def created(self, pairs):
+        """
+        Applies the creation of connections between the given stored
+        ``(from_pk, to_pk)`` pairs.
+        """
+        self._record(True, pairs)
+    
+    def removed(self, pairs):
+        """
+        Applies the removal of connections between the given stored
+        ``(from_pk, to_pk)`` pairs.
+        """
+        self._record(False, pairs)
+    
+    def _record(self, created, pairs):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((created, list(pairs)))
+            if self._csrs is not None:
+                self._apply(created, pairs)
+                if self._changes > OVERLAY_SIZE:
+                    self._merge()
+    
+    def _apply(self, created, pairs):
+        added, removed = ((self._added, self._removed) if created
+                          else (self._removed, self._added))
+        for from_pk, to_pk in pairs:
+            stored = self._stored(from_pk, to_pk)
+            for side, pk, other_pk in ((OUT, from_pk, to_pk), (IN, to_pk, from_pk)):
+                _discard(removed[side], pk, other_pk)
+                if created != stored:
+                    added[side].setdefault(pk, set()).add(other_pk)
+            self._changes += 1
+    
+    def _merge(self):
+        """
+        Merges the overlay into the arrays.
+        """
+        self._csrs = dict((side, build_csr(self._rows(side))) for side in (OUT, IN))
+        self._reset_overlay()
+    
+    def _rows(self, side):
+        csr, added, removed = self._csrs[side], self._added[side], self._removed[side]
+        last = None
+        for pk in heapq.merge(csr.nodes, sorted(added)):
+            if pk == last:
+                continue
+            last = pk
+            if pk in added or pk in removed:
+                for other_pk in sorted(self._ids(side, pk)):
+                    yield pk, other_pk
+            else:
+                start, end = _span(csr, pk)
+                for i in range(start, end):
+                    yield pk, csr.targets[i]
+    
+    def _stored(self, from_pk, to_pk):
+        """
+        Returns whether the arrays hold a connection between the given pair.
+        """
+        csr = self._csrs[OUT]
+        start, end = _span(csr, from_pk)
+        i = bisect_left(csr.targets, to_pk, start, end)
+        return i < end and csr.targets[i] == to_pk
+    
+    def _ids(self, side, pk):
+        csr = self._csrs[side]
+        start, end = _span(csr, pk)
+        ids = set(csr.targets[start:end])
+        ids.difference_update(self._removed[side].get(pk, ()))
+        ids.update(self._added[side].get(pk, ()))
+        return ids
+    
+    def _sides(self, side):
+        # connections of symmetric relationships are stored one way only
+        return (OUT, IN) if self.relationship.symmetric else (side,)
+    
+    def _ensure_loaded(self):
+        with self._load_lock:
+            if self._csrs is None:
+                self.load()
+    
+    def _ready(self):
+        if self._csrs is None:
+            self._ensure_loaded()
+        elif self._due():
+            self.refresh()
+    
+    def connection_exists(self, from_pk, to_pk):
+        """
+        Returns whether there's a connection between the given stored
+        ``(from_pk, to_pk)`` pair.
+        """
+        self._ready()
+        with self._lock:
+            if to_pk in self._added[OUT].get(from_pk, ()):
+                return True
+            if to_pk in self._removed[OUT].get(from_pk, ()):
+                return False
+            return self._stored(from_pk, to_pk)
+    
+    def get(self, side, pk):
+        """
+        Returns the ``frozenset`` of IDs of the objects connected to the node
+        with the given ``pk`` on ``side``, like ``AdjacencyCache.get()``.
+        """
+        return frozenset(self.expand(side, [pk]))
+    
+    def expand(self, side, pks):
+        """
+        Returns the set of IDs of the objects connected to any of the nodes
+        with the given ``pks`` on ``side``.
+        """
+        self._ready()
+        found = set()
+        with self._lock:
+            for pk in pks:
+                for s in self._sides(side):
+                    found.update(self._ids(s, pk))
+        return found
+    
+    def __len__(self):
+        """
+        Returns the number of connections in the snapshot.
+        """
+        with self._lock:
+            if self._csrs is None:
+                return 0
+            return (len(self._csrs[OUT].targets) +
+                    sum(len(ids) for ids in self._added[OUT].values()) -
+                    sum(len(ids) for ids in self._removed[OUT].values()))
+    
+    def memory_usage(self):
+        """
+        Returns an estimate of the number of bytes the snapshot takes up:
+        the size of its arrays, plus that of the sets of its overlay.
+        """
+        with self._lock:
+            if self._csrs is None:
+                return 0
+            total = sum(column.itemsize * len(column)
+                        for csr in self._csrs.values() for column in csr)
+            for overlay in (self._added, self._removed):
+                for nodes in overlay.values():
+                    if nodes:
+                        total += sys.getsizeof(nodes)
+                        total += sum(sys.getsizeof(ids) for ids in nodes.values())
+            return total
+
+
+def _created_handler(sender, pairs, **kwargs):
+    snapshot = getattr(sender, 'snapshot', None)
+    if snapshot is not None:
+        snapshot.created(pairs)
+connections_created_batch.connect(_created_handler)
+
+
+def _removed_handler(sender, pairs, **kwargs):
+    snapshot = getattr(sender, 'snapshot', None)
+    if snapshot is not None:
+        snapshot.removed(pairs)
+connections_removed_batch.connect(_removed_handler)
@@ -1,12 +1,18 @@
 from django import template
 
+from ..instrumentation import instrumented_tag
 from ..models import get_relationship
 
 
 register = template.Library()
 
+# ``simple_tag`` supports ``as variable`` since Django 1.9, and
+# ``assignment_tag`` is gone since Django 2.0.
+assignment_tag = getattr(register, 'assignment_tag', register.simple_tag)
 
-@register.assignment_tag
+
+@assignment_tag
+@instrumented_tag
 def get_connection_distance(relationship, obj1, obj2, limit=2):
     """
     Calculates the distance between the two given objects for the given
@@ -19,23 +25,50 @@ def get_connection_distance(relationship, obj1, obj2, limit=2):
     return get_relationship(relationship).distance_between(obj1, obj2, limit)
 
 
-@register.assignment_tag
-def connections_from_object(relationship, obj1):
+@assignment_tag
+@instrumented_tag
+def connections_from_object(relationship, obj1, with_objects=False):
     """
+    Pass ``with_objects=True`` to fetch the connected objects in bulk, if
+    you're going to access ``to_object`` on each connection.
+    
         {% connections_from_object 'relationship_name' obj1 as connections %}
+        {% connections_from_object 'relationship_name' obj1 with_objects=True as connections %}
+    
     """
-    return get_relationship(relationship).connections_from_object(obj1)
+    relationship = get_relationship(relationship)
+    connections = relationship.connections_from_object(obj1)
+    if with_objects:
+        # ``obj1`` is known to be at the other end, unless the relationship
+        # is symmetric
+        connections = connections.with_objects('both' if relationship.symmetric
+                                               else 'to')
+    return connections
 
 
-@register.assignment_tag
-def connections_to_object(relationship, obj1):
+@assignment_tag
+@instrumented_tag
+def connections_to_object(relationship, obj1, with_objects=False):
     """
+    Pass ``with_objects=True`` to fetch the connected objects in bulk, if
+    you're going to access ``from_object`` on each connection.
+    
         {% connections_to_object 'relationship_name' obj1 as connections %}
+        {% connections_to_object 'relationship_name' obj1 with_objects=True as connections %}
+    
     """
-    return get_relationship(relationship).connections_to_object(obj1)
+    relationship = get_relationship(relationship)
+    connections = relationship.connections_to_object(obj1)
+    if with_objects:
+        # ``obj1`` is known to be at the other end, unless the relationship
+        # is symmetric
+        connections = connections.with_objects('both' if relationship.symmetric
+                                               else 'from')
+    return connections
 
 
-@register.assignment_tag
+@assignment_tag
+@instrumented_tag
 def connection_exists(relationship, obj1, obj2):
     """
         {% connection_exists 'relationship_name' obj1 obj2 as connections %}
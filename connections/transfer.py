@@ -0,0 +1,404 @@
+"""
+Streaming export and import of connections.
+
+Connections are written as JSON lines or CSV rows with the fields in
+``FIELDS``, one connection per line. Relationships are referred to by name,
+so files may be moved between databases. Rows are streamed in both
+directions, so memory use does not depend on the number of connections.
+
+On PostgreSQL, imports ``COPY`` rows into a temporary staging table and
+move them into the connections table with a single
+``INSERT ... ON CONFLICT DO NOTHING``. On other backends, rows are inserted
+in batches with ``bulk_create``, skipping connections that already exist.
+Imports do not send ``connection_created``; instead, the counters of the
+relationships imported into are rebuilt and their caches invalidated once
+all rows are in.
+"""
+
+import csv
+import io
+import json
+from collections import namedtuple
+
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    # Python 2.6
+    OrderedDict = dict
+
+from django.conf import settings
+from django.db import connections as db_connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (BULK_BATCH_SIZE, Connection, Relationship,
+    get_relationship, _bulk_insert, _pairs_q, _relationship_registry)
+from .utils import chunked, iterate
+
+
+FORMATS = ('jsonl', 'csv')
+
+FIELDS = ('relationship', 'from_pk', 'to_pk', 'weight', 'date')
+
+# Number of rows fetched from the database, or sent to ``COPY``, at a time.
+CHUNK_SIZE = 2000
+
+# A connection read from a file. ``weight`` and ``date`` are ``None`` when
+# missing, in which case the model defaults are used.
+Row = namedtuple('Row', ('line',) + FIELDS)
+
+
+def export_connections(relationships, stream, format='jsonl',
+                       chunk_size=CHUNK_SIZE):
+    """
+    Writes all connections of the given relationships to the text ``stream``
+    in the given ``format``, and returns the number of connections written.
+    """
+    if format == 'csv':
+        writer = csv.writer(stream, lineterminator='\n')
+        writer.writerow(FIELDS)
+        write = writer.writerow
+    elif format == 'jsonl':
+        write = lambda row: stream.write(
+            json.dumps(OrderedDict(zip(FIELDS, row))) + '\n')
+    else:
+        raise ValueError(format)
+    
+    count = 0
+    for relationship in relationships:
+        qs = (relationship.connections.order_by()
+              .values_list('from_pk', 'to_pk', 'weight', 'date'))
+        for from_pk, to_pk, weight, date in iterate(qs, chunk_size):
+            write((relationship.name, from_pk, to_pk, weight, date.isoformat()))
+            count += 1
+    return count
+
+
+def read_connections(stream, format='jsonl'):
+    """
+    Parses connections from the text ``stream`` in the given ``format``,
+    yielding a ``Row`` for each. Raises ``ValueError`` for malformed rows.
+    """
+    if format == 'csv':
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        for values in reader:
+            if values:
+                yield _parse_row(reader.line_num, dict(zip(header, values)))
+    elif format == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                data = json.loads(text)
+            except ValueError:
+                raise ValueError('line %d: invalid JSON' % line)
+            yield _parse_row(line, data)
+    else:
+        raise ValueError(format)
+
+
+def _parse_row(line, data):
+    try:
+        weight = data.get('weight')
+        return Row(line, data['relationship'],
+                   int(data['from_pk']), int(data['to_pk']),
+                   None if weight in (None, '') else float(weight),
+                   _parse_date(data.get('date')))
+    except KeyError as e:
+        raise ValueError('line %d: missing field %s' % (line, e))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError('line %d: %s' % (line, e))
+
+
+def _parse_date(value):
+    if value in (None, ''):
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError('invalid date %r' % value)
+    # Dates are stored as the ``DateTimeField`` would store them, naive dates
+    # being in the default time zone.
+    default_timezone = timezone.get_default_timezone()
+    if timezone.is_aware(date) and not settings.USE_TZ:
+        date = timezone.make_naive(date, default_timezone)
+    elif timezone.is_naive(date) and settings.USE_TZ:
+        date = timezone.make_aware(date, default_timezone)
+    return date
+
+
+def _lookup(name, relationships):
+    """
+    Returns the relationship with the given name, remembering it in the
+    ``relationships`` dictionary, or ``None`` if there's no such relationship.
+    """
+    if name not in relationships:
+        try:
+            relationships[name] = get_relationship(name)
+        except Relationship.DoesNotExist:
+            return None
+    return relationships[name]
+
+
+def scan_connections(rows):
+    """
+    Returns a ``(names, min_pk, max_pk)`` tuple with the set of relationship
+    names and the range of ``from_pk`` values of the given rows.
+    """
+    names, min_pk, max_pk = set(), None, None
+    for row in rows:
+        names.add(row.relationship)
+        if min_pk is None or row.from_pk < min_pk:
+            min_pk = row.from_pk
+        if max_pk is None or row.from_pk > max_pk:
+            max_pk = row.from_pk
+    return names, min_pk, max_pk
+
+
+def split_range(min_pk, max_pk, n):
+    """
+    Splits the inclusive range of primary keys from ``min_pk`` to ``max_pk``
+    into at most ``n`` contiguous ``(start, stop)`` half-open ranges.
+    """
+    size = max(1, -(-(max_pk - min_pk + 1) // n))
+    return [(start, min(start + size, max_pk + 1))
+            for start in range(min_pk, max_pk + 1, size)]
+
+
+def validate_connections(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Checks that the relationship of each of the given rows is registered and
+    that both objects it connects exist, costing one query per model per
+    ``batch_size`` rows. Nothing is written to the database.
+    
+    Returns a ``(count, errors)`` tuple with the number of rows checked and
+    a list of error messages for invalid rows.
+    """
+    relationships = {}
+    count, errors = 0, []
+    for chunk in chunked(rows, batch_size):
+        count += len(chunk)
+        pks, valid = {}, []
+        for row in chunk:
+            relationship = _lookup(row.relationship, relationships)
+            if relationship is None:
+                errors.append('line %d: unknown relationship "%s"' %
+                              (row.line, row.relationship))
+                continue
+            valid.append((relationship, row))
+            pks.setdefault(relationship.from_model, set()).add(row.from_pk)
+            pks.setdefault(relationship.to_model, set()).add(row.to_pk)
+        existing = dict((model, set(model._base_manager.filter(pk__in=model_pks)
+                                    .values_list('pk', flat=True)))
+                        for model, model_pks in pks.items())
+        for relationship, row in valid:
+            for model, pk in ((relationship.from_model, row.from_pk),
+                              (relationship.to_model, row.to_pk)):
+                if pk not in existing[model]:
+                    errors.append('line %d: %s.%s %s does not exist' %
+                                  (row.line, model._meta.app_label,
+                                   model._meta.object_name, pk))
+    return count, errors
+
+
+def import_connections(rows, batch_size=BULK_BATCH_SIZE, using=None,
+                       progress=None, refresh=True):
+    """
+    Creates connections for the given rows, skipping those that already
+    exist, and returns the number of connections created. Raises
+    ``ValueError`` if a row refers to an unknown relationship.
+    
+    ``progress``, if given, is called with the number of rows read so far
+    every ``batch_size`` rows. Unless ``refresh`` is ``False``, counters and
+    caches of the relationships imported into are refreshed afterwards.
+    
+    Connections are written to database ``using`` if given, else to the
+    database each relationship is routed to.
+    """
+    if using is None:
+        databases = set(relationship.db_for_write
+                        for relationship in _relationship_registry.values())
+        if len(databases) <= 1:
+            using = databases.pop() if databases else router.db_for_write(Connection)
+    relationships = {}
+    rows = _resolve(rows, relationships)
+    if progress is not None:
+        rows = _reporting(rows, batch_size, progress)
+    
+    if using is not None and db_connections[using].vendor == 'postgresql':
+        created = _copy_import(rows, using)
+    else:
+        created = _batch_import(rows, batch_size, using)
+    
+    if refresh:
+        refresh_relationships(relationships.values())
+    return created
+
+
+def refresh_relationships(relationships):
+    """
+    Rebuilds the counters and closures and invalidates the caches and
+    snapshots of the given relationships, after connections were written
+    behind their back.
+    """
+    for relationship in relationships:
+        if relationship.counters:
+            relationship.rebuild_counters()
+        if relationship.closure:
+            relationship.rebuild_closure()
+        if relationship.cache is not None:
+            relationship.cache.invalidate()
+        if relationship.snapshot is not None:
+            relationship.snapshot.clear()
+
+
+def _resolve(rows, relationships):
+    for row in rows:
+        relationship = _lookup(row.relationship, relationships)
+        if relationship is None:
+            raise ValueError('line %d: unknown relationship "%s"' %
+                             (row.line, row.relationship))
+        if relationship.symmetric:
+            from_pk, to_pk = relationship.canonical_pair(row.from_pk, row.to_pk)
+            row = row._replace(from_pk=from_pk, to_pk=to_pk)
+        yield relationship, row
+
+
+def _reporting(rows, every, progress):
+    count = 0
+    for item in rows:
+        yield item
+        count += 1
+        if count % every == 0:
+            progress(count)
+
+
+def _batch_import(rows, batch_size, using):
+    created = 0
+    for chunk in chunked(rows, batch_size):
+        databases = {}
+        for relationship, row in chunk:
+            groups = databases.setdefault(using or relationship.db_for_write, {})
+            groups.setdefault(relationship, {})[(row.from_pk, row.to_pk)] = row
+        for db, groups in databases.items():
+            with transaction.atomic(using=db):
+                for relationship, group in groups.items():
+                    existing = set(relationship._all_connections().using(db)
+                                   .filter(_pairs_q(group))
+                                   .values_list('from_pk', 'to_pk'))
+                    connections = [_connection(relationship, row)
+                                   for key, row in group.items()
+                                   if key not in existing]
+                    _bulk_insert(connections, using=db)
+                    created += len(connections)
+    return created
+
+
+def _connection(relationship, row):
+    connection = Connection(relationship_id=relationship.id,
+                            from_pk=row.from_pk, to_pk=row.to_pk)
+    if row.weight is not None:
+        connection.weight = row.weight
+    if row.date is not None:
+        connection.date = row.date
+    if relationship.ttl is not None:
+        connection.expires = connection.date + relationship.ttl
+    return connection
+
+
+_STAGING_SQL = """
+CREATE TEMPORARY TABLE connections_staging (
+    relationship_id integer NOT NULL,
+    from_pk bigint NOT NULL,
+    to_pk bigint NOT NULL,
+    weight double precision,
+    date timestamp with time zone,
+    ttl double precision
+) ON COMMIT DROP
+"""
+
+_COPY_SQL = 'COPY connections_staging FROM STDIN WITH CSV'
+
+_INSERT_SQL = """
+INSERT INTO %(table)s (relationship_id, from_pk, to_pk, weight, date, expires)
+SELECT relationship_id, from_pk, to_pk, COALESCE(weight, 1), COALESCE(date, now()),
+       COALESCE(date, now()) + ttl * interval '1 second'
+FROM connections_staging
+ON CONFLICT (relationship_id, from_pk, to_pk) DO NOTHING
+"""
+
+
+def _copy_import(rows, using):
+    connection = db_connections[using]
+    table = connection.ops.quote_name(Connection._meta.db_table)
+    with transaction.atomic(using=using):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(_STAGING_SQL)
+            _copy(cursor.cursor, _COPY_SQL, _csv_chunks(rows))
+            cursor.execute(_INSERT_SQL % {'table': table})
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+
+def _copy(cursor, sql, chunks):
+    if hasattr(cursor, 'copy_expert'):
+        # psycopg2
+        cursor.copy_expert(sql, _ChunksReader(chunks))
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            for chunk in chunks:
+                copy.write(chunk)
+
+
+def _csv_chunks(rows):
+    for chunk in chunked(rows, CHUNK_SIZE):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        for relationship, row in chunk:
+            writer.writerow((relationship.id, row.from_pk, row.to_pk,
+                             '' if row.weight is None else row.weight,
+                             '' if row.date is None else row.date.isoformat(),
+                             '' if relationship.ttl is None else
+                             relationship.ttl.total_seconds()))
+        yield buf.getvalue()
+
+
+class _ChunksReader(object):
+    """
+    A read-only file-like object over an iterable of strings, for feeding
+    ``COPY`` without buffering all of its input.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+    
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def import_file(path, format='jsonl', start=None, stop=None,
+                batch_size=BULK_BATCH_SIZE, using=None):
+    """
+    Imports the connections in the file at ``path`` whose ``from_pk`` falls
+    in the half-open range from ``start`` to ``stop``, without refreshing
+    counters and caches. Used by the parallel workers of the
+    ``connections_import`` command.
+    """
+    with open(path) as stream:
+        rows = (row for row in read_connections(stream, format)
+                if (start is None or row.from_pk >= start) and
+                   (stop is None or row.from_pk < stop))
+        return import_connections(rows, batch_size=batch_size, using=using,
+                                  refresh=False)
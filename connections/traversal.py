@@ -0,0 +1,490 @@
+"""
+Graph traversal routines used by ``Relationship``.
+
+Distances are computed by searching from both ends at once: a forward
+search from the source and a backward search from the destination, each
+going at most half of the way. On PostgreSQL and SQLite both searches run
+in a single recursive query; on any other backend they fall back to a
+batched breadth-first search that issues one query per expanded level.
+Relationships with an adjacency cache always use the breadth-first search,
+reading the adjacency sets of each level from the cache, and so do those
+with a snapshot, from memory, without any query. So do symmetric
+relationships, following connections both ways with one ``UNION`` query
+per level, and relationships with a TTL, whose expired connections the
+recursive queries would follow.
+
+Weighted shortest paths are found with Dijkstra's algorithm, expanding
+the cheapest nodes of the frontier in batches, one query per batch.
+
+Neighbourhoods, i.e. the nodes within a number of hops of a node, are
+found with a single query on PostgreSQL and SQLite, chaining one common
+table expression per hop, each selecting the nodes not reached by the
+previous ones, up to the number of nodes still wanted. Elsewhere, they're
+found with a breadth-first search costing one query per hop.
+"""
+
+import heapq
+import itertools
+
+from django.db import connections as db_connections
+
+from .cache import IN, OUT
+from .utils import chunked
+
+
+# Backends known to support ``WITH RECURSIVE`` common table expressions.
+CTE_VENDORS = ('postgresql', 'sqlite')
+
+# Maximum number of primary keys sent in a single ``IN (...)`` clause by the
+# breadth-first fallback. Keeps us well under SQLite's parameters limit.
+BATCH_SIZE = 500
+
+# Default number of nodes expanded per query by ``shortest_path``.
+FRONTIER_SIZE = 100
+
+# Default maximum number of nodes ``shortest_path`` expands before giving up.
+MAX_EXPANDED_NODES = 10000
+
+# Default maximum number of nodes returned by ``neighbourhood``.
+MAX_NEIGHBOURHOOD_NODES = 10000
+
+# Default maximum number of connections ``neighbourhood`` follows from each
+# node.
+MAX_FANOUT = 1000
+
+
+class SearchLimitExceeded(Exception):
+    """
+    Raised by ``shortest_path`` when finding the cheapest path would take
+    expanding more than ``max_nodes`` nodes. ``path`` and ``cost`` are those
+    of the cheapest path found so far, which may not be the cheapest, or
+    ``None``.
+    """
+    def __init__(self, max_nodes, path=None, cost=None):
+        super(SearchLimitExceeded, self).__init__(
+            'Expanded more than %d nodes without finding the cheapest path' % max_nodes)
+        self.path = path
+        self.cost = cost
+
+
+_DISTANCE_SQL = """
+WITH RECURSIVE
+    fwd(node, depth) AS (
+        SELECT %s, 0
+        UNION
+        SELECT c.{to_pk}, f.depth + 1
+        FROM {table} c INNER JOIN fwd f ON c.{from_pk} = f.node
+        WHERE c.{relationship} = %s AND f.depth < %s
+    ),
+    bwd(node, depth) AS (
+        SELECT %s, 0
+        UNION
+        SELECT c.{from_pk}, b.depth + 1
+        FROM {table} c INNER JOIN bwd b ON c.{to_pk} = b.node
+        WHERE c.{relationship} = %s AND b.depth < %s
+    )
+SELECT MIN(f.depth + b.depth)
+FROM fwd f INNER JOIN bwd b ON f.node = b.node
+"""
+
+
+# One hop of a neighbourhood: the nodes reached from the previous hop ``h``
+# that no earlier hop has reached.
+_HOP_SQL = """
+    hop{depth}(node) AS (
+        SELECT DISTINCT c.{to_pk}
+        FROM {table} c INNER JOIN hop{previous} h ON c.{from_pk} = h.node
+        WHERE c.{relationship} = %s{fanout}
+            AND c.{to_pk} NOT IN ({seen})
+        ORDER BY c.{to_pk}{limit}
+    )"""
+
+# Follows only the most recent connections of each node.
+_FANOUT_SQL = """
+            AND c.{id} IN (
+                SELECT f.{id} FROM {table} f
+                WHERE f.{relationship} = %s AND f.{from_pk} = h.node
+                ORDER BY f.{date} DESC, f.{id} DESC
+                LIMIT %s
+            )"""
+
+
+def _split_limit(limit):
+    """
+    Returns how deep the forward and the backward searches must go for
+    a bidirectional search to cover paths of up to ``limit`` edges.
+    """
+    forward = (limit + 1) // 2
+    return forward, limit - forward
+
+
+def _format_sql(connection, sql, **kwargs):
+    from .models import Connection
+    opts = Connection._meta
+    qn = connection.ops.quote_name
+    
+    def column(name):
+        return qn(opts.get_field(name).column)
+    
+    return sql.format(
+        table=qn(opts.db_table),
+        relationship=column('relationship_id'),
+        from_pk=column('from_pk'),
+        to_pk=column('to_pk'),
+        id=column('id'),
+        date=column('date'),
+        **kwargs
+    )
+
+
+def _distance_sql(connection):
+    return _format_sql(connection, _DISTANCE_SQL)
+
+
+def cte_distance(relationship, from_pk, to_pk, limit):
+    """
+    Computes the distance between two nodes with a single recursive query.
+    Each search keeps one row per ``(node, depth)`` pair, so duplicate paths
+    reaching the same node at the same level are collapsed before being
+    expanded further.
+    """
+    using = relationship._connections((OUT, from_pk), (IN, to_pk)).db
+    connection = db_connections[using]
+    forward, backward = _split_limit(limit)
+    params = [from_pk, relationship.id, forward,
+              to_pk, relationship.id, backward]
+    cursor = connection.cursor()
+    try:
+        cursor.execute(_distance_sql(connection), params)
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+
+def expand_queryset(relationship, chunk, side):
+    """
+    Returns a query set of the IDs of the nodes reachable in one step from
+    the given nodes, following connections forward if ``side`` is ``'out'``
+    or backward if it is ``'in'``, or both ways for symmetric relationships.
+    """
+    return relationship._adjacency(side, chunk, flat=True)
+
+
+def _expand(relationship, frontier, side, visited):
+    """
+    Returns the set of nodes reachable in one step from ``frontier`` that
+    have not been ``visited`` yet, following connections forward if
+    ``side`` is ``'out'`` or backward if it is ``'in'``.
+    """
+    if relationship.snapshot is not None:
+        found = relationship.snapshot.expand(side, frontier)
+        found.difference_update(visited)
+        return found
+    found = set()
+    if relationship.cache is not None:
+        for ids in relationship.cache.get_many(side, frontier).values():
+            found.update(ids)
+    else:
+        for chunk in chunked(frontier, BATCH_SIZE):
+            found.update(expand_queryset(relationship, chunk, side))
+    found.difference_update(visited)
+    return found
+
+
+class BidirectionalSearch(object):
+    """
+    The state of a bidirectional breadth-first search, which always expands
+    the smaller of the two frontiers. Expanding frontiers is left to the
+    caller, so that the search may be driven by synchronous as well as
+    asynchronous code.
+    """
+    def __init__(self, from_pk, to_pk, limit):
+        self.limit = limit
+        self.seen = {OUT: {from_pk: 0}, IN: {to_pk: 0}}
+        self.frontier = {OUT: set([from_pk]), IN: set([to_pk])}
+        self.depth = {OUT: 0, IN: 0}
+        self.distance = 0 if from_pk == to_pk else None
+    
+    def next_side(self):
+        """
+        Returns the side whose frontier should be expanded next, or ``None``
+        if the search is over.
+        """
+        if (self.distance is not None or
+                self.depth[OUT] + self.depth[IN] >= self.limit):
+            return None
+        forward, backward = self.frontier[OUT], self.frontier[IN]
+        if forward and (not backward or len(forward) <= len(backward)):
+            return OUT
+        if backward:
+            return IN
+        return None
+    
+    def advance(self, side, found):
+        """
+        Makes the given set of newly found nodes the frontier of ``side``,
+        setting ``distance`` if the two searches met.
+        """
+        other = IN if side == OUT else OUT
+        self.depth[side] += 1
+        self.frontier[side] = found
+        for pk in found:
+            self.seen[side][pk] = self.depth[side]
+        meet = found.intersection(self.seen[other])
+        if meet:
+            self.distance = self.depth[side] + min(self.seen[other][pk] for pk in meet)
+
+
+def bfs_distance(relationship, from_pk, to_pk, limit):
+    """
+    Computes the distance between two nodes with a bidirectional
+    breadth-first search. Each expanded level costs one query per
+    ``BATCH_SIZE`` frontier nodes.
+    """
+    search = BidirectionalSearch(from_pk, to_pk, limit)
+    side = search.next_side()
+    while side is not None:
+        search.advance(side, _expand(relationship, search.frontier[side], side,
+                                     search.seen[side]))
+        side = search.next_side()
+    return search.distance
+
+
+def distance(relationship, from_pk, to_pk, limit):
+    """
+    Returns the length of the shortest path from ``from_pk`` to ``to_pk``
+    that is at most ``limit`` edges long, or ``None`` if there's no such
+    path.
+    """
+    if from_pk == to_pk:
+        return 0
+    if limit < 1:
+        return None
+    vendor = db_connections[relationship.connections.db].vendor
+    # The recursive query only follows connections the way they're stored,
+    # expired or not.
+    if (relationship.cache is None and relationship.snapshot is None and
+            not relationship.symmetric and relationship.ttl is None and
+            vendor in CTE_VENDORS):
+        return cte_distance(relationship, from_pk, to_pk, limit)
+    return bfs_distance(relationship, from_pk, to_pk, limit)
+
+
+def _neighbourhood_sql(connection, depth, max_nodes, max_fanout):
+    fanout = _format_sql(connection, _FANOUT_SQL) if max_fanout is not None else ''
+    hops = ['\n    hop0(node) AS (SELECT %s)']
+    for level in range(1, depth + 1):
+        seen = ' UNION ALL '.join('SELECT node FROM hop%d' % i for i in range(level))
+        limit = ''
+        if max_nodes is not None:
+            # only as many nodes as are still wanted
+            limit = '\n        LIMIT %%s - (SELECT COUNT(*) FROM (%s) s)' % seen
+        hops.append(_format_sql(connection, _HOP_SQL, depth=level, previous=level - 1,
+                                fanout=fanout, seen=seen, limit=limit))
+    select = '\nUNION ALL\n'.join('SELECT node, %d FROM hop%d' % (level, level)
+                                   for level in range(depth + 1))
+    return 'WITH' + ','.join(hops) + '\n' + select
+
+
+def cte_neighbourhood(relationship, pk, depth, max_nodes, max_fanout):
+    """
+    Finds the neighbourhood of a node with a single query. Each hop only
+    selects nodes that no earlier hop reached, and no more than are still
+    wanted, so that every node is expanded once and ``max_nodes`` bounds the
+    number of nodes expanded as well as returned.
+    """
+    if depth < 1:
+        return {pk: 0}
+    connection = db_connections[relationship._connections((OUT, pk)).db]
+    params = [pk]
+    for level in range(depth):
+        params.append(relationship.id)
+        if max_fanout is not None:
+            params.extend([relationship.id, max_fanout])
+        if max_nodes is not None:
+            params.append(max_nodes)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(_neighbourhood_sql(connection, depth, max_nodes, max_fanout),
+                       params)
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _fanout(relationship, chunk, max_fanout):
+    """
+    Returns the set of nodes reachable in one step from the given nodes,
+    following only the ``max_fanout`` most recent connections of each. All
+    connections of the nodes are read, but only the nodes reached through
+    those are kept.
+    """
+    from .models import _union
+    rows = _union(*[relationship._connections(*[(OUT, pk) for pk in chunk])
+                    .filter(**{'%s__in' % field: chunk})
+                    .values_list(field, other, 'date', 'id')
+                    .order_by()
+                    for field, other in relationship._orientations()], all=True)
+    found = set()
+    followed = {}
+    for pk, other, _, _ in sorted(rows, key=lambda row: (row[0], row[2], row[3]),
+                                      reverse=True):
+        if followed.get(pk, 0) < max_fanout:
+            followed[pk] = followed.get(pk, 0) + 1
+            found.add(other)
+    return found
+
+
+def bfs_neighbourhood(relationship, pk, depth, max_nodes, max_fanout):
+    """
+    Finds the neighbourhood of a node with a breadth-first search. Each hop
+    costs one query per ``BATCH_SIZE`` frontier nodes.
+    """
+    result = {pk: 0}
+    frontier = [pk]
+    level = 0
+    while frontier and level < depth and (max_nodes is None or len(result) < max_nodes):
+        level += 1
+        if max_fanout is None:
+            found = _expand(relationship, frontier, OUT, result)
+        else:
+            found = set()
+            for chunk in chunked(frontier, BATCH_SIZE):
+                found.update(_fanout(relationship, chunk, max_fanout))
+            found.difference_update(result)
+        frontier = sorted(found)
+        if max_nodes is not None:
+            frontier = frontier[:max_nodes - len(result)]
+        for other in frontier:
+            result[other] = level
+    return result
+
+
+def neighbourhood(relationship, pk, depth, max_nodes=MAX_NEIGHBOURHOOD_NODES,
+                  max_fanout=MAX_FANOUT):
+    """
+    Returns a dictionary mapping the primary key of each node within
+    ``depth`` hops of the given node, including itself, to its distance.
+    
+    Only the ``max_fanout`` most recent connections of each node are
+    followed, and at most ``max_nodes`` nodes are returned, nearest first,
+    then by primary key. Either limit may be ``None``.
+    """
+    if max_nodes is not None and max_nodes < 1:
+        return {}
+    vendor = db_connections[relationship.connections.db].vendor
+    # A cache or a snapshot only helps without a fan-out limit, which needs
+    # dates.
+    cached = ((relationship.cache is not None or relationship.snapshot is not None) and
+              max_fanout is None)
+    if (not cached and not relationship.symmetric and relationship.ttl is None and
+            vendor in CTE_VENDORS):
+        return cte_neighbourhood(relationship, pk, depth, max_nodes, max_fanout)
+    return bfs_neighbourhood(relationship, pk, depth, max_nodes, max_fanout)
+
+
+def _dominated(labels, cost, hops, max_hops):
+    """
+    Returns whether any of a node's ``(hops, cost)`` labels makes a path of
+    the given ``cost`` and ``hops`` to the node redundant.
+    """
+    for other_hops, other_cost in labels:
+        if other_cost <= cost and (max_hops is None or other_hops <= hops):
+            return True
+    return False
+
+
+def shortest_path(relationship, from_pk, to_pk, max_cost=None, max_hops=None,
+                  max_nodes=MAX_EXPANDED_NODES, frontier_size=FRONTIER_SIZE):
+    """
+    Finds the cheapest path from ``from_pk`` to ``to_pk``, the cost of a path
+    being the sum of the ``weight`` of its connections, which must not be
+    negative. Paths costing more than ``max_cost`` or longer than
+    ``max_hops`` connections are not considered.
+    
+    Each round expands up to ``frontier_size`` of the cheapest nodes not yet
+    expanded with a single query. The search stops as soon as no remaining
+    node can lead to a cheaper path than the best one found. If it would
+    have to expand more than ``max_nodes`` nodes, it raises
+    ``SearchLimitExceeded`` instead.
+    
+    Returns a ``(path, cost)`` tuple, where ``path`` is the list of primary
+    keys of the nodes along the path, including both ends, or ``None`` if
+    there's no such path.
+    """
+    if from_pk == to_pk:
+        return [from_pk], 0.0
+    
+    # Nodes are labelled with the (hops, cost) of each non-redundant path
+    # found to them. Without a limit on hops a single label per node is
+    # enough, as in the textbook algorithm.
+    labels = {from_pk: [(0, 0.0)]}
+    parents = {}
+    counter = itertools.count()
+    heap = [(0.0, 0, next(counter), from_pk)]
+    best = None
+    expanded = 0
+    
+    while heap:
+        batch = []
+        while heap and len(batch) < frontier_size:
+            cost, hops, _, pk = heap[0]
+            if best is not None and cost >= best[0]:
+                break
+            heapq.heappop(heap)
+            others = [label for label in labels[pk] if label != (hops, cost)]
+            if _dominated(others, cost, hops, max_hops):
+                continue
+            if pk == to_pk or (max_hops is not None and hops >= max_hops):
+                continue
+            batch.append((pk, hops, cost))
+        if not batch:
+            break
+        
+        expanded += len(batch)
+        if expanded > max_nodes:
+            if best is None:
+                raise SearchLimitExceeded(max_nodes)
+            path, cost = _path(parents, to_pk, best)
+            raise SearchLimitExceeded(max_nodes, path, cost)
+        
+        sources = {}
+        for pk, hops, cost in batch:
+            sources.setdefault(pk, []).append((hops, cost))
+        for chunk in chunked(sources, BATCH_SIZE):
+            for u, v, weight in relationship._adjacency(OUT, chunk, weight=True):
+                if weight < 0:
+                    raise ValueError('Negative weight on connection from %s to %s' % (u, v))
+                for hops, cost in sources[u]:
+                    new_cost = cost + weight
+                    new_hops = hops + 1
+                    if max_cost is not None and new_cost > max_cost:
+                        continue
+                    node_labels = labels.setdefault(v, [])
+                    if _dominated(node_labels, new_cost, new_hops, max_hops):
+                        continue
+                    node_labels.append((new_hops, new_cost))
+                    parents[(v, new_hops, new_cost)] = (u, hops, cost)
+                    heapq.heappush(heap, (new_cost, new_hops, next(counter), v))
+                    if v == to_pk and (best is None or new_cost < best[0]):
+                        best = (new_cost, new_hops)
+    
+    if best is None:
+        return None
+    return _path(parents, to_pk, best)
+
+
+def _path(parents, to_pk, best):
+    """
+    Returns the ``(path, cost)`` tuple of the path to ``to_pk`` costing and
+    as long as the given ``(cost, hops)``, from the parents of each label.
+    """
+    cost, hops = best
+    path = [to_pk]
+    state = (to_pk, hops, cost)
+    while state in parents:
+        state = parents[state]
+        path.append(state[0])
+    path.reverse()
+    return path, cost
@@ -0,0 +1,25 @@
+from itertools import islice
+
+import django
+
+
+def chunked(iterable, size):
+    """
+    Splits ``iterable`` into lists of at most ``size`` items each.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iterate(queryset, chunk_size):
+    """
+    Iterates over ``queryset`` without caching its results, fetching rows
+    ``chunk_size`` at a time where supported (Django 2.0 or later).
+    """
+    if django.VERSION >= (2, 0):
+        return queryset.iterator(chunk_size=chunk_size)
+    return queryset.iterator()
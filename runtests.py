@@ -5,6 +5,24 @@ from os import environ
 from os.path import abspath, dirname
 
 import nose
+from nose.plugins import Plugin
+
+
+class ClassCleanups(Plugin):
+    """
+    Runs the class cleanups of test cases, which nose doesn't, so that
+    Django's ``TestCase`` restores the database connections it wraps to
+    forbid queries to databases a test case didn't declare.
+    """
+    enabled = True
+    name = 'class-cleanups'
+    
+    def configure(self, options, conf):
+        pass
+    
+    def stopContext(self, context):
+        if isinstance(context, type) and hasattr(context, 'doClassCleanups'):
+            context.doClassCleanups()
 
 
 def main():
@@ -27,18 +45,21 @@ def main():
     setup_test_environment()
     
     # setup db
+    from django.conf import settings
     from django.core.management import call_command, CommandError
-    options = {
-        'interactive': False,
-        'verbosity': 1,
-    }
-    try:
-        call_command('migrate', **options)
-    except CommandError:  # Django < 1.7
-        call_command('syncdb', **options)
+    for alias in settings.DATABASES:
+        options = {
+            'interactive': False,
+            'verbosity': 1,
+            'database': alias,
+        }
+        try:
+            call_command('migrate', **options)
+        except CommandError:  # Django < 1.7
+            call_command('syncdb', **options)
     
     # run tests
-    return nose.main()
+    return nose.main(addplugins=[ClassCleanups()])
 
 
 if __name__ == '__main__':
@@ -41,12 +41,18 @@ setup(
     zip_safe=False,
     packages=[
         'connections',
+        'connections.management',
+        'connections.management.commands',
         'connections.templatetags',
     ],
     
     install_requires=[
         'Django >= 1.5',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'scipy': ['numpy', 'scipy'],
+    },
     tests_require=[
         'nose',
     ],
@@ -10,8 +10,14 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
     },
+    'other': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
 }
 
+DATABASE_ROUTERS = ['connections.routers.RelationshipRouter']
+
 INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -21,4 +27,11 @@ INSTALLED_APPS = (
 
 CACHE_BACKEND = 'locmem://'
 
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
 SECRET_KEY = 'thats-a-secret'
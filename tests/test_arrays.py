@@ -0,0 +1,93 @@
+from array import array
+from unittest import SkipTest
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+
+from connections.models import _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class EdgeArraysTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz),
+                                   (self.jaz, self.bar)])
+        self.r.connections.filter(from_pk=self.jaz.pk).update(weight=2.5)
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def edges(self, from_pks, to_pks, weights):
+        return sorted(zip(from_pks, to_pks, weights))
+    
+    def test_to_edge_arrays(self):
+        with self.assertNumQueries(1):
+            from_pks, to_pks, weights = self.r.to_edge_arrays()
+        assert isinstance(from_pks, array) and from_pks.itemsize == 8
+        assert isinstance(weights, array) and weights.typecode == 'd'
+        assert self.edges(from_pks, to_pks, weights) == sorted([
+            (self.foo.pk, self.bar.pk, 1.0),
+            (self.foo.pk, self.jaz.pk, 1.0),
+            (self.jaz.pk, self.bar.pk, 2.5),
+        ])
+    
+    def test_to_edge_arrays_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            raise SkipTest('requires NumPy')
+        from_pks, to_pks, weights = self.r.to_edge_arrays(numpy=True)
+        assert from_pks.dtype == np.int64 and weights.dtype == np.float64
+        assert self.edges(from_pks, to_pks, weights) == self.edges(*self.r.to_edge_arrays())
+    
+    def test_to_csr(self):
+        try:
+            import scipy  # noqa
+        except ImportError:
+            raise SkipTest('requires SciPy')
+        matrix, row_pks, col_pks = self.r.to_csr()
+        assert matrix.shape == (3, 3) and matrix.nnz == 3
+        assert list(row_pks) == list(col_pks) == sorted([self.foo.pk, self.bar.pk, self.jaz.pk])
+        index = dict((pk, i) for i, pk in enumerate(row_pks))
+        assert matrix[index[self.jaz.pk], index[self.bar.pk]] == 2.5
+        assert matrix[index[self.bar.pk], index[self.foo.pk]] == 0
+    
+    def test_to_csr_between_models(self):
+        try:
+            import scipy  # noqa
+        except ImportError:
+            raise SkipTest('requires SciPy')
+        r = define_relationship('group_member', User, Group)
+        group = Group.objects.create(name='group')
+        r.create_connections([(self.foo, group), (self.bar, group)])
+        matrix, row_pks, col_pks = r.to_csr()
+        assert matrix.shape == (2, 1)
+        assert list(row_pks) == sorted([self.foo.pk, self.bar.pk])
+        assert list(col_pks) == [group.pk]
+        assert matrix.sum() == 2.0
+    
+    def test_symmetric(self):
+        r = define_relationship('user_sibling', User, User, symmetric=True)
+        r.create_connections([(self.bar, self.foo), (self.jaz, self.jaz)])
+        foo, bar, jaz = self.foo.pk, self.bar.pk, self.jaz.pk
+        assert self.edges(*r.to_edge_arrays()) == sorted([
+            (foo, bar, 1.0), (bar, foo, 1.0), (jaz, jaz, 1.0)])
+        assert self.edges(*r.to_edge_arrays(mirror=False)) == [
+            (min(foo, bar), max(foo, bar), 1.0), (jaz, jaz, 1.0)]
+        assert len(self.r.to_edge_arrays(mirror=True)[0]) == 6
+        try:
+            import scipy  # noqa
+        except ImportError:
+            return
+        matrix, row_pks, col_pks = r.to_csr()
+        assert matrix.nnz == 3 and (matrix != matrix.T).nnz == 0
@@ -0,0 +1,159 @@
+from unittest import skipIf
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from connections import instrumentation, memo
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import (define_relationship, acreate_connection,
+    aconnection_exists, aconnected_object_ids, adistance_between)
+from connections.signals import connection_created
+
+from .test_instrumentation import RecordingBackend
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+@skipIf(django.VERSION < (4, 1), 'requires Django 4.1 or later')
+class AsyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, counters=True)
+        self.c = define_relationship('user_follow_cached', User, User, cache='default')
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+    
+    def tearDown(self):
+        reset_registry(registry)
+        cache.clear()
+    
+    async def test_create_connection(self):
+        c = await acreate_connection(self.r, self.foo, self.bar)
+        assert (c.from_pk, c.to_pk) == (self.foo.pk, self.bar.pk)
+        assert (await self.r.acreate_connection(self.foo, self.bar)).pk == c.pk
+        assert (await self.r.aget_connection(self.foo, self.bar)).pk == c.pk
+        assert await self.r.aget_connection(self.bar, self.foo) is None
+        assert await self.r.aout_degree(self.foo) == 1
+        assert await self.r.ain_degree(self.bar) == 1
+        assert await self.r.ain_degree(self.foo) == 0
+    
+    async def test_create_connection_without_row_signals(self):
+        r = define_relationship('user_block', User, User, counters=True,
+                                row_signals=False)
+        c = await r.acreate_connection(self.foo, self.bar)
+        assert (await r.acreate_connection(self.foo, self.bar)).pk == c.pk
+        assert await r.aout_degree(self.foo) == 1
+        assert await r.ain_degree(self.bar) == 1
+    
+    async def test_connection_exists(self):
+        for r in (self.r, self.c):
+            assert not await aconnection_exists(r, self.foo, self.bar)
+            await r.acreate_connection(self.foo, self.bar)
+            assert await aconnection_exists(r, self.foo, self.bar)
+    
+    async def test_connected_object_ids(self):
+        for r in (self.r, self.c):
+            await r.acreate_connection(self.foo, self.bar)
+            await r.acreate_connection(self.foo, self.jaz)
+            assert set(await aconnected_object_ids(r, self.foo)) == set([self.bar.pk, self.jaz.pk])
+            assert set(await r.aconnected_to_object_ids(self.bar)) == set([self.foo.pk])
+    
+    async def test_symmetric(self):
+        r = define_relationship('user_friend', User, User, counters=True, symmetric=True)
+        c = await r.acreate_connection(self.bar, self.foo)
+        assert (c.from_pk, c.to_pk) == (self.foo.pk, self.bar.pk)
+        assert (await r.aget_connection(self.bar, self.foo)).pk == c.pk
+        assert await r.aconnection_exists(self.bar, self.foo)
+        assert set(await r.aconnected_object_ids(self.bar)) == set([self.foo.pk])
+        assert set(await r.aconnected_to_object_ids(self.bar)) == set([self.foo.pk])
+        assert await r.aout_degree(self.bar) == 1
+        r.counters = False
+        assert await r.ain_degree(self.foo) == 1
+    
+    async def test_memoization(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, memoize_ids=True)
+        with memo.memoize() as identity_map:
+            await self.r.acreate_connection(self.foo, self.bar)
+            assert await self.r.aconnected_object_ids(self.foo) == set([self.bar.pk])
+            assert (self.r.id, 'out', self.foo.pk) in identity_map.adjacency
+            await self.r.acreate_connection(self.foo, self.jaz)
+            assert await self.r.aconnection_exists(self.foo, self.jaz)
+            assert not await self.r.aconnection_exists(self.bar, self.foo)
+            assert identity_map.exists[(self.r.id, self.bar.pk, self.foo.pk)] is False
+            assert (await self.r.aget_connection(self.foo, self.jaz)).to_pk == self.jaz.pk
+            assert await self.r.aconnected_object_ids(self.foo) == set([self.bar.pk, self.jaz.pk])
+    
+    async def test_instrumentation(self):
+        backend = RecordingBackend()
+        instrumentation.set_backend(backend)
+        try:
+            await self.r.acreate_connection(self.foo, self.bar)
+            await self.r.aconnected_object_ids(self.foo)
+        finally:
+            instrumentation.load_backend()
+        assert backend.operations() == [
+            ('user_follow', 'acreate_connection', None, 1),
+            ('user_follow', 'aconnected_object_ids', None, 1),
+        ]
+    
+    async def test_distance_between(self):
+        for r in (self.r, self.c):
+            await r.acreate_connection(self.foo, self.bar)
+            await r.acreate_connection(self.bar, self.jaz)
+            assert await adistance_between(r, self.foo, self.foo) == 0
+            assert await adistance_between(r, self.foo, self.bar) == 1
+            assert await adistance_between(r, self.foo, self.jaz) == 2
+            assert await adistance_between(r, self.foo, self.jaz, limit=1) is None
+            assert await adistance_between(r, self.jaz, self.foo) is None
+    
+    async def test_distance_between_closure(self):
+        from asgiref.sync import sync_to_async
+        r = define_relationship('user_parent', User, User, closure=True)
+        await r.acreate_connection(self.foo, self.bar)
+        await r.acreate_connection(self.bar, self.jaz)
+        # answered from the closure alone, as by ``distance_between()``
+        await sync_to_async(lambda: r.connections._raw_delete(r.connections.db))()
+        assert await adistance_between(r, self.foo, self.jaz, limit=3) == 2
+        assert await adistance_between(r, self.foo, self.jaz, limit=1) is None
+    
+    async def test_snapshot(self):
+        from asgiref.sync import sync_to_async
+        r = define_relationship('user_follow_snapshot', User, User, snapshot=True)
+        await r.acreate_connection(self.foo, self.bar)
+        # not loaded yet
+        assert await r.aconnection_exists(self.foo, self.bar)
+        assert not r.snapshot.loaded
+        
+        await sync_to_async(r.snapshot.load)()
+        # written behind its back, so only seen by queries
+        await sync_to_async(Connection.objects.bulk_create)([
+            Connection(relationship_id=r.id, from_pk=self.bar.pk, to_pk=self.jaz.pk)])
+        assert await r.aconnection_exists(self.foo, self.bar)
+        assert not await r.aconnection_exists(self.bar, self.jaz)
+        assert await r.aconnected_to_object_ids(self.bar) == set([self.foo.pk])
+        assert await adistance_between(r, self.foo, self.jaz) is None
+        
+        r.snapshot.refresh_interval = 0
+        assert await r.aconnection_exists(self.bar, self.jaz)
+    
+    @skipIf(django.VERSION < (5, 0), 'requires Django 5.0 or later')
+    async def test_async_receiver(self):
+        received = []
+        
+        async def receiver(sender, connection, **kwargs):
+            received.append((sender, connection.to_pk))
+        
+        connection_created.connect(receiver)
+        try:
+            await self.r.acreate_connection(self.foo, self.bar)
+        finally:
+            connection_created.disconnect(receiver)
+        assert received == [(self.r, self.bar.pk)]
@@ -0,0 +1,88 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from benchmarks.generator import powerlaw_graph
+from benchmarks.suite import compare, percentile, run_suite
+from connections.models import _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+def test_powerlaw_graph():
+    edges = list(powerlaw_graph(1000, 10000, skew=1.0, seed=1))
+    assert edges == list(powerlaw_graph(1000, 10000, skew=1.0, seed=1))
+    assert edges != list(powerlaw_graph(1000, 10000, skew=1.0, seed=2))
+    assert len(set(edges)) == len(edges)
+    assert all(0 <= a < 1000 and 0 <= b < 1000 and a != b for a, b in edges)
+    assert 9000 <= len(edges) <= 10000
+    
+    # hubs, unlike in a uniform graph
+    in_degrees = Counter(b for a, b in edges)
+    assert max(in_degrees.values()) > 200
+    uniform = Counter(b for a, b in powerlaw_graph(1000, 10000, skew=0, seed=1))
+    assert max(uniform.values()) < 40
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 99) == 5
+    assert percentile(values, 0) == 1
+
+
+def test_compare():
+    baseline = {
+        'get_connection': {'p50_ms': 1.0, 'p99_ms': 2.0, 'queries': 1},
+        'suggest': {'p50_ms': 10.0, 'p99_ms': 20.0, 'queries': 2},
+    }
+    results = {
+        'get_connection': {'p50_ms': 1.2, 'p99_ms': 3.0, 'queries': 2},
+        'suggest': {'p50_ms': 5.0, 'p99_ms': 20.0, 'queries': 2},
+        'in_degree': {'p50_ms': 1.0, 'p99_ms': 1.0, 'queries': 1},
+    }
+    assert compare(baseline, results) == [
+        ('get_connection', 'p99_ms', 2.0, 3.0),
+        ('get_connection', 'queries', 1, 2),
+    ]
+    assert compare(baseline, results, threshold=1.1) == [
+        ('get_connection', 'p50_ms', 1.0, 1.2),
+        ('get_connection', 'p99_ms', 2.0, 3.0),
+        ('get_connection', 'queries', 1, 2),
+    ]
+
+
+class SuiteTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, counters=True)
+        users = [User.objects.create_user(username='user%d' % i) for i in range(12)]
+        self.pks = [user.pk for user in users]
+        self.r.create_connections([(users[a], users[b]) for a, b in
+                                   powerlaw_graph(len(users), 40, seed=1)])
+        self.edges = list(self.r.connections.values_list('from_pk', 'to_pk'))
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def test_run_suite(self):
+        count = self.r.connections.count()
+        results = run_suite(self.r, self.pks, self.edges, samples=2)
+        assert self.r.connections.count() == count
+        
+        for name in ('create_connection', 'create_connections', 'remove_connections',
+                     'get_connection', 'suggest', 'in_degrees', 'rebuild_counters',
+                     'tag:connections_from_object'):
+            assert name in results
+        assert results['get_connection']['samples'] == 2
+        assert results['get_connection']['queries'] == 1
+        assert results['get_connection']['p99_ms'] >= results['get_connection']['p50_ms']
+        
+        results = run_suite(self.r, self.pks, self.edges, samples=2,
+                            only=['out_degree', 'suggest'])
+        assert list(results) == ['suggest', 'out_degree']
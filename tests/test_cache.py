@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import (define_relationship, create_connection,
+    create_connections, remove_connections, connection_exists,
+    connected_objects)
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class AdjacencyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, cache='default')
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+    
+    def tearDown(self):
+        Connection.objects.all().delete()
+        reset_registry(registry)
+        cache.clear()
+        self.foo.delete()
+        self.bar.delete()
+        self.jaz.delete()
+    
+    def test_connected_object_ids(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.jaz, self.bar)
+        with self.assertNumQueries(2):
+            assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+            assert self.r.connected_to_object_ids(self.bar) == set([self.foo.pk, self.jaz.pk])
+        with self.assertNumQueries(0):
+            assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+            assert self.r.connected_to_object_ids(self.bar) == set([self.foo.pk, self.jaz.pk])
+        with self.assertNumQueries(1):
+            assert set(connected_objects(self.r, self.foo)) == set([self.bar])
+    
+    def test_connection_exists(self):
+        create_connection(self.r, self.foo, self.bar)
+        with self.assertNumQueries(1):
+            assert connection_exists(self.r, self.foo, self.bar)
+        self.r.connected_object_ids(self.foo)
+        with self.assertNumQueries(0):
+            assert connection_exists(self.r, self.foo, self.bar)
+            assert not connection_exists(self.r, self.foo, self.jaz)
+    
+    def test_invalidated_on_write(self):
+        c = create_connection(self.r, self.foo, self.bar)
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+        assert self.r.connected_to_object_ids(self.jaz) == set()
+        create_connection(self.r, self.foo, self.jaz)
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk, self.jaz.pk])
+        assert self.r.connected_to_object_ids(self.jaz) == set([self.foo.pk])
+        c.delete()
+        assert self.r.connected_object_ids(self.foo) == set([self.jaz.pk])
+        create_connections(self.r, [(self.bar, self.jaz)])
+        assert self.r.connected_to_object_ids(self.jaz) == set([self.foo.pk, self.bar.pk])
+        remove_connections(self.r, [(self.foo, self.jaz)])
+        assert self.r.connected_object_ids(self.foo) == set()
+        assert self.r.connected_to_object_ids(self.jaz) == set([self.bar.pk])
+    
+    def test_invalidate(self):
+        create_connection(self.r, self.foo, self.bar)
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+        # updates bypass signals and leave the cache stale
+        self.r.connections.update(to_pk=self.jaz.pk)
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+        self.r.cache.invalidate()
+        assert self.r.connected_object_ids(self.foo) == set([self.jaz.pk])
+    
+    def test_distance_between(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.bar, self.jaz)
+        assert self.r.distance_between(self.foo, self.jaz) == 2
+        assert self.r.distance_between(self.jaz, self.foo, limit=3) is None
+        with self.assertNumQueries(0):
+            assert self.r.distance_between(self.foo, self.jaz) == 2
+            assert self.r.distance_between(self.jaz, self.foo, limit=3) is None
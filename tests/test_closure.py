@@ -0,0 +1,124 @@
+import random
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from connections.closure import closure_rows
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+def expected_closure(edges):
+    children = {}
+    for a, b in edges:
+        children.setdefault(a, []).append(b)
+    result = {}
+    for source in children:
+        frontier, depth = [source], 0
+        while frontier:
+            depth += 1
+            found = []
+            for pk in frontier:
+                for child in children.get(pk, ()):
+                    if (source, child) not in result:
+                        result[(source, child)] = depth
+                        found.append(child)
+            frontier = found
+    return result
+
+
+class ClosureTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('group_member_of_group', Group, Group, closure=True)
+        self.groups = [Group.objects.create(name='g%d' % i) for i in range(8)]
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def closure(self):
+        return dict(((a, b), depth) for a, b, depth in closure_rows(self.r)
+                    .values_list('ancestor_pk', 'descendant_pk', 'depth'))
+    
+    def edges(self):
+        return list(self.r.connections.values_list('from_pk', 'to_pk'))
+    
+    def test_definition(self):
+        self.assertRaises(ValueError, define_relationship,
+                          'member_of_group', User, Group, closure=True)
+        self.assertRaises(ValueError, define_relationship,
+                          'group_sibling', Group, Group, symmetric=True, closure=True)
+    
+    def test_lookups(self):
+        g = self.groups
+        self.r.create_connections([(g[0], g[1]), (g[1], g[2]), (g[2], g[3]), (g[0], g[3])])
+        with self.assertNumQueries(1):
+            assert self.r.path_exists(g[1], g[3])
+        assert not self.r.path_exists(g[3], g[1])
+        assert not self.r.path_exists(g[0], g[0])
+        with self.assertNumQueries(1):
+            assert self.r.distance_between(g[0], g[3], limit=10) == 1
+        assert self.r.distance_between(g[1], g[3]) == 2
+        assert self.r.distance_between(g[1], g[3], limit=1) is None
+        assert self.r.distance_between(g[3], g[0]) is None
+        assert self.r.distance_between(g[0], g[0]) == 0
+        assert set(self.r.descendant_ids(g[0])) == set([g[1].pk, g[2].pk, g[3].pk])
+        assert set(self.r.descendant_ids(g[0], max_depth=1)) == set([g[1].pk, g[3].pk])
+        assert set(self.r.ancestor_ids(g[3])) == set([g[0].pk, g[1].pk, g[2].pk])
+        assert set(self.r.ancestor_ids(g[3], max_depth=1)) == set([g[0].pk, g[2].pk])
+    
+    def test_cycles_are_refused(self):
+        g = self.groups
+        self.r.create_connections([(g[0], g[1]), (g[1], g[2])])
+        self.assertRaises(ValueError, self.r.create_connection, g[2], g[0])
+        self.assertRaises(ValueError, self.r.create_connections, [(g[3], g[4]), (g[2], g[2])])
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Connection.objects.create(relationship_id=self.r.id,
+                                          from_pk=g[2].pk, to_pk=g[1].pk)
+        assert self.edges() == [(g[0].pk, g[1].pk), (g[1].pk, g[2].pk)]
+    
+    def test_incremental_updates(self):
+        pks = [g.pk for g in self.groups]
+        rng = random.Random(1)
+        for _ in range(40):
+            a, b = sorted(rng.sample(range(len(pks)), 2))
+            from_obj, to_obj = self.groups[a], self.groups[b]
+            if self.r.connection_exists(from_obj, to_obj):
+                if rng.random() < 0.5:
+                    self.r.remove_connections([(from_obj, to_obj)])
+                else:
+                    self.r.get_connection(from_obj, to_obj).delete()
+            elif rng.random() < 0.5:
+                self.r.create_connection(from_obj, to_obj)
+            else:
+                self.r.create_connections([(from_obj, to_obj)])
+            assert self.closure() == expected_closure(self.edges())
+        
+        pairs = [(self.groups[a], self.groups[b])
+                 for a in range(len(pks)) for b in range(a + 1, len(pks))]
+        self.r.create_connections(pairs[::3])
+        assert self.closure() == expected_closure(self.edges())
+        self.r.remove_connections(pairs[::2])
+        assert self.closure() == expected_closure(self.edges())
+    
+    def test_rebuild(self):
+        g = self.groups
+        self.r.create_connections([(g[0], g[1]), (g[1], g[2]), (g[3], g[4])])
+        expected = self.closure()
+        closure_rows(self.r).update(depth=9)
+        closure_rows(self.r).create(relationship_id=self.r.id, ancestor_pk=g[7].pk,
+                                    descendant_pk=g[6].pk, depth=1)
+        self.r.rebuild_closure(batch_size=1)
+        assert self.closure() == expected
+        
+        closure_rows(self.r).delete()
+        call_command('connections_rebuild_closure', verbosity=0)
+        assert self.closure() == expected
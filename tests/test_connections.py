@@ -1,13 +1,18 @@
 import re
+from datetime import timedelta
 
 from django.contrib.auth.models import User, Group
 from django.test import TestCase
+from django.utils import timezone
 
-from connections.models import Connection, _relationship_registry as registry
+from connections import traversal
+from connections.models import (Connection, prefetch_connection_objects,
+    _relationship_registry as registry)
 from connections.shortcuts import (define_relationship, get_relationship,
-    create_connection, get_connection, connection_exists,
+    create_connection, create_connections, remove_connections,
+    get_connection, connection_exists,
     connections_from_object, connections_to_object,
-    connected_objects, connected_to_objects)
+    page_connections_from, page_connections_to, connected_objects, connected_to_objects)
 
 
 def reset_registry(d):
@@ -16,7 +21,7 @@ def reset_registry(d):
 
 
 def reset_relationship(r):
-    Connection.objects.filter(relationship_name=get_relationship(r).name).delete()
+    get_relationship(r).connections.delete()
 
 
 class ConnectionTests(TestCase):
@@ -52,6 +57,43 @@ class ConnectionTests(TestCase):
         assert c.to_object == self.bar
         assert re.match(r'user_follow \(user:\d+ --> user:\d+\)', str(c))
     
+    def test_create_connections(self):
+        existing = create_connection(self.r, self.foo, self.bar)
+        pairs = [(self.foo, self.bar), (self.foo, self.jaz),
+                 (self.bar, self.jaz), (self.foo, self.jaz)]
+        # select, insert and re-select, wrapped in a savepoint
+        with self.assertNumQueries(5):
+            created = create_connections(self.r, pairs)
+        assert set((c.from_pk, c.to_pk) for c in created) == set([
+            (self.foo.pk, self.jaz.pk), (self.bar.pk, self.jaz.pk)])
+        assert all(c.pk for c in created)
+        assert existing not in created
+        assert self.r.connections.count() == 3
+        assert create_connections(self.r, pairs) == []
+    
+    def test_create_connections_validates_ctypes(self):
+        group = Group.objects.create(name='testgroup')
+        try:
+            self.assertRaises(AssertionError, create_connections, self.r,
+                              [(self.foo, self.bar), (self.foo, group)])
+            assert not self.r.connections.exists()
+        finally:
+            group.delete()
+    
+    def test_remove_connections(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.foo, self.jaz)
+        create_connection(self.r, self.bar, self.jaz)
+        # select and delete, wrapped in a savepoint
+        with self.assertNumQueries(4):
+            removed = remove_connections(self.r, [(self.foo, self.bar),
+                                                  (self.bar, self.jaz),
+                                                  (self.jaz, self.foo)])
+        assert removed == 2
+        assert set(self.r.connected_object_ids(self.foo)) == set([self.jaz.pk])
+        assert not self.r.connected_object_ids(self.bar).exists()
+        assert remove_connections(self.r, [(self.foo, self.bar)]) == 0
+    
     def test_get_connection(self):
         c = create_connection(self.r, self.foo, self.bar)
         assert get_connection(self.r, self.foo, self.bar) == c
@@ -72,6 +114,54 @@ class ConnectionTests(TestCase):
         c2 = create_connection(self.r, self.jaz, self.foo)
         assert set(connections_to_object(self.r, self.foo)) == set([c1, c2])
     
+    def test_connections_with_objects(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.foo, self.jaz)
+        connections = connections_from_object(self.r, self.foo).with_objects()
+        with self.assertNumQueries(3):
+            pairs = set((c.from_object, c.to_object) for c in connections)
+        assert pairs == set([(self.foo, self.bar), (self.foo, self.jaz)])
+        assert len(connections.values_list('pk', flat=True)) == 2
+    
+    def test_prefetch_connection_objects(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.jaz, self.bar)
+        connections = list(connections_to_object(self.r, self.bar))
+        with self.assertNumQueries(1):
+            prefetch_connection_objects(connections, side='from')
+        with self.assertNumQueries(0):
+            assert set(c.from_object for c in connections) == set([self.foo, self.jaz])
+        with self.assertNumQueries(1):
+            prefetch_connection_objects(connections)
+        with self.assertNumQueries(0):
+            assert set(c.to_object for c in connections) == set([self.bar])
+        self.assertRaises(ValueError, prefetch_connection_objects, connections, 'foo')
+    
+    def test_page_connections_to(self):
+        c1 = create_connection(self.r, self.bar, self.foo)
+        c2 = create_connection(self.r, self.jaz, self.foo)
+        c3 = create_connection(self.r, self.foo, self.foo)
+        # connections created at the same time are ordered by id
+        Connection.objects.filter(pk=c3.pk).update(date=c2.date)
+        page, cursor = page_connections_to(self.r, self.foo, limit=2)
+        assert page == [c1, c2] and cursor is not None
+        with self.assertNumQueries(1):
+            page, cursor = page_connections_to(self.r, self.foo, after=cursor, limit=2)
+        assert page == [c3] and cursor is None
+        page, cursor = self.r.page_connections_to(self.foo, limit=1, reverse=True)
+        assert page == [c3]
+        page, cursor = self.r.page_connections_to(self.foo, after=cursor, reverse=True)
+        assert page == [c2, c1] and cursor is None
+        self.assertRaises(ValueError, self.r.page_connections_to, self.foo, after='foo')
+    
+    def test_page_connections_from(self):
+        c1 = create_connection(self.r, self.foo, self.bar)
+        c2 = create_connection(self.r, self.foo, self.jaz)
+        page, cursor = page_connections_from(self.r, self.foo, limit=1)
+        assert page == [c1]
+        assert page_connections_from(self.r, self.foo, after=cursor) == ([c2], None)
+        assert page_connections_from(self.r, self.bar) == ([], None)
+    
     def test_connected_objects(self):
         create_connection(self.r, self.foo, self.bar)
         create_connection(self.r, self.foo, self.jaz)
@@ -103,3 +193,147 @@ class ConnectionTests(TestCase):
         assert self.r.distance_between(self.bar, self.foo) is None
         assert self.r.distance_between(self.jaz, self.foo) is None
         assert self.r.distance_between(self.jaz, self.bar) is None
+    
+    def test_distance_between_limit(self):
+        baz = User.objects.create_user(username='baz')
+        try:
+            create_connection(self.r, self.foo, self.bar)
+            create_connection(self.r, self.bar, self.jaz)
+            create_connection(self.r, self.jaz, baz)
+            create_connection(self.r, self.foo, self.jaz)
+            assert self.r.distance_between(self.foo, baz, limit=1) is None
+            assert self.r.distance_between(self.foo, baz) == 2
+            assert self.r.distance_between(self.bar, baz, limit=1) is None
+            assert self.r.distance_between(self.bar, baz, limit=2) == 2
+            assert self.r.distance_between(self.foo, self.bar, limit=0) is None
+        finally:
+            baz.delete()
+    
+    def test_distance_between_single_query(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.bar, self.jaz)
+        with self.assertNumQueries(1):
+            assert self.r.distance_between(self.foo, self.jaz, limit=4) == 2
+    
+    def test_bfs_distance(self):
+        users = [User.objects.create_user(username='u%d' % i) for i in range(5)]
+        try:
+            for a, b in zip(users, users[1:]):
+                create_connection(self.r, a, b)
+            create_connection(self.r, users[0], users[2])
+            pks = [u.pk for u in users]
+            for limit in range(6):
+                for i in range(5):
+                    for j in range(5):
+                        assert (traversal.bfs_distance(self.r, pks[i], pks[j], limit) ==
+                                traversal.distance(self.r, pks[i], pks[j], limit))
+            assert traversal.bfs_distance(self.r, pks[0], pks[4], 3) == 3
+            assert traversal.bfs_distance(self.r, pks[0], pks[4], 2) is None
+            assert traversal.bfs_distance(self.r, pks[4], pks[0], 5) is None
+        finally:
+            for u in users:
+                u.delete()
+    
+    def test_neighbourhood(self):
+        users = [User.objects.create_user(username='u%d' % i) for i in range(5)]
+        try:
+            # u0 -> u1 -> u3 -> u4, u0 -> u2 -> u3, u1 -> u0; newest last
+            now = timezone.now()
+            for i, (a, b) in enumerate([(0, 1), (0, 2), (1, 3), (2, 3), (3, 4), (1, 0)]):
+                c = create_connection(self.r, users[a], users[b])
+                self.r.connections.filter(pk=c.pk).update(date=now + timedelta(seconds=i))
+            pks = [u.pk for u in users]
+            
+            with self.assertNumQueries(1):
+                assert self.r.neighbourhood(users[0]) == {
+                    pks[0]: 0, pks[1]: 1, pks[2]: 1, pks[3]: 2}
+            assert self.r.neighbourhood(users[0], depth=3)[pks[4]] == 3
+            assert self.r.neighbourhood(users[0], depth=0) == {pks[0]: 0}
+            assert self.r.neighbourhood(users[4]) == {pks[4]: 0}
+            assert self.r.neighbourhood(users[0], max_nodes=2) == {pks[0]: 0, pks[1]: 1}
+            # only u0 -> u2 and u1 -> u0 are followed
+            assert self.r.neighbourhood(users[0], max_fanout_per_node=1) == {
+                pks[0]: 0, pks[2]: 1, pks[3]: 2}
+            
+            for depth in range(4):
+                for max_nodes in (None, 1, 3):
+                    for max_fanout in (None, 1, 2):
+                        for pk in pks:
+                            args = (self.r, pk, depth, max_nodes, max_fanout)
+                            assert (traversal.bfs_neighbourhood(*args) ==
+                                    traversal.neighbourhood(*args))
+        finally:
+            for u in users:
+                u.delete()
+    
+    def test_mutual_connections(self):
+        baz = User.objects.create_user(username='baz')
+        try:
+            create_connections(self.r, [(self.foo, self.jaz), (self.foo, baz),
+                                        (self.bar, self.jaz), (self.bar, baz),
+                                        (self.bar, self.foo)])
+            with self.assertNumQueries(1):
+                assert set(self.r.mutual_connections(self.foo, self.bar)) == set([self.jaz, baz])
+            assert list(self.r.mutual_connections(self.foo, self.jaz)) == []
+        finally:
+            baz.delete()
+    
+    def test_common_neighbors_count(self):
+        baz = User.objects.create_user(username='baz')
+        try:
+            create_connections(self.r, [(self.foo, self.bar), (self.foo, self.jaz),
+                                        (self.bar, baz), (self.jaz, baz),
+                                        (self.jaz, self.bar)])
+            with self.assertNumQueries(1):
+                counts = self.r.common_neighbors_count(self.foo, [baz, self.bar, self.foo])
+            assert counts == {baz.pk: 2, self.bar.pk: 1, self.foo.pk: 0}
+        finally:
+            baz.delete()
+    
+    def test_suggest(self):
+        baz = User.objects.create_user(username='baz')
+        qux = User.objects.create_user(username='qux')
+        try:
+            create_connections(self.r, [(self.foo, self.bar), (self.foo, self.jaz),
+                                        (self.bar, baz), (self.jaz, baz),
+                                        (self.bar, qux), (self.jaz, self.bar),
+                                        (self.bar, self.foo)])
+            self.r.connections.filter(from_pk=self.bar.pk, to_pk=qux.pk).update(weight=3)
+            with self.assertNumQueries(2):
+                suggestions = self.r.suggest(self.foo)
+            assert suggestions == [(baz, 2, 2.0), (qux, 1, 3.0)]
+            assert self.r.suggest(self.foo, limit=1) == [(baz, 2, 2.0)]
+            assert self.r.suggest(baz) == []
+        finally:
+            baz.delete()
+            qux.delete()
+    
+    def test_shortest_path(self):
+        users = [User.objects.create_user(username='u%d' % i) for i in range(4)]
+        a, b, c, d = users
+        try:
+            # a -1-> b -1-> c -1-> d, a -5-> d, a -1-> c (weight 2.5)
+            for from_obj, to_obj, weight in [(a, b, 1), (b, c, 1), (c, d, 1),
+                                             (a, d, 5), (a, c, 2.5)]:
+                create_connection(self.r, from_obj, to_obj)
+                self.r.connections.filter(from_pk=from_obj.pk,
+                                          to_pk=to_obj.pk).update(weight=weight)
+            assert self.r.shortest_path(a, d) == ([a.pk, b.pk, c.pk, d.pk], 3.0)
+            assert self.r.shortest_path(a, d, max_hops=2) == ([a.pk, c.pk, d.pk], 3.5)
+            assert self.r.shortest_path(a, d, max_hops=1) == ([a.pk, d.pk], 5.0)
+            assert self.r.shortest_path(a, d, max_cost=2.9) is None
+            assert self.r.shortest_path(a, a) == ([a.pk], 0.0)
+            assert self.r.shortest_path(d, a) is None
+            with self.assertRaises(self.r.SearchLimitExceeded) as cm:
+                self.r.shortest_path(a, d, max_nodes=1)
+            # only a was expanded, reaching d directly
+            assert (cm.exception.path, cm.exception.cost) == ([a.pk, d.pk], 5.0)
+            # b -> c, but d is only reached by expanding c
+            with self.assertRaises(traversal.SearchLimitExceeded) as cm:
+                traversal.shortest_path(self.r, b.pk, d.pk, max_nodes=1)
+            assert cm.exception.path is None and cm.exception.cost is None
+            with self.assertNumQueries(3):
+                traversal.shortest_path(self.r, a.pk, d.pk, frontier_size=1)
+        finally:
+            for u in users:
+                u.delete()
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from connections.models import (Connection, ConnectionCounter,
+    _relationship_registry as registry)
+from connections.shortcuts import (define_relationship, create_connection,
+    create_connections, remove_connections)
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, counters=True)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+    
+    def tearDown(self):
+        Connection.objects.all().delete()
+        ConnectionCounter.objects.all().delete()
+        reset_registry(registry)
+        self.foo.delete()
+        self.bar.delete()
+        self.jaz.delete()
+    
+    def assertDegrees(self, out_degrees, in_degrees):
+        users = [self.foo, self.bar, self.jaz]
+        assert self.r.out_degrees(users) == dict(
+            (u.pk, n) for u, n in zip(users, out_degrees))
+        assert self.r.in_degrees(users) == dict(
+            (u.pk, n) for u, n in zip(users, in_degrees))
+    
+    def test_degrees_without_counters(self):
+        r = define_relationship('user_block', User, User)
+        create_connection(r, self.foo, self.bar)
+        create_connection(r, self.foo, self.jaz)
+        assert r.out_degree(self.foo) == 2
+        assert r.in_degree(self.foo) == 0
+        assert r.in_degrees([self.bar, self.jaz]) == {self.bar.pk: 1, self.jaz.pk: 1}
+        assert not ConnectionCounter.objects.exists()
+    
+    def test_create_and_delete_connection(self):
+        c = create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.jaz, self.bar)
+        self.assertDegrees([1, 0, 1], [0, 2, 0])
+        c.delete()
+        self.assertDegrees([0, 0, 1], [0, 1, 0])
+        with self.assertNumQueries(1):
+            assert self.r.in_degree(self.bar) == 1
+    
+    def test_bulk_create_and_remove(self):
+        create_connection(self.r, self.foo, self.bar)
+        create_connections(self.r, [(self.foo, self.bar), (self.foo, self.jaz),
+                                    (self.bar, self.jaz), (self.jaz, self.foo)])
+        self.assertDegrees([2, 1, 1], [1, 1, 2])
+        remove_connections(self.r, [(self.foo, self.jaz), (self.bar, self.jaz)])
+        self.assertDegrees([1, 0, 1], [1, 1, 0])
+    
+    def test_rebuild_counters(self):
+        create_connections(self.r, [(self.foo, self.bar), (self.foo, self.jaz),
+                                    (self.bar, self.jaz)])
+        ConnectionCounter.objects.all().delete()
+        ConnectionCounter.objects.create(relationship_id=self.r.id,
+                                         side=ConnectionCounter.IN,
+                                         object_pk=self.foo.pk, count=5)
+        call_command('connections_rebuild_counters', batch_size=1, verbosity=0)
+        self.assertDegrees([2, 1, 0], [0, 1, 2])
+        assert not ConnectionCounter.objects.filter(object_pk=self.foo.pk,
+                                                    side=ConnectionCounter.IN).exists()
@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import define_relationship
+from connections.signals import connection_created
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class ExpiryTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_viewed', User, User, ttl=3600)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def expire(self, *pairs):
+        for from_obj, to_obj in pairs:
+            Connection.objects.filter(from_pk=from_obj.pk, to_pk=to_obj.pk).update(
+                expires=timezone.now() - timedelta(seconds=1))
+    
+    def test_definition(self):
+        assert self.r.ttl == timedelta(hours=1)
+        r = define_relationship('user_liked', User, User, ttl=timedelta(days=1))
+        assert r.ttl == timedelta(days=1)
+        assert define_relationship('user_follow', User, User).ttl is None
+        self.assertRaises(ValueError, define_relationship,
+                          'user_poked', User, User, ttl=60, counters=True)
+        self.assertRaises(ValueError, define_relationship,
+                          'user_blocked', User, User, ttl=60, cache='default')
+    
+    def test_expired_connections_are_ignored(self):
+        c = self.r.create_connection(self.foo, self.bar)
+        self.r.create_connection(self.foo, self.jaz)
+        assert timezone.now() < c.expires <= c.date + timedelta(hours=1)
+        self.expire((self.foo, self.bar))
+        
+        assert not self.r.connection_exists(self.foo, self.bar)
+        assert self.r.get_connection(self.foo, self.bar) is None
+        assert self.r.connection_exists(self.foo, self.jaz)
+        assert set(self.r.connected_object_ids(self.foo)) == set([self.jaz.pk])
+        assert list(self.r.connected_to_object_ids(self.bar)) == []
+        assert [c.to_pk for c in self.r.connections_from_object(self.foo)] == [self.jaz.pk]
+        assert self.r.distance_between(self.foo, self.bar) is None
+        assert self.r.neighbourhood(self.foo) == {self.foo.pk: 0, self.jaz.pk: 1}
+        assert Connection.objects.count() == 2
+    
+    def test_connections_are_renewed(self):
+        c = self.r.create_connection(self.foo, self.bar)
+        Connection.objects.filter(pk=c.pk).update(
+            expires=timezone.now() + timedelta(seconds=1))
+        renewed = self.r.create_connection(self.foo, self.bar)
+        assert renewed.pk == c.pk and renewed.date == c.date
+        assert renewed.expires > timezone.now() + timedelta(minutes=59)
+        assert Connection.objects.get(pk=c.pk).expires == renewed.expires
+    
+    def test_expired_connections_are_revived(self):
+        created = []
+        
+        def handler(sender, connection, **kwargs):
+            created.append((connection.from_pk, connection.to_pk))
+        connection_created.connect(handler)
+        try:
+            c = self.r.create_connection(self.foo, self.bar)
+            self.r.create_connection(self.foo, self.jaz)
+            self.expire((self.foo, self.bar))
+            del created[:]
+            
+            revived = self.r.create_connection(self.foo, self.bar)
+            assert revived.pk == c.pk and revived.date > c.date
+            assert self.r.connection_exists(self.foo, self.bar)
+            assert created == [(self.foo.pk, self.bar.pk)]
+            
+            self.expire((self.foo, self.bar))
+            del created[:]
+            result = self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz),
+                                                (self.bar, self.jaz)])
+            assert sorted((c.from_pk, c.to_pk) for c in result) == sorted(created) == [
+                (self.foo.pk, self.bar.pk), (self.bar.pk, self.jaz.pk)]
+            assert all(c.expires > timezone.now() for c in Connection.objects.all())
+        finally:
+            connection_created.disconnect(handler)
+        assert Connection.objects.count() == 3
+    
+    def test_purge(self):
+        users = [User.objects.create_user(username='u%d' % i) for i in range(5)]
+        self.r.create_connections([(self.foo, user) for user in users])
+        self.r.create_connection(self.bar, self.jaz)
+        follow = define_relationship('user_follow', User, User)
+        follow.create_connection(self.foo, self.bar)
+        self.expire(*[(self.foo, user) for user in users])
+        Connection.objects.filter(from_pk=self.foo.pk, to_pk=self.bar.pk).update(
+            expires=timezone.now() - timedelta(seconds=1))
+        
+        with self.assertNumQueries(6):
+            assert self.r.purge_expired(batch_size=2) == 5
+        assert list(self.r.connections.values_list('from_pk', 'to_pk')) == [
+            (self.bar.pk, self.jaz.pk)]
+        # connections of other relationships are left alone
+        assert follow.connection_exists(self.foo, self.bar)
+        assert self.r.purge_expired() == 0
+    
+    def test_purge_command(self):
+        self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz)])
+        self.expire((self.foo, self.bar))
+        call_command('connections_purge', batch_size=1, sleep=0, verbosity=0)
+        assert list(Connection.objects.values_list('to_pk', flat=True)) == [self.jaz.pk]
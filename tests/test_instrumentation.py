@@ -0,0 +1,117 @@
+from unittest import SkipTest
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from connections import instrumentation
+from connections.models import _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+# queries can't be counted before Django 2.0
+def queries(n):
+    return n if django.VERSION >= (2, 0) else None
+
+
+class RecordingBackend(instrumentation.Backend):
+    def __init__(self):
+        self.measurements = []
+    
+    def record(self, measurement):
+        self.measurements.append(measurement)
+    
+    def operations(self):
+        return [(m.relationship, m.operation, m.queries, m.rows)
+                for m in self.measurements]
+
+
+@override_settings(CONNECTIONS_INSTRUMENTATION='tests.test_instrumentation.RecordingBackend')
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz)])
+        self.backend = instrumentation.get_backend()
+        del self.backend.measurements[:]
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def test_disabled(self):
+        with self.settings(CONNECTIONS_INSTRUMENTATION=None):
+            assert instrumentation.get_backend() is None
+            assert self.r.connection_exists(self.foo, self.bar)
+        assert self.backend.measurements == []
+    
+    def test_operations(self):
+        assert self.r.connection_exists(self.foo, self.bar)
+        assert self.r.out_degree(self.foo) == 2
+        assert self.r.get_connection(self.bar, self.foo) is None
+        connections, cursor = self.r.page_connections_from(self.foo)
+        assert self.backend.operations() == [
+            ('user_follow', 'connection_exists', queries(1), None),
+            # ``out_degree()`` calls ``out_degrees()``
+            ('user_follow', 'out_degree', queries(1), None),
+            ('user_follow', 'get_connection', queries(1), 0),
+            ('user_follow', 'page_connections_from', queries(1), 2),
+        ]
+        assert all(m.elapsed > 0 for m in self.backend.measurements)
+    
+    def test_query_sets_are_measured_when_evaluated(self):
+        connections = self.r.connections_from_object(self.foo)
+        ids = self.r.connected_object_ids(self.foo).filter(to_pk=self.bar.pk)
+        assert self.backend.measurements == []
+        assert len(connections) == 2
+        assert list(ids) == [self.bar.pk]
+        assert list(connections) and list(ids)
+        assert self.backend.operations() == [
+            ('user_follow', 'connections_from_object', queries(1), 2),
+            ('user_follow', 'connected_object_ids', queries(1), 1),
+        ]
+    
+    def test_sql_is_tagged(self):
+        if django.VERSION < (2, 0):
+            raise SkipTest('execute wrappers require Django 2.0')
+        # query logs record SQL before execute wrappers see it
+        sql = []
+        connection.ensure_connection()
+        connection.connection.set_trace_callback(sql.append)
+        try:
+            self.r.connection_exists(self.foo, self.bar)
+            list(self.r.connections_to_object(self.bar))
+            self.backend.tag_sql = False
+            self.r.connection_exists(self.foo, self.bar)
+        finally:
+            connection.connection.set_trace_callback(None)
+        # leave out e.g. the ``SELECT QUOTE(...)`` queries of DEBUG logging
+        sql = [statement for statement in sql if 'connections_connection' in statement]
+        assert len(sql) == 3
+        assert sql[0].endswith(
+            " /*relationship='user_follow',operation='connection_exists'*/")
+        assert sql[1].endswith(
+            " /*relationship='user_follow',operation='connections_to_object'*/")
+        assert '/*' not in sql[2]
+    
+    def test_template_tags(self):
+        Template(
+            '{% load connections %}'
+            '{% connection_exists "user_follow" foo bar as exists %}'
+            '{% connections_from_object "user_follow" foo as cs %}'
+            '{% for c in cs %}{{ c.to_pk }}{% endfor %}'
+        ).render(Context({'foo': self.foo, 'bar': self.bar}))
+        assert self.backend.operations() == [
+            ('user_follow', 'tag:connection_exists', queries(1), None),
+            ('user_follow', 'tag:connections_from_object', queries(1), 2),
+        ]
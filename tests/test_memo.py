@@ -0,0 +1,100 @@
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+
+from connections import memo
+from connections.middleware import MemoizeConnectionsMiddleware
+from connections.models import _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class MemoTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, memoize_ids=True)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.r.create_connection(self.foo, self.bar)
+    
+    def tearDown(self):
+        reset_registry(registry)
+        memo.set_identity_map(None)
+    
+    def test_lookups_are_memoized(self):
+        with memo.memoize():
+            with self.assertNumQueries(2):
+                assert self.r.connection_exists(self.foo, self.bar)
+                assert self.r.connection_exists(self.foo, self.bar)
+                assert self.r.get_connection(self.bar, self.foo) is None
+                assert self.r.get_connection(self.bar, self.foo) is None
+            with self.assertNumQueries(0):
+                # known not to exist
+                assert not self.r.connection_exists(self.bar, self.foo)
+                assert self.r.distance_between(self.foo, self.bar) == 1
+            
+            with self.assertNumQueries(1):
+                assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+                assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+                assert not self.r.connection_exists(self.foo, self.jaz)
+        
+        with self.assertNumQueries(2):
+            assert self.r.connection_exists(self.foo, self.bar)
+            assert list(self.r.connected_object_ids(self.foo)) == [self.bar.pk]
+    
+    def test_writes_update_the_map(self):
+        with memo.memoize() as identity_map:
+            assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+            assert self.r.connected_to_object_ids(self.jaz) == set()
+            
+            c = self.r.create_connection(self.foo, self.jaz)
+            self.r.remove_connections([(self.foo, self.bar)])
+            with self.assertNumQueries(0):
+                assert self.r.connected_object_ids(self.foo) == set([self.jaz.pk])
+                assert self.r.connected_to_object_ids(self.jaz) == set([self.foo.pk])
+                assert self.r.get_connection(self.foo, self.jaz) == c
+                assert self.r.get_connection(self.foo, self.bar) is None
+            
+            identity_map.clear()
+            with self.assertNumQueries(1):
+                assert self.r.connection_exists(self.foo, self.jaz)
+    
+    def test_ids_memoization_is_opt_in(self):
+        r = define_relationship('user_block', User, User)
+        r.create_connection(self.foo, self.bar)
+        with memo.memoize():
+            ids = r.connected_object_ids(self.foo)
+            assert ids.filter(pk=self.bar.pk).exists()
+            assert list(ids) == [self.bar.pk]
+            assert list(r.connected_to_object_ids(self.bar)) == [self.foo.pk]
+    
+    def test_template_tags(self):
+        template = Template(
+            '{% load connections %}{% for item in items %}'
+            '{% connection_exists "user_follow" foo item as f %}{{ f|yesno:"y,n" }}'
+            '{% endfor %}')
+        context = Context({'foo': self.foo, 'items': [self.bar, self.jaz] * 10})
+        with memo.memoize():
+            with self.assertNumQueries(2):
+                assert template.render(context) == 'yn' * 10
+    
+    def test_middleware(self):
+        try:
+            middleware = MemoizeConnectionsMiddleware(lambda request: HttpResponse())
+        except TypeError:  # Django < 1.10
+            middleware = MemoizeConnectionsMiddleware()
+        request = RequestFactory().get('/')
+        
+        middleware.process_request(request)
+        assert memo.get_identity_map() is not None
+        with self.assertNumQueries(1):
+            assert self.r.connection_exists(self.foo, self.bar)
+            assert self.r.connection_exists(self.foo, self.bar)
+        middleware.process_response(request, HttpResponse())
+        assert memo.get_identity_map() is None
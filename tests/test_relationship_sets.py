@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import Group, User
+from django.test import TestCase
+from django.utils import timezone
+
+from connections.models import RelationshipSet, _relationship_registry as registry
+from connections.shortcuts import define_relationship, get_relationships
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class RelationshipSetTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.follow = define_relationship('user_follow', User, User)
+        self.friend = define_relationship('user_friend', User, User, symmetric=True)
+        self.join = define_relationship('join_group', User, Group)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.group = Group.objects.create(name='devs')
+        
+        # oldest first
+        now = timezone.now()
+        for days, (relationship, from_obj, to_obj) in enumerate([
+                (self.follow, self.foo, self.bar),
+                (self.join, self.foo, self.group),
+                (self.friend, self.jaz, self.foo),
+                (self.follow, self.bar, self.foo)]):
+            c = relationship.create_connection(from_obj, to_obj)
+            relationship.connections.filter(pk=c.pk).update(
+                date=now - timedelta(days=10 - days))
+        self.rs = get_relationships('user_follow', 'user_friend', self.join)
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def test_get_relationships(self):
+        assert isinstance(self.rs, RelationshipSet)
+        assert list(self.rs) == [self.follow, self.friend, self.join]
+        assert len(self.rs) == 3
+    
+    def test_connections_from_object(self):
+        with self.assertNumQueries(1):
+            connections = self.rs.connections_from_object(self.foo)
+        assert [(c.relationship, c.from_pk, c.to_pk) for c in connections] == [
+            (self.friend, self.foo.pk, self.jaz.pk),
+            (self.join, self.foo.pk, self.group.pk),
+            (self.follow, self.foo.pk, self.bar.pk),
+        ]
+        assert len(self.rs.connections_from_object(self.foo, limit=1)) == 1
+    
+    def test_connected_object_ids(self):
+        with self.assertNumQueries(1):
+            ids = self.rs.connected_object_ids(self.foo, limit=2)
+        assert ids == [(self.friend, self.jaz.pk), (self.join, self.group.pk)]
+        assert self.rs.connected_object_ids(self.bar) == [(self.follow, self.foo.pk)]
+    
+    def test_connected_objects(self):
+        # one query for connections, one per model
+        with self.assertNumQueries(3):
+            objects = self.rs.connected_objects(self.foo)
+        assert objects == [(self.friend, self.jaz), (self.join, self.group),
+                           (self.follow, self.bar)]
+    
+    def test_validates_source_model(self):
+        self.assertRaises(AssertionError, self.rs.connected_object_ids, self.group)
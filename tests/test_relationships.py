@@ -5,7 +5,9 @@ try:
 except ImportError:
     from nose.tools import assert_raises_regexp as assert_raises_regex
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from connections.models import (NAME_MAX_LENGTH, get_model,
     Relationship, Connection, _relationship_registry as registry)
@@ -66,3 +68,17 @@ def test_get_relationship():
     assert r is get_relationship('rel')
     assert r is get_relationship(r)
     assert_raises(Relationship.DoesNotExist, get_relationship, 'invalid')
+
+
+@with_setup(reset_registry(registry), reset_registry(registry))
+def test_define_relationship_is_lazy():
+    with CaptureQueriesContext(connection) as ctx:
+        r1 = define_relationship('rel1', 'auth.User', 'auth.Group')
+        r2 = define_relationship('rel2', 'invalid.Model', User)
+        r1._validate_ctypes(User(pk=1), Group(pk=1))
+        assert_raises(AssertionError, r1._validate_ctypes, Group(pk=1), None)
+        assert_raises(AssertionError, r1._validate_ctypes, None, User(pk=1))
+        assert r1.from_model is User
+        assert r1.to_model is Group
+    assert len(ctx.captured_queries) == 0
+    assert_raises_regex(ValueError, '^invalid\.Model$', getattr, r2, 'from_model')
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+
+from connections import replicas
+from connections.middleware import ReadYourWritesMiddleware
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+# The ``other`` database stands in for a replica that hasn't caught up yet.
+@override_settings(
+    DATABASE_ROUTERS=['connections.routers.ReplicaRouter',
+                      'connections.routers.RelationshipRouter'],
+    CONNECTIONS_REPLICAS={'default': ['other']},
+)
+class ReplicaTests(TestCase):
+    multi_db = True  # Django < 2.2
+    databases = {'default', 'other'}
+    
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, counters=True)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        replicas.unpin()
+        cache.clear()
+    
+    def tearDown(self):
+        reset_registry(registry)
+        replicas.unpin()
+        cache.clear()
+    
+    def test_reads_go_to_replicas(self):
+        Connection.objects.using('default').bulk_create([
+            Connection(relationship_id=self.r.id, from_pk=self.foo.pk, to_pk=self.bar.pk)])
+        assert self.r.connections.db == 'other'
+        assert self.r.db_for_write == 'default'
+        assert not self.r.connection_exists(self.foo, self.bar)
+    
+    def test_writer_is_pinned(self):
+        self.r.create_connection(self.foo, self.bar)
+        assert replicas.is_pinned()
+        assert self.r.connections.db == 'default'
+        assert self.r.connection_exists(self.foo, self.bar)
+    
+    def test_written_nodes_are_pinned(self):
+        self.r.create_connections([(self.foo, self.bar)])
+        replicas.unpin()
+        assert self.r.connection_exists(self.foo, self.bar)
+        assert list(self.r.connected_object_ids(self.foo)) == [self.bar.pk]
+        assert self.r.in_degree(self.bar) == 1
+        assert self.r.connections_to_object(self.jaz).db == 'other'
+        
+        cache.clear()
+        assert not self.r.connection_exists(self.foo, self.bar)
+    
+    def test_middleware(self):
+        try:
+            middleware = ReadYourWritesMiddleware(lambda request: HttpResponse())
+        except TypeError:  # Django < 1.10
+            middleware = ReadYourWritesMiddleware()
+        factory = RequestFactory()
+        
+        request = factory.get('/')
+        middleware.process_request(request)
+        assert not replicas.is_pinned()
+        self.r.create_connection(self.foo, self.bar)
+        response = middleware.process_response(request, HttpResponse())
+        assert response.cookies[replicas.COOKIE_NAME]['max-age'] == replicas.PIN_SECONDS
+        assert not replicas.is_pinned()
+        
+        request = factory.get('/')
+        request.COOKIES[replicas.COOKIE_NAME] = '1'
+        middleware.process_request(request)
+        assert replicas.is_pinned()
+        response = middleware.process_response(request, HttpResponse())
+        assert replicas.COOKIE_NAME not in response.cookies
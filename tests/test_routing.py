@@ -0,0 +1,150 @@
+from nose.tools import assert_raises, with_setup
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from connections.models import (Connection, ConnectionCounter,
+    _relationship_registry as registry)
+from connections.partitioning import (partition_connections, partition_sql,
+    partitions)
+from connections.shortcuts import define_relationship, get_relationships
+
+
+def reset_registry(d):
+    def fn():
+        for k in list(d.keys()):
+            d.pop(k)
+    return fn
+
+
+class RoutingTests(TestCase):
+    multi_db = True  # Django < 2.2
+    databases = {'default', 'other'}
+    
+    def setUp(self):
+        reset_registry(registry)()
+        self.r = define_relationship('remote', User, User, counters=True,
+                                     using='other')
+        self.local = define_relationship('local', User, User)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+    
+    def tearDown(self):
+        reset_registry(registry)()
+    
+    def test_connections_are_routed(self):
+        self.r.create_connection(self.foo, self.bar)
+        self.r.create_connections([(self.foo, self.jaz), (self.bar, self.jaz)])
+        self.local.create_connection(self.foo, self.bar)
+        
+        assert Connection.objects.using('other').count() == 3
+        assert Connection.objects.using('default').count() == 1
+        assert self.r.connections.count() == 3
+        assert self.r.connection_exists(self.foo, self.bar)
+        assert self.r.distance_between(self.foo, self.jaz) == 1
+        assert self.r.distance_between(self.jaz, self.foo) is None
+        
+        assert ConnectionCounter.objects.using('other').count() == 4
+        assert ConnectionCounter.objects.using('default').count() == 0
+        assert self.r.out_degree(self.foo) == 2
+        assert self.r.in_degree(self.jaz) == 2
+        
+        c = self.r.get_connection(self.foo, self.bar)
+        assert c._state.db == 'other'
+        c.delete()
+        assert self.r.out_degree(self.foo) == 1
+        assert self.r.remove_connections([(self.foo, self.jaz)]) == 1
+        assert Connection.objects.using('other').count() == 1
+        
+        ConnectionCounter.objects.using('other').update(count=0)
+        self.r.rebuild_counters()
+        assert self.r.in_degree(self.jaz) == 1
+    
+    def test_connected_objects_are_routed(self):
+        self.r.create_connection(self.foo, self.jaz)
+        self.r.create_connection(self.bar, self.jaz)
+        self.r.create_connection(self.foo, self.bar)
+        
+        assert sorted(self.r.connected_objects(self.foo), key=lambda u: u.pk) == [
+            self.bar, self.jaz]
+        assert sorted(self.r.connected_to_objects(self.jaz), key=lambda u: u.pk) == [
+            self.foo, self.bar]
+        assert list(self.r.mutual_connections(self.foo, self.bar)) == [self.jaz]
+        
+        sibling = define_relationship('remote_sibling', User, User, using='other',
+                                      symmetric=True)
+        sibling.create_connections([(self.foo, self.jaz), (self.jaz, self.bar)])
+        assert list(sibling.mutual_connections(self.foo, self.bar)) == [self.jaz]
+    
+    def test_relationship_sets_span_databases(self):
+        self.local.create_connection(self.foo, self.bar)
+        self.r.create_connection(self.foo, self.jaz)
+        rs = get_relationships('remote', 'local')
+        with self.assertNumQueries(1, using='default'), \
+                self.assertNumQueries(1, using='other'):
+            ids = rs.connected_object_ids(self.foo, limit=1)
+        assert ids == [(self.r, self.jaz.pk)]
+        assert sorted(c._state.db for c in rs.connections_from_object(self.foo)) == [
+            'default', 'other']
+
+
+@with_setup(reset_registry(registry), reset_registry(registry))
+def test_partition_sql():
+    follow = define_relationship('follow', User, User, partition='hot')
+    like = define_relationship('like', User, User, partition='hot')
+    view = define_relationship('view', User, User, partition='cold')
+    define_relationship('block', User, User)
+    assert_raises(ValueError, define_relationship, 'x', User, User, partition='Hot!')
+    
+    wanted = partitions(registry.values())
+    hot = sorted([follow.id, like.id])
+    assert wanted == [('cold', [view.id]), ('hot', hot)]
+    
+    sql = partition_sql(connection, wanted, sequence='connections_connection_id_seq')
+    assert sql[:2] == [
+        'ALTER TABLE "connections_connection" RENAME TO "connections_connection_unpartitioned"',
+        'CREATE TABLE "connections_connection" (LIKE "connections_connection_unpartitioned" '
+        'INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY LIST ("relationship_id")',
+    ]
+    assert ('CREATE TABLE "connections_connection_hot" PARTITION OF '
+            '"connections_connection" FOR VALUES IN (%d, %d)' % tuple(hot)) in sql
+    assert ('CREATE TABLE "connections_connection_default" PARTITION OF '
+            '"connections_connection" DEFAULT') in sql
+    assert ('ALTER SEQUENCE connections_connection_id_seq OWNED BY '
+            '"connections_connection"."id"') in sql
+    assert (sql.index('DROP TABLE "connections_connection_unpartitioned"') <
+            sql.index('ALTER TABLE "connections_connection" ADD PRIMARY KEY ("id", "relationship_id")'))
+    
+    # a new partition, and a new relationship in an existing one
+    bounds = {
+        'connections_connection_hot': set([follow.id]),
+        'connections_connection_default': None,
+    }
+    sql = partition_sql(connection, wanted, partitioned=True, bounds=bounds)
+    assert sql == [
+        'ALTER TABLE "connections_connection" DETACH PARTITION "connections_connection_default"',
+        'CREATE TABLE "connections_connection_cold" PARTITION OF "connections_connection" '
+        'FOR VALUES IN (%d)' % view.id,
+        'INSERT INTO "connections_connection" SELECT * FROM "connections_connection_default" '
+        'WHERE "relationship_id" IN (%d)' % view.id,
+        'DELETE FROM "connections_connection_default" WHERE "relationship_id" IN (%d)' % view.id,
+        'ALTER TABLE "connections_connection" DETACH PARTITION "connections_connection_hot"',
+        'INSERT INTO "connections_connection_hot" SELECT * FROM "connections_connection_default" '
+        'WHERE "relationship_id" IN (%d)' % like.id,
+        'DELETE FROM "connections_connection_default" WHERE "relationship_id" IN (%d)' % like.id,
+        'ALTER TABLE "connections_connection" ATTACH PARTITION "connections_connection_hot" '
+        'FOR VALUES IN (%d, %d)' % tuple(hot),
+        'ALTER TABLE "connections_connection" ATTACH PARTITION "connections_connection_default" DEFAULT',
+    ]
+    
+    bounds = {
+        'connections_connection_hot': set(hot),
+        'connections_connection_cold': set([view.id]),
+        'connections_connection_default': None,
+    }
+    assert partition_sql(connection, wanted, partitioned=True, bounds=bounds) == []
+    
+    if connection.vendor != 'postgresql':
+        assert_raises(ValueError, partition_connections)
@@ -0,0 +1,99 @@
+from unittest import SkipTest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from connections.models import Connection, _relationship_registry as registry
+from connections.pagination import keyset
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+# Layout of the connections table before relationship IDs and 64-bit
+# primary keys, used as a baseline for the size comparison below.
+LEGACY_TABLE_SQL = """
+CREATE TABLE legacy_connection (
+    id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    relationship_name varchar(50) NOT NULL,
+    from_pk integer NOT NULL,
+    to_pk integer NOT NULL,
+    weight real NOT NULL,
+    date datetime NOT NULL
+)
+"""
+
+LEGACY_INDEX_SQL = """
+CREATE UNIQUE INDEX legacy_connection_unique
+ON legacy_connection (relationship_name, from_pk, to_pk)
+"""
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            raise SkipTest('requires SQLite')
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User)
+        Connection.objects.bulk_create([
+            Connection(relationship_id=self.r.id, from_pk=i, to_pk=j)
+            for i in range(1, 101) for j in range(1, 21)
+        ])
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def query_plan(self, qs):
+        sql, params = qs.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' '.join(str(row[-1]) for row in cursor.fetchall())
+    
+    def table_size(self, *names):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name IN (%s)' %
+                           ', '.join(['%s'] * len(names)), names)
+        except Exception:
+            raise SkipTest('requires SQLite with the dbstat virtual table')
+        return cursor.fetchone()[0]
+    
+    def test_forward_lookup_uses_covering_index(self):
+        plan = self.query_plan(self.r.connections.filter(from_pk=1).values_list('to_pk'))
+        assert 'COVERING INDEX' in plan, plan
+        assert 'from_pk=?' in plan, plan
+    
+    def test_reverse_lookup_uses_covering_index(self):
+        plan = self.query_plan(self.r.connections.filter(to_pk=1).values_list('from_pk'))
+        assert 'COVERING INDEX' in plan, plan
+        assert 'to_pk=?' in plan, plan
+    
+    def test_pagination_uses_index_range_scan(self):
+        cursor = self.r.page_connections_to(User(pk=1), limit=10)[1]
+        for reverse in (False, True):
+            qs = keyset(self.r.connections.filter(to_pk=1), cursor, reverse)
+            plan = self.query_plan(qs[:51])
+            assert 'to_pk=? AND date' in plan, plan
+            assert 'TEMP B-TREE' not in plan, plan
+    
+    def test_table_size(self):
+        cursor = connection.cursor()
+        cursor.execute(LEGACY_TABLE_SQL)
+        cursor.execute(LEGACY_INDEX_SQL)
+        cursor.execute('INSERT INTO legacy_connection '
+                       'SELECT id, %s, from_pk, to_pk, weight, date '
+                       'FROM connections_connection', [self.r.name])
+        
+        table = Connection._meta.db_table
+        cursor.execute('PRAGMA index_list(%s)' % table)
+        unique_index = [row[1] for row in cursor.fetchall() if row[2]][0]
+        
+        # rows and the forward index shrink; the reverse index is the price
+        # paid for index-only lookups of connections to an object.
+        assert self.table_size(table) < self.table_size('legacy_connection')
+        assert (self.table_size(unique_index) <
+                self.table_size('legacy_connection_unique'))
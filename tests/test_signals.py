@@ -1,10 +1,18 @@
+from unittest import skipIf
+
 from nose.tools import with_setup
 
+import django
 from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase
 
-from connections.models import _relationship_registry as registry
-from connections.shortcuts import define_relationship, create_connection
-from connections.signals import connection_created, connection_removed
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import (define_relationship, create_connection,
+    create_connections, remove_connections)
+from connections.signals import (connection_created, connection_removed,
+    connections_created_batch, connections_removed_batch)
 
 
 def reset_registry(d):
@@ -59,3 +67,185 @@ def test_connection_removed():
         connection_removed.disconnect(handler)
         foo.delete()
         bar.delete()
+
+
+@with_setup(reset_registry(registry), reset_registry(registry))
+def test_bulk_connection_signals():
+    foo = User.objects.create_user(username='foo')
+    bar = User.objects.create_user(username='bar')
+    jaz = User.objects.create_user(username='jaz')
+    r = define_relationship('rel', User, User)
+    created = []
+    removed = []
+    
+    def created_handler(signal, sender, connection, **kwargs):
+        assert sender is r
+        assert connection.pk
+        created.append((connection.from_pk, connection.to_pk))
+    
+    def removed_handler(signal, sender, connection, **kwargs):
+        assert sender is r
+        removed.append((connection.from_pk, connection.to_pk))
+    
+    try:
+        connection_created.connect(created_handler, sender=r)
+        connection_removed.connect(removed_handler, sender=r)
+        create_connections(r, [(foo, bar), (foo, jaz)])
+        assert sorted(created) == sorted([(foo.pk, bar.pk), (foo.pk, jaz.pk)])
+        remove_connections(r, [(foo, bar), (foo, jaz)])
+        assert sorted(removed) == sorted(created)
+    finally:
+        connection_created.disconnect(created_handler)
+        connection_removed.disconnect(removed_handler)
+        r.connections.delete()
+        foo.delete()
+        bar.delete()
+        jaz.delete()
+
+
+@with_setup(reset_registry(registry), reset_registry(registry))
+def test_batch_signals():
+    foo = User.objects.create_user(username='foo')
+    bar = User.objects.create_user(username='bar')
+    jaz = User.objects.create_user(username='jaz')
+    r = define_relationship('rel', User, User)
+    received = []
+    
+    def handler(signal, sender, pairs, **kwargs):
+        assert sender is r
+        received.append((signal, sorted(pairs)))
+    
+    try:
+        connections_created_batch.connect(handler, sender=r)
+        connections_removed_batch.connect(handler, sender=r)
+        # outside transactions, batches are sent right away
+        create_connections(r, [(foo, bar), (foo, jaz)])
+        assert received == [(connections_created_batch,
+                             sorted([(foo.pk, bar.pk), (foo.pk, jaz.pk)]))]
+        create_connection(r, bar, foo).delete()
+        assert received[1:] == [(connections_created_batch, [(bar.pk, foo.pk)]),
+                                (connections_removed_batch, [(bar.pk, foo.pk)])]
+    finally:
+        connections_created_batch.disconnect(handler)
+        connections_removed_batch.disconnect(handler)
+        r.connections.delete()
+        foo.delete()
+        bar.delete()
+        jaz.delete()
+
+
+class BatchSignalTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)()
+        self.r = define_relationship('rel', User, User, counters=True)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.received = []
+        connections_created_batch.connect(self.handler, sender=self.r)
+        connections_removed_batch.connect(self.handler, sender=self.r)
+    
+    def tearDown(self):
+        connections_created_batch.disconnect(self.handler)
+        connections_removed_batch.disconnect(self.handler)
+        reset_registry(registry)()
+    
+    def handler(self, signal, sender, pairs, **kwargs):
+        self.received.append((signal, sorted(pairs)))
+    
+    @skipIf(django.VERSION < (3, 2), 'requires Django 3.2 or later')
+    def test_sent_once_per_transaction(self):
+        foo, bar, jaz = self.foo.pk, self.bar.pk, self.jaz.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz)])
+            self.r.create_connection(self.bar, self.foo)
+            try:
+                with transaction.atomic():
+                    self.r.create_connection(self.jaz, self.foo)
+                    raise DatabaseError()
+            except DatabaseError:
+                pass
+            self.r.remove_connections([(self.foo, self.jaz)])
+            assert self.received == []
+        assert self.received == [
+            (connections_created_batch, sorted([(foo, bar), (foo, jaz), (bar, foo)])),
+            (connections_removed_batch, [(foo, jaz)]),
+        ]
+    
+    def test_row_signals_setting(self):
+        rows = []
+        
+        def row_handler(signal, sender, connection, **kwargs):
+            rows.append(connection)
+        
+        connection_created.connect(row_handler, sender=self.r)
+        try:
+            with self.settings(CONNECTIONS_ROW_SIGNALS=False):
+                c = self.r.create_connection(self.foo, self.bar)
+                self.r.create_connections([(self.foo, self.jaz)])
+                assert rows == []
+                assert self.r.out_degree(self.foo) == 2
+                # no receivers, so connections aren't fetched to be deleted
+                with self.assertNumQueries(1):
+                    self.r.connections.filter(pk=c.pk).delete()
+            assert post_delete.has_listeners(Connection)
+            self.r.create_connection(self.bar, self.foo)
+            assert len(rows) == 1
+        finally:
+            connection_created.disconnect(row_handler)
+    
+    @skipIf(django.VERSION < (3, 2), 'requires Django 3.2 or later')
+    def test_flusher_rolled_back(self):
+        foo, bar = self.foo.pk, self.bar.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.r.create_connection(self.jaz, self.foo)
+                    raise DatabaseError()
+            except DatabaseError:
+                pass
+            self.r.create_connections([(self.foo, self.bar)])
+        assert self.received == [(connections_created_batch, [(foo, bar)])]
+    
+    def test_row_signals_option(self):
+        rows = []
+        
+        def row_handler(signal, sender, connection, **kwargs):
+            rows.append(connection)
+        
+        quiet = define_relationship('quiet', User, User, counters=True,
+                                    row_signals=False)
+        connection_created.connect(row_handler)
+        connection_removed.connect(row_handler)
+        try:
+            quiet.create_connection(self.foo, self.bar)
+            quiet.create_connections([(self.foo, self.jaz)])
+            quiet.remove_connections([(self.foo, self.jaz)])
+            assert rows == []
+            assert quiet.out_degree(self.foo) == 1
+            self.r.create_connection(self.foo, self.bar)
+            assert len(rows) == 1
+            assert self.r.out_degree(self.foo) == 1
+        finally:
+            connection_created.disconnect(row_handler)
+            connection_removed.disconnect(row_handler)
+    
+    def test_remove_object_connections(self):
+        foo, bar, jaz = self.foo.pk, self.bar.pk, self.jaz.pk
+        pairs = [(self.foo, self.bar), (self.bar, self.jaz), (self.jaz, self.foo)]
+        if django.VERSION < (3, 2):
+            self.r.create_connections(pairs)
+            assert self.r.remove_object_connections(self.foo) == 2
+        else:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.r.create_connections(pairs)
+            del self.received[:]
+            with self.captureOnCommitCallbacks(execute=True):
+                assert self.r.remove_object_connections(self.foo) == 2
+            assert self.received == [
+                (connections_removed_batch, sorted([(foo, bar), (jaz, foo)])),
+            ]
+        assert self.r.out_degree(self.foo) == 0
+        assert self.r.in_degree(self.foo) == 0
+        assert self.r.out_degree(self.jaz) == 0
+        assert list(self.r.connections.values_list('from_pk', 'to_pk')) == [(bar, jaz)]
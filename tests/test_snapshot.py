@@ -0,0 +1,145 @@
+from datetime import timedelta
+from unittest import skipIf
+
+import django
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from connections import snapshot
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class NullContext(object):
+    def __enter__(self):
+        pass
+    
+    def __exit__(self, *args):
+        pass
+
+
+def committed(test):
+    # before Django 1.9, batch signals are sent right away
+    if django.VERSION < (1, 9):
+        return NullContext()
+    return test.captureOnCommitCallbacks(execute=True)
+
+
+class GraphSnapshotTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, snapshot=True)
+        self.users = [User.objects.create_user(username='u%d' % i) for i in range(6)]
+        u = self.users
+        Connection.objects.bulk_create([
+            Connection(relationship_id=self.r.id, from_pk=a.pk, to_pk=b.pk)
+            for a, b in [(u[0], u[1]), (u[0], u[2]), (u[1], u[3]), (u[3], u[4]),
+                         (u[2], u[1])]])
+    
+    def tearDown(self):
+        reset_registry(registry)
+    
+    def test_definition(self):
+        assert define_relationship('user_block', User, User).snapshot is None
+        self.assertRaises(ValueError, define_relationship,
+                          'user_viewed', User, User, snapshot=True, ttl=60)
+    
+    def test_lookups(self):
+        u = self.users
+        with self.assertNumQueries(2):
+            assert self.r.connection_exists(u[0], u[1])
+        assert not self.r.snapshot.loaded or self.r.snapshot.fresh
+        with self.assertNumQueries(0):
+            assert not self.r.connection_exists(u[1], u[0])
+            assert not self.r.connection_exists(u[5], u[0])
+            assert self.r.connected_object_ids(u[0]) == set([u[1].pk, u[2].pk])
+            assert self.r.connected_object_ids(u[5]) == set()
+            assert self.r.connected_to_object_ids(u[1]) == set([u[0].pk, u[2].pk])
+            assert self.r.distance_between(u[0], u[4], limit=3) == 3
+            assert self.r.distance_between(u[0], u[4], limit=2) is None
+            assert self.r.distance_between(u[4], u[0], limit=5) is None
+            assert self.r.neighbourhood(u[0], depth=1, max_fanout_per_node=None) == {
+                u[0].pk: 0, u[1].pk: 1, u[2].pk: 1}
+        assert len(self.r.snapshot) == 5
+        # 5 connections and 4 nodes each way
+        assert self.r.snapshot.memory_usage() == 8 * (5 + 4 + 5) * 2
+    
+    @skipIf((1, 9) <= django.VERSION < (3, 2), 'requires Django 3.2 or later')
+    def test_writes_are_applied(self):
+        u = self.users
+        self.r.snapshot.load()
+        with committed(self):
+            self.r.create_connections([(u[4], u[5]), (u[0], u[1])])
+            self.r.remove_connections([(u[0], u[2]), (u[5], u[0])])
+        with self.assertNumQueries(0):
+            assert self.r.connection_exists(u[4], u[5])
+            assert not self.r.connection_exists(u[0], u[2])
+            assert self.r.connected_object_ids(u[0]) == set([u[1].pk])
+            assert self.r.connected_to_object_ids(u[5]) == set([u[4].pk])
+            assert self.r.distance_between(u[0], u[5], limit=4) == 4
+        assert len(self.r.snapshot) == 5
+        assert self.r.snapshot.memory_usage() > 8 * (5 + 4 + 5) * 2
+        
+        self.r.snapshot.created([(u[0].pk, u[2].pk)])
+        self.r.snapshot.removed([(u[4].pk, u[5].pk)])
+        assert self.r.connected_object_ids(u[0]) == set([u[1].pk, u[2].pk])
+        assert not self.r.connection_exists(u[4], u[5])
+    
+    def test_overlay_is_merged(self):
+        u = self.users
+        self.r.snapshot.load()
+        old, snapshot.OVERLAY_SIZE = snapshot.OVERLAY_SIZE, 2
+        try:
+            self.r.snapshot.created([(u[5].pk, u[0].pk), (u[4].pk, u[1].pk)])
+            self.r.snapshot.removed([(u[0].pk, u[1].pk)])
+        finally:
+            snapshot.OVERLAY_SIZE = old
+        assert self.r.snapshot._added == {'out': {}, 'in': {}}
+        assert list(self.r.snapshot._csrs['out'].targets) == [
+            u[2].pk, u[3].pk, u[1].pk, u[4].pk, u[1].pk, u[0].pk]
+        assert self.r.connected_object_ids(u[5]) == set([u[0].pk])
+        assert self.r.connected_to_object_ids(u[1]) == set([u[2].pk, u[4].pk])
+        assert len(self.r.snapshot) == 6
+    
+    def test_refresh(self):
+        u = self.users
+        self.r.snapshot.load()
+        Connection.objects.create(relationship_id=self.r.id, from_pk=u[5].pk,
+                                  to_pk=u[0].pk)
+        Connection.objects.create(relationship_id=self.r.id, from_pk=u[5].pk,
+                                  to_pk=u[1].pk, date=timezone.now() - timedelta(days=1))
+        self.r.snapshot.clear()
+        self.r.snapshot.load()
+        Connection.objects.filter(from_pk=u[5].pk)._raw_delete(Connection.objects.db)
+        Connection.objects.bulk_create([
+            Connection(relationship_id=self.r.id, from_pk=u[4].pk, to_pk=u[2].pk),
+            Connection(relationship_id=self.r.id, from_pk=u[4].pk, to_pk=u[3].pk,
+                       date=timezone.now() - timedelta(days=1))])
+        # connections dated up to ``REFRESH_OVERLAP`` before the snapshot was
+        # loaded are read again
+        with self.assertNumQueries(1):
+            assert self.r.snapshot.refresh() == 6
+        # connections dated before the snapshot was loaded, and removals,
+        # are only picked up by reloading it
+        assert self.r.connected_object_ids(u[4]) == set([u[2].pk])
+        assert self.r.connected_object_ids(u[5]) == set([u[0].pk, u[1].pk])
+        
+        self.r.snapshot.refresh_interval = 0
+        with self.assertNumQueries(1):
+            assert self.r.connection_exists(u[4], u[2])
+    
+    def test_symmetric(self):
+        u = self.users
+        r = define_relationship('user_friend', User, User, symmetric=True, snapshot=True)
+        r.create_connections([(u[1], u[0]), (u[1], u[2]), (u[3], u[2])])
+        assert r.connection_exists(u[0], u[1]) and r.connection_exists(u[1], u[0])
+        assert r.connected_object_ids(u[1]) == set([u[0].pk, u[2].pk])
+        assert r.connected_to_object_ids(u[2]) == set([u[1].pk, u[3].pk])
+        assert r.distance_between(u[0], u[3], limit=3) == 3
+        assert len(r.snapshot) == 3
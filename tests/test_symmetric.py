@@ -0,0 +1,127 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from connections import memo
+from connections.models import Connection, _relationship_registry as registry
+from connections.shortcuts import define_relationship
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class SymmetricRelationshipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_registry(registry)
+        self.r = define_relationship('user_friend', User, User,
+                                     counters=True, symmetric=True)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.baz = User.objects.create_user(username='baz')
+    
+    def tearDown(self):
+        reset_registry(registry)
+        cache.clear()
+    
+    def test_models_must_match(self):
+        self.assertRaises(ValueError, define_relationship,
+                          'user_group', User, Group, symmetric=True)
+    
+    def test_single_connection_is_stored(self):
+        c = self.r.create_connection(self.bar, self.foo)
+        assert self.r.create_connection(self.foo, self.bar) == c
+        assert self.r.create_connections([(self.bar, self.foo), (self.foo, self.bar)]) == []
+        assert list(self.r.connections.values_list('from_pk', 'to_pk')) == [
+            (self.foo.pk, self.bar.pk)]
+        assert self.r.get_connection(self.bar, self.foo) == c
+        assert self.r.connection_exists(self.foo, self.bar)
+        assert self.r.connection_exists(self.bar, self.foo)
+        assert not self.r.connection_exists(self.foo, self.jaz)
+        
+        assert self.r.remove_connections([(self.bar, self.foo)]) == 1
+        assert not self.r.connection_exists(self.foo, self.bar)
+    
+    def test_connected_object_ids(self):
+        self.r.create_connections([(self.foo, self.bar), (self.jaz, self.foo)])
+        assert set(self.r.connected_object_ids(self.foo)) == set([self.bar.pk, self.jaz.pk])
+        assert set(self.r.connected_to_object_ids(self.foo)) == set([self.bar.pk, self.jaz.pk])
+        assert set(self.r.connected_object_ids(self.bar)) == set([self.foo.pk])
+        assert set(self.r.connected_objects(self.jaz)) == set([self.foo])
+        assert set(c.pk for c in self.r.connections_to_object(self.foo)) == set(
+            c.pk for c in self.r.connections.all())
+    
+    def test_degrees(self):
+        self.r.create_connections([(self.foo, self.bar), (self.jaz, self.foo)])
+        expected = {self.foo.pk: 2, self.bar.pk: 1, self.jaz.pk: 1, self.baz.pk: 0}
+        users = [self.foo, self.bar, self.jaz, self.baz]
+        assert self.r.out_degrees(users) == expected
+        assert self.r.in_degrees(users) == expected
+        self.r.rebuild_counters(batch_size=1)
+        assert self.r.in_degrees(users) == expected
+        
+        self.r.counters = False
+        assert self.r.out_degrees(users) == expected
+        assert self.r.in_degree(self.foo) == 2
+    
+    def test_traversal(self):
+        self.r.create_connections([(self.bar, self.foo), (self.jaz, self.bar)])
+        assert self.r.distance_between(self.foo, self.bar) == 1
+        assert self.r.distance_between(self.foo, self.jaz) == 2
+        assert self.r.distance_between(self.jaz, self.foo) == 2
+        assert self.r.distance_between(self.foo, self.baz) is None
+        assert self.r.neighbourhood(self.foo) == {
+            self.foo.pk: 0, self.bar.pk: 1, self.jaz.pk: 2}
+        assert self.r.neighbourhood(self.jaz, max_fanout_per_node=1) == {
+            self.jaz.pk: 0, self.bar.pk: 1}
+        assert self.r.shortest_path(self.foo, self.jaz) == (
+            [self.foo.pk, self.bar.pk, self.jaz.pk], 2)
+        
+        assert list(self.r.mutual_connections(self.foo, self.jaz)) == [self.bar]
+        assert self.r.common_neighbors_count(self.foo, [self.jaz, self.baz]) == {
+            self.jaz.pk: 1, self.baz.pk: 0}
+        assert [(user, count) for user, count, score in self.r.suggest(self.foo)] == [
+            (self.jaz, 1)]
+    
+    def test_cache_and_memo(self):
+        self.r = define_relationship('user_sibling', User, User, cache='default',
+                                     symmetric=True, memoize_ids=True)
+        self.r.create_connection(self.bar, self.foo)
+        assert self.r.connected_object_ids(self.bar) == set([self.foo.pk])
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk])
+        self.r.create_connection(self.jaz, self.foo)
+        assert self.r.connected_object_ids(self.foo) == set([self.bar.pk, self.jaz.pk])
+        with self.assertNumQueries(0):
+            assert self.r.connected_object_ids(self.foo) == set([self.bar.pk, self.jaz.pk])
+        
+        with memo.memoize():
+            assert self.r.connected_to_object_ids(self.bar) == set([self.foo.pk])
+            self.r.remove_connections([(self.foo, self.bar)])
+            with self.assertNumQueries(0):
+                assert self.r.connected_to_object_ids(self.bar) == set()
+                assert not self.r.connection_exists(self.foo, self.bar)
+    
+    def test_collapse_connections(self):
+        def connect(from_obj, to_obj):
+            Connection.objects.create(relationship_id=self.r.id,
+                                      from_pk=from_obj.pk, to_pk=to_obj.pk)
+        connect(self.foo, self.bar)
+        connect(self.bar, self.foo)
+        connect(self.jaz, self.foo)
+        connect(self.baz, self.jaz)
+        self.r.rebuild_counters()
+        
+        assert self.r.collapse_connections(batch_size=1) == (1, 2)
+        assert sorted(self.r.connections.values_list('from_pk', 'to_pk')) == [
+            (self.foo.pk, self.bar.pk), (self.foo.pk, self.jaz.pk),
+            (self.jaz.pk, self.baz.pk)]
+        assert self.r.in_degree(self.foo) == 2
+        assert self.r.collapse_connections() == (0, 0)
+        
+        connect(self.bar, self.foo)
+        call_command('connections_collapse_symmetric', verbosity=0)
+        assert self.r.connections.count() == 3
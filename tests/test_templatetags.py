@@ -2,7 +2,7 @@ from django.contrib.auth.models import User
 from django.template import Template, Context
 from django.test import TestCase
 
-from connections.models import Connection, _relationship_registry as registry
+from connections.models import _relationship_registry as registry
 from connections.shortcuts import (define_relationship, get_relationship,
     create_connection)
 
@@ -13,7 +13,7 @@ def reset_registry(d):
 
 
 def reset_relationship(r):
-    Connection.objects.filter(relationship_name=get_relationship(r).name).delete()
+    get_relationship(r).connections.delete()
 
 
 class ConnectionTests(TestCase):
@@ -71,6 +71,21 @@ class ConnectionTests(TestCase):
             'foo': self.foo,
         }))
     
+    def test_connections_from_object_with_objects(self):
+        tpl = Template("""{% spaceless %}
+            {% load connections %}
+            {% connections_from_object 'user_follow' foo with_objects=True as connections %}
+            {% for c in connections %}{{ c.to_object.username }}, {% endfor %}
+        {% endspaceless %}""")
+        
+        create_connection(self.r, self.foo, self.bar)
+        create_connection(self.r, self.foo, self.jaz)
+        
+        with self.assertNumQueries(2):
+            assert 'bar, jaz,' == tpl.render(Context({
+                'foo': self.foo,
+            }))
+    
     def test_connections_to_object(self):
         tpl = """{%% spaceless %%}
             {%% load connections %%}
@@ -90,6 +105,21 @@ class ConnectionTests(TestCase):
             'foo': self.foo,
         }))
     
+    def test_connections_to_object_with_objects(self):
+        tpl = Template("""{% spaceless %}
+            {% load connections %}
+            {% connections_to_object 'user_follow' foo with_objects=True as connections %}
+            {% for c in connections %}{{ c.from_object.username }}, {% endfor %}
+        {% endspaceless %}""")
+        
+        create_connection(self.r, self.bar, self.foo)
+        create_connection(self.r, self.jaz, self.foo)
+        
+        with self.assertNumQueries(2):
+            assert 'bar, jaz,' == tpl.render(Context({
+                'foo': self.foo,
+            }))
+    
     def test_connection_exists(self):
         tpl = """{%% spaceless %%}
             {%% load connections %%}
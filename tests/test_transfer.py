@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from connections.models import (Connection, ConnectionCounter,
+    _relationship_registry as registry)
+from connections.shortcuts import define_relationship
+from connections.transfer import split_range
+
+
+def reset_registry(d):
+    for k in list(d.keys()):
+        d.pop(k)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        reset_registry(registry)
+        self.r = define_relationship('user_follow', User, User, counters=True)
+        self.m = define_relationship('group_member', User, Group)
+        self.foo = User.objects.create_user(username='foo')
+        self.bar = User.objects.create_user(username='bar')
+        self.jaz = User.objects.create_user(username='jaz')
+        self.group = Group.objects.create(name='group')
+        self.r.create_connections([(self.foo, self.bar), (self.foo, self.jaz),
+                                   (self.jaz, self.bar)])
+        self.r.connections.filter(from_pk=self.jaz.pk).update(weight=2.5)
+        self.m.create_connections([(self.foo, self.group)])
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        reset_registry(registry)
+    
+    def path(self, name, content=None):
+        path = os.path.join(self.dir, name)
+        if content is not None:
+            with open(path, 'w') as f:
+                f.write(content)
+        return path
+    
+    def rows(self):
+        return sorted(Connection.objects.values_list(
+            'relationship_id', 'from_pk', 'to_pk', 'weight', 'date'))
+    
+    def roundtrip(self, format):
+        path = self.path('connections.' + format)
+        before = self.rows()
+        call_command('connections_export', output=path, format=format, verbosity=0)
+        Connection.objects.all().delete()
+        ConnectionCounter.objects.all().delete()
+        call_command('connections_import', path, verbosity=0)
+        assert self.rows() == before
+        assert self.r.out_degree(self.foo) == 2
+        assert self.r.in_degree(self.bar) == 2
+    
+    def test_roundtrip_jsonl(self):
+        self.roundtrip('jsonl')
+    
+    def test_roundtrip_csv(self):
+        self.roundtrip('csv')
+    
+    def test_export_relationships(self):
+        out = StringIO()
+        call_command('connections_export', 'group_member', stdout=out, verbosity=0)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [(row['relationship'], row['from_pk'], row['to_pk']) for row in rows] == [
+            ('group_member', self.foo.pk, self.group.pk)]
+        self.assertRaises(CommandError, call_command, 'connections_export',
+                          'unknown', stdout=out)
+    
+    def test_import_skips_existing(self):
+        path = self.path('connections.csv', 'relationship,from_pk,to_pk\n'
+                         'user_follow,%d,%d\nuser_follow,%d,%d\nuser_follow,%d,%d\n' %
+                         (self.foo.pk, self.bar.pk, self.bar.pk, self.foo.pk,
+                          self.bar.pk, self.foo.pk))
+        out = StringIO()
+        call_command('connections_import', path, batch_size=1, stdout=out)
+        assert out.getvalue().strip() == 'Imported 1 connections'
+        assert self.r.connection_exists(self.bar, self.foo)
+        assert self.r.get_connection(self.bar, self.foo).weight == 1.0
+        assert self.r.out_degree(self.bar) == 1
+    
+    def test_import_workers(self):
+        path = self.path('connections.jsonl', '')
+        self.assertRaises(CommandError, call_command, 'connections_import',
+                          '-', workers=2, verbosity=0)
+        self.assertRaises(CommandError, call_command, 'connections_import',
+                          path, workers=2, verbosity=0)
+    
+    def test_import_unknown_relationship(self):
+        path = self.path('connections.jsonl', json.dumps(
+            {'relationship': 'unknown', 'from_pk': 1, 'to_pk': 2}))
+        self.assertRaises(CommandError, call_command, 'connections_import',
+                          path, verbosity=0)
+    
+    def test_import_malformed(self):
+        path = self.path('connections.jsonl', '{"relationship": "user_follow"}\n')
+        self.assertRaises(CommandError, call_command, 'connections_import',
+                          path, verbosity=0)
+    
+    def test_dry_run(self):
+        path = self.path('connections.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'relationship': 'user_follow', 'from_pk': self.bar.pk, 'to_pk': self.foo.pk},
+            {'relationship': 'group_member', 'from_pk': self.bar.pk, 'to_pk': self.foo.pk + 1000},
+            {'relationship': 'unknown', 'from_pk': self.bar.pk, 'to_pk': self.foo.pk},
+        ]))
+        count = Connection.objects.count()
+        err = StringIO()
+        with self.assertNumQueries(2):
+            self.assertRaises(CommandError, call_command, 'connections_import',
+                              path, dry_run=True, stderr=err)
+        assert err.getvalue().splitlines() == [
+            'line 3: unknown relationship "unknown"',
+            'line 2: auth.Group %d does not exist' % (self.foo.pk + 1000),
+        ]
+        assert Connection.objects.count() == count
+    
+    def test_split_range(self):
+        assert split_range(1, 10, 3) == [(1, 5), (5, 9), (9, 11)]
+        assert split_range(5, 5, 4) == [(5, 6)]
+        assert split_range(1, 2, 4) == [(1, 2), (2, 3)]